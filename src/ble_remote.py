@@ -1,61 +1,111 @@
 import asyncio
-import bluetooth
-import aioble
-import ujson
-from time import ticks_ms, ticks_diff, ticks_add
-from config import STROKE_MOTION_MARGIN_MS
+from time import ticks_ms, ticks_diff, ticks_add, ticks_us
+import profiler
+import boot_trace
+import clock_sync
+from config import STROKE_MOTION_MARGIN_MS, CLOCK_SYNC_MS
+
+try:
+    import ujson as json
+except ImportError:
+    import json
 
 # Standard OSSM BLE service
-_SERVICE_UUID = bluetooth.UUID("522b443a-4f53-534d-0001-420badbabe69")
-_COMMAND_UUID = bluetooth.UUID("522b443a-4f53-534d-1000-420badbabe69")
-_STATE_UUID   = bluetooth.UUID("522b443a-4f53-534d-2000-420badbabe69")
+_SERVICE_UUID = "522b443a-4f53-534d-0001-420badbabe69"
+_COMMAND_UUID = "522b443a-4f53-534d-1000-420badbabe69"
+_STATE_UUID   = "522b443a-4f53-534d-2000-420badbabe69"
 
 SCAN_DURATION_MS = 5000
+DIRECT_CONNECT_MS = 2000    # connect attempt to a remembered OSSM before scanning
 RECONNECT_DELAY_MS = 3000
 HOMING_TIMEOUT_MS = 30000
+HEARTBEAT_TIMEOUT_MS = 3000     # no state notification this long = link dead (OSSM sends 1/s)
+WATCHDOG_POLL_MS = 250          # how often the watchdog checks is_connected()
+SYNC_TIMEOUT_MS = 1000          # wait for a clock probe's echo
 
-class OSSMRemote:
-    def __init__(self, settings=None):
-        """
-        settings: dict of initial OSSM parameters, e.g.
-            {"speed": 50, "depth": 100, "stroke": 80}
-        Each key maps to a "set:<key>:<value>" command sent before "go:streaming".
-        """
-        self.connected = False
+
+class BLETransport:
+    """aioble central link to one OSSM peripheral (command + state characteristics).
+
+    Transports give OSSMRemote a uniform interface:
+      open(exclude)          find and connect to a device not in `exclude`
+      write(data, response)  write to the command characteristic
+      subscribe_state()      enable state notifications
+      state(timeout_ms)      wait for the next state notification (bytes)
+      subscribe_echo()       enable command echo notifications
+      echo(timeout_ms)       wait for the next command echo (bytes)
+      is_connected()
+      close()
+    and expose `address`, a hashable id of the connected device.
+
+    `last` is the (address type, address) of the last device opened, kept
+    after close() so it can be remembered across deep sleep.  `direct` is
+    True when the last open() reached the remembered device directly rather
+    than through a scan (transports without one may leave it out).
+    """
+
+    def __init__(self, direct=None):
+        """direct: (address type, address) of an OSSM to try before the first scan."""
+
+        import bluetooth
+        import aioble
+        self._aioble = aioble
+        self._service_uuid = bluetooth.UUID(_SERVICE_UUID)
+        self._command_uuid = bluetooth.UUID(_COMMAND_UUID)
+        self._state_uuid = bluetooth.UUID(_STATE_UUID)
         self._connection = None
         self._command_char = None
         self._state_char = None
-        self._settings = settings or {}
+        self.address = None
+        self.last = None
+        self.direct = False
+        self._direct = direct
 
-    async def find(self):
+    async def find(self, exclude=()):
         """Scan for an OSSM device advertising the standard service UUID."""
         print("BLE: scanning for OSSM...")
-        async with aioble.scan(
+        async with self._aioble.scan(
             SCAN_DURATION_MS, interval_us=30000, window_us=30000, active=True
         ) as scanner:
             async for result in scanner:
-                if _SERVICE_UUID in result.services():
+                if self._service_uuid in result.services():
+                    if bytes(result.device.addr) in exclude:
+                        continue
                     print(f"BLE: found OSSM at {result.device}")
                     return result.device
         return None
 
-    async def connect(self):
-        """Scan, connect, discover characteristic, and activate streaming mode."""
-        self.connected = False
+    async def open(self, exclude=()):
+        """Scan, connect, and discover characteristics.  Returns True on success."""
         self._connection = None
         self._command_char = None
         self._state_char = None
+        self.address = None
+        self.direct = False
 
-        device = await self.find()
-        if device is None:
-            print("BLE: no OSSM found")
-            return
+        device = None
+        direct = self._direct
+        self._direct = None
+        if direct is not None and direct[1] not in exclude:
+            device = self._aioble.Device(*direct)
+            print(f"BLE: connecting to last OSSM at {device}")
+            try:
+                self._connection = await device.connect(timeout_ms=DIRECT_CONNECT_MS)
+            except Exception as e:
+                print(f"BLE: direct connect failed: {e}")
+                device = None
+        via_direct = device is not None
 
-        try:
-            self._connection = await device.connect()
-        except Exception as e:
-            print(f"BLE: connect failed: {e}")
-            return
+        if device is None:
+            device = await self.find(exclude)
+            if device is None:
+                print("BLE: no OSSM found")
+                return False
+            try:
+                self._connection = await device.connect()
+            except Exception as e:
+                print(f"BLE: connect failed: {e}")
+                return False
 
         try:
             mtu = await self._connection.exchange_mtu(512)
@@ -64,47 +114,156 @@ class OSSMRemote:
             print(f"BLE: MTU exchange failed: {e}")
 
         try:
-            service = await self._connection.service(_SERVICE_UUID)
-            self._command_char = await service.characteristic(_COMMAND_UUID)
-            self._state_char = await service.characteristic(_STATE_UUID)
+            service = await self._connection.service(self._service_uuid)
+            self._command_char = await service.characteristic(self._command_uuid)
+            self._state_char = await service.characteristic(self._state_uuid)
         except Exception as e:
             print(f"BLE: service discovery failed: {e}")
-            await self._connection.disconnect()
-            self._connection = None
+            await self.close()
+            return False
+
+        self.address = bytes(device.addr)
+        self.last = (device.addr_type, self.address)
+        self.direct = via_direct
+        return True
+
+    async def write(self, data, response=False):
+        await self._command_char.write(data, response=response)
+
+    async def subscribe_state(self):
+        await self._state_char.subscribe(notify=True)
+
+    async def state(self, timeout_ms):
+        return await self._state_char.notified(timeout_ms=timeout_ms)
+
+    async def subscribe_echo(self):
+        await self._command_char.subscribe(notify=True)
+
+    async def echo(self, timeout_ms):
+        return await self._command_char.notified(timeout_ms=timeout_ms)
+
+    def is_connected(self):
+        return self._connection is not None and self._connection.is_connected()
+
+    async def close(self):
+        if self._connection is not None:
+            try:
+                await self._connection.disconnect()
+            except Exception:
+                pass
+        self._connection = None
+
+
+class OSSMRemote:
+    def __init__(self, settings=None, transport=None, name="BLE", claimed=None, resume=False,
+                 clock=None):
+        """
+        settings:  dict of initial OSSM parameters, e.g.
+                   {"speed": 50, "depth": 100, "stroke": 80}
+                   Each key maps to a "set:<key>:<value>" command sent before "go:streaming".
+        transport: link to the OSSM (default BLETransport)
+        name:      log prefix, to tell peers apart
+        claimed:   set of device addresses already driven by other remotes;
+                   shared between peers so each connects to a different OSSM
+        resume:    the first connection is back to an OSSM that was streaming
+                   before our deep sleep: if the transport reaches it directly,
+                   skip the initial settings and do not wait for the streaming
+                   state
+        clock:     clock_sync.ClockSync to keep in step with the OSSM's clock by
+                   probing it every CLOCK_SYNC_MS while streaming (None = off)
+        """
+        self.connected = False
+        self.name = name
+        self._transport = transport or BLETransport()
+        self._settings = settings or {}
+        self._claimed = claimed if claimed is not None else set()
+        self._resume = resume
+        self._down_ms = None       # ticks_ms() when the link was lost; None while up
+        self.clock = clock
+        self._sync_seq = 0
+        self._live = {}            # live settings not yet written: setting -> latest value
+        self._live_flag = asyncio.Event()
+        self.on_set = None         # called (setting, value, ticks_ms()) once a live setting is written
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.sent = 0              # stream commands written
+        self.settings_sent = 0     # live set: commands written
+        self.send_us_total = 0     # cumulative / worst write latency
+        self.send_us_max = 0
+        self.failures = 0          # connection attempts or sends that failed
+        self.connects = 0          # successful connections
+        self.trips = 0             # dead links found by the watchdog
+        self.detect_ms_max = 0     # worst time from last sign of life to detection
+        self.outage_ms_max = 0     # worst time from losing the link to streaming again
+        self.outage_ms_last = 0
+
+    async def connect(self):
+        """Connect, send initial settings, and activate streaming mode."""
+        self.connected = False
+        link = self._transport
+        resume = self._resume
+        self._resume = False
+        if not await link.open(self._claimed):
+            self.failures += 1
             return
+        # Only the remembered OSSM, reached directly, is still set up and
+        # streaming; a scan may have found another one (or a power-cycled one).
+        resume = resume and getattr(link, "direct", False)
 
-        for key, value in self._settings.items():
+        for key, value in ({} if resume else self._settings).items():
             try:
                 await self._send_command(f"set:{key}:{value}", response=True)
-                print(f"BLE: set {key}={value}")
+                print(f"{self.name}: set {key}={value}")
             except Exception as e:
-                print(f"BLE: failed to set {key}: {e}")
-                await self._connection.disconnect()
-                self._connection = None
+                print(f"{self.name}: failed to set {key}: {e}")
+                await self._abort()
                 return
 
         try:
             await self._send_command("go:streaming", response=True)
         except Exception as e:
-            print(f"BLE: failed to activate streaming: {e}")
-            await self._connection.disconnect()
-            self._connection = None
+            print(f"{self.name}: failed to activate streaming: {e}")
+            await self._abort()
             return
 
-        if not await self._wait_for_streaming():
-            await self._connection.disconnect()
-            self._connection = None
+        if not await (self._subscribe() if resume else self._wait_for_streaming()):
+            await self._abort()
             return
 
+        self._claimed.add(link.address)
         self.connected = True
-        print("BLE: connected, streaming mode active")
+        self.connects += 1
+        if self._down_ms is not None:
+            self.outage_ms_last = ticks_diff(ticks_ms(), self._down_ms)
+            self.outage_ms_max = max(self.outage_ms_max, self.outage_ms_last)
+            self._down_ms = None
+            print(f"{self.name}: outage {self.outage_ms_last} ms")
+        boot_trace.mark("connected")
+        print(f"{self.name}: connected, streaming mode active")
 
-    async def _wait_for_streaming(self):
-        """Subscribe to state notifications; block until OSSM reaches streaming state."""
+    async def _abort(self):
+        self.failures += 1
+        await self._transport.close()
+
+    @property
+    def last_device(self):
+        """(address type, address) of the last OSSM opened over BLE, or None."""
+        return getattr(self._transport, "last", None)
+
+    async def _subscribe(self):
         try:
-            await self._state_char.subscribe(notify=True)
+            await self._transport.subscribe_state()
+            if self.clock is not None:
+                await self._transport.subscribe_echo()
         except Exception as e:
-            print(f"BLE: state subscribe failed: {e}")
+            print(f"{self.name}: state subscribe failed: {e}")
+            return False
+        return True
+
+    async def _wait_for_streaming(self):
+        """Subscribe to state notifications; block until OSSM reaches streaming state."""
+        if not await self._subscribe():
             return False
 
         deadline = ticks_add(ticks_ms(), HOMING_TIMEOUT_MS)
@@ -113,27 +272,36 @@ class OSSMRemote:
             if remaining <= 0:
                 break
             try:
-                data = await self._state_char.notified(timeout_ms=remaining)
+                data = await self._transport.state(remaining)
             except asyncio.TimeoutError:
                 break
             except Exception as e:
-                print(f"BLE: state notify error: {e}")
+                print(f"{self.name}: state notify error: {e}")
                 return False
-            print(f"BLE: state notify ({len(data)}b): {data}")
+            print(f"{self.name}: state notify ({len(data)}b): {data}")
             try:
-                state = ujson.loads(data).get("state", "")
-                print(f"BLE: OSSM state: {state}")
+                state = json.loads(data).get("state", "")
+                print(f"{self.name}: OSSM state: {state}")
                 if "streaming" in state or "idle" in state:
                     return True
             except Exception as e:
-                print(f"BLE: JSON parse error: {e}")
+                print(f"{self.name}: JSON parse error: {e}")
 
-        print("BLE: timed out waiting for streaming state")
+        print(f"{self.name}: timed out waiting for streaming state")
         return False
 
+    def set_live(self, key, value):
+        """Write set:<key>:<value> while streaming, apart from the stream pacing.
+
+        Each setting has one slot: a value not yet written is replaced by a
+        newer one for the same setting, never dropped.
+        """
+        self._live[key] = value
+        self._live_flag.set()
+
     async def _send_command(self, cmd, response=False):
         """Write a command to the OSSM command characteristic."""
-        await self._command_char.write(cmd.encode(), response=response)
+        await self._transport.write(cmd.encode(), response=response)
 
     async def _send(self, position, interval_ms):
         """Write a single stream command."""
@@ -142,19 +310,141 @@ class OSSMRemote:
 
     async def run(self, queue):
         """
-        Main send loop.  Dequeues (position, interval_ms) tuples produced by
-        stroke_task and writes them to the OSSM.  Waits interval_ms +
-        STROKE_MOTION_MARGIN_MS after each send so the previous move completes
-        before the next command is consumed.  Returns when the connection is lost.
+        Stream to the OSSM until the link is lost.  The send loop runs next to
+        the live settings writer and a watchdog, which cancels it as soon as
+        the link is found dead, so a drop is noticed while the loop waits for
+        the queue or sleeps, not on the next failed send.
+        """
+        sender = asyncio.create_task(self._send_loop(queue))
+        watchdog = asyncio.create_task(self._watchdog(sender))
+        live = asyncio.create_task(self._live_loop(sender))
+        sync = asyncio.create_task(self._sync_loop()) if self.clock is not None else None
+        try:
+            await sender
+        except asyncio.CancelledError:
+            if self.connected:
+                raise               # cancelled from outside, not by the watchdog
+        finally:
+            watchdog.cancel()
+            live.cancel()
+            if sync is not None:
+                sync.cancel()
+            self.connected = False
+            if self._down_ms is None:
+                self._down_ms = ticks_ms()
+            self._claimed.discard(self._transport.address)
+            await self._transport.close()
+            print(f"{self.name}: disconnected")
+
+    async def _watchdog(self, sender):
+        """Cancel `sender` when the link drops or the OSSM's state heartbeat stops.
+
+        Any state notification counts as a sign of life.  Detection latency
+        is measured from the last one.
+        """
+        link = self._transport
+        last = ticks_ms()
+        while True:
+            remaining = HEARTBEAT_TIMEOUT_MS - ticks_diff(ticks_ms(), last)
+            reason = None
+            try:
+                await link.state(max(1, min(WATCHDOG_POLL_MS, remaining)))
+                last = ticks_ms()
+            except asyncio.TimeoutError:
+                if ticks_diff(ticks_ms(), last) >= HEARTBEAT_TIMEOUT_MS:
+                    reason = "heartbeat lost"
+            except Exception as e:
+                reason = f"state error: {e}"
+            if reason is None and not link.is_connected():
+                reason = "link down"
+            if reason is not None:
+                break
+        now = ticks_ms()
+        detect_ms = ticks_diff(now, last)
+        self.trips += 1
+        self.detect_ms_max = max(self.detect_ms_max, detect_ms)
+        self._down_ms = now
+        self.connected = False
+        print(f"{self.name}: watchdog: {reason} ({detect_ms} ms since last state)")
+        sender.cancel()
+
+    async def _live_loop(self, sender):
+        """Write live settings as set_live() fills their slots.
+
+        They do not wait behind stream commands and their motion sleeps.  A
+        failed write ends the connection like a failed stream send.
+        """
+        live = self._live
+        while True:
+            await self._live_flag.wait()
+            self._live_flag.clear()
+            while live:
+                key = next(iter(live))
+                value = live.pop(key)
+                try:
+                    await self._send_command(f"set:{key}:{value}")
+                except Exception as e:
+                    print(f"{self.name}: send failed: {e}")
+                    self.failures += 1
+                    self.connected = False
+                    sender.cancel()
+                    return
+                self.settings_sent += 1
+                print(f"{self.name}: set {key}={value}")
+                if self.on_set is not None:
+                    self.on_set(key, value, ticks_ms())
+
+    async def _sync_loop(self):
+        """Probe the OSSM's clock every CLOCK_SYNC_MS and log the mapping as a K-line.
+
+        Other echoes (of stream commands) are skipped while waiting.  A peer
+        that does not answer probes just leaves the clock unsynced.
+        """
+        link = self._transport
+        clock = self.clock
+        while True:
+            self._sync_seq = seq = (self._sync_seq + 1) & 0xFFFF
+            t_send = clock.now()
+            try:
+                await self._send_command(clock_sync.probe(seq))
+                while True:
+                    remaining = SYNC_TIMEOUT_MS - (clock.now() - t_send)
+                    if remaining <= 0:
+                        break
+                    t_remote = clock_sync.parse_reply(await link.echo(remaining), seq)
+                    if t_remote is not None:
+                        clock.add(t_send, t_remote, clock.now())
+                        print(clock.trace(self.name))
+                        break
+            except asyncio.TimeoutError:
+                pass
+            except Exception:
+                return              # link trouble is the watchdog's business
+            await asyncio.sleep_ms(CLOCK_SYNC_MS)
+
+    async def _send_loop(self, queue):
+        """
+        Dequeues (position, interval_ms) tuples produced by stroke_task and
+        writes them to the OSSM.  Waits interval_ms + STROKE_MOTION_MARGIN_MS
+        after each send so the previous move completes before the next
+        command is consumed.  Returns when a send fails.
         """
         while self.connected:
             pos, interval_ms = await queue.get()
+            t = ticks_us()
             try:
                 await self._send(pos, interval_ms)
-                print(f"BLE: stream {pos} interval={interval_ms}")
+                dt = ticks_diff(ticks_us(), t)
+                profiler.add("ble_send", t)
+                self.sent += 1
+                boot_trace.mark("first_stream")
+                self.send_us_total += dt
+                if dt > self.send_us_max:
+                    self.send_us_max = dt
+                print(f"{self.name}: stream {pos} interval={interval_ms}")
             except Exception as e:
-                print(f"BLE: send failed: {e}")
+                print(f"{self.name}: send failed: {e}")
+                self.failures += 1
                 self.connected = False
                 break
             await asyncio.sleep_ms(interval_ms + STROKE_MOTION_MARGIN_MS)
-        print("BLE: disconnected")
@@ -0,0 +1,26 @@
+"""boot_trace.py - Startup milestones, for measuring wake-to-stream latency.
+
+ticks_ms() restarts near zero at every reset, and a deep-sleep wake is a
+reset, so the tick at which a milestone is reached is its time since wake
+(give or take the bootloader, which runs before the tick counter starts).
+Only the first occurrence of each milestone is kept, so mark() can sit on a
+hot path.
+"""
+
+from time import ticks_ms
+
+_marks = []     # (name, ms since reset) in the order reached
+
+
+def mark(name):
+    """Record `name` the first time it is reached."""
+    for n, _ in _marks:
+        if n == name:
+            return
+    t = ticks_ms()
+    _marks.append((name, t))
+    print("Boot: {} at {} ms".format(name, t))
+
+
+def report():
+    print("Boot trace:", "  ".join("{} {} ms".format(n, t) for n, t in _marks))
@@ -0,0 +1,138 @@
+"""cal_profiles.py - Named calibration profiles in a compact binary file.
+
+Each profile holds the per-sensor offsets, scales, noise sigma and active
+thresholds produced by TouchAnalyzer calibration.  Several covers/sheaths can
+each keep their own profile; at boot the profile whose baseline best matches a
+few idle frames is selected automatically.
+
+File layout (little-endian):
+  header:  magic b'TCP1', num_pins (B), count (B), reserved (H)
+  profile: name (16s, UTF-8, see profile_name()), offsets (num_pins x I), scales (num_pins x I),
+           noise (num_pins x f), thresholds (num_pins x f)
+A noise vector of all zeros means "not measured".
+"""
+
+import struct
+
+PROFILE_FILE = '/calprofiles.bin'
+DEFAULT_PROFILE = 'default'
+
+_MAGIC = b'TCP1'
+_HEADER = '<4sBBH'
+_NAME_LEN = 16
+
+
+def _record_format(n):
+    return '<{}s{}I{}I{}f{}f'.format(_NAME_LEN, n, n, n, n)
+
+
+def profile_size(n):
+    return struct.calcsize(_record_format(n))
+
+
+def profile_name(name):
+    """`name` as stored: at most _NAME_LEN bytes of UTF-8, cut between characters."""
+    data = name.encode()
+    if len(data) <= _NAME_LEN:
+        return name
+    cut = _NAME_LEN
+    while cut and data[cut] & 0xC0 == 0x80:     # continuation byte: back up
+        cut -= 1
+    return data[:cut].decode()
+
+
+def pack_profile(n, buf, off, name, profile):
+    """Pack one (offsets, scales, noise, thresholds) record at buf[off:]."""
+    offsets, scales, noise, thresholds = profile
+    values = list(offsets) + list(scales) + list(noise or [0.0] * n) + list(thresholds)
+    struct.pack_into(_record_format(n), buf, off, profile_name(name).encode(), *values)
+
+
+def unpack_profile(n, data, off=0):
+    """Inverse of pack_profile: returns (name, (offsets, scales, noise, thresholds))."""
+    v = struct.unpack_from(_record_format(n), data, off)
+    name = v[0].rstrip(b'\0').decode()
+    noise = list(v[1 + 2 * n:1 + 3 * n])
+    return name, (
+        list(v[1:1 + n]),
+        list(v[1 + n:1 + 2 * n]),
+        noise if any(noise) else None,
+        list(v[1 + 3 * n:1 + 4 * n]),
+    )
+
+
+class ProfileStore:
+    """In-memory view of PROFILE_FILE: name -> (offsets, scales, noise, thresholds)."""
+
+    def __init__(self, num_pins, path=None):
+        self._n = num_pins
+        self._path = path or PROFILE_FILE   # looked up late so host tools can redirect it
+        self._profiles = {}
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self._path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return
+        n = self._n
+        hsize = struct.calcsize(_HEADER)
+        if len(data) < hsize:
+            return
+        magic, num_pins, count, _ = struct.unpack_from(_HEADER, data, 0)
+        if magic != _MAGIC or num_pins != n:
+            print("Calibration profiles: unrecognized file; ignored.")
+            return
+        rsize = profile_size(n)
+        if len(data) < hsize + count * rsize:
+            print("Calibration profiles: truncated file; ignored.")
+            return
+        for k in range(count):
+            name, profile = unpack_profile(n, data, hsize + k * rsize)
+            self._profiles[name] = profile
+
+    def save(self):
+        n = self._n
+        rsize = profile_size(n)
+        buf = bytearray(struct.calcsize(_HEADER) + len(self._profiles) * rsize)
+        struct.pack_into(_HEADER, buf, 0, _MAGIC, n, len(self._profiles), 0)
+        pos = struct.calcsize(_HEADER)
+        for name, profile in self._profiles.items():
+            pack_profile(n, buf, pos, name, profile)
+            pos += rsize
+        with open(self._path, 'wb') as f:
+            f.write(buf)
+
+    def names(self):
+        return list(self._profiles)
+
+    def get(self, name):
+        return self._profiles.get(profile_name(name))
+
+    def put(self, name, offsets, scales, noise, thresholds):
+        name = profile_name(name)
+        if len(self._profiles) >= 255 and name not in self._profiles:
+            raise ValueError("too many calibration profiles")
+        self._profiles[name] = (
+            [int(v) for v in offsets], [int(v) for v in scales],
+            list(noise) if noise else None, [float(v) for v in thresholds])
+
+    def remove(self, name):
+        self._profiles.pop(profile_name(name), None)
+
+    def closest(self, idle_raw):
+        """Return the profile name whose baseline best matches an idle frame.
+
+        Distance is the sum over sensors of |idle - offset| / scale, i.e. how far
+        (in units of each sensor's touch range) the device reads from rest.
+        """
+        best = None
+        best_d = None
+        for name, (offsets, scales, _, _) in self._profiles.items():
+            d = 0.0
+            for i in range(self._n):
+                d += abs(idle_raw[i] - offsets[i]) / (scales[i] or 1)
+            if best_d is None or d < best_d:
+                best, best_d = name, d
+        return best
@@ -0,0 +1,115 @@
+"""clock_sync.py - Offset and drift of a peer's clock, from timestamp probes.
+
+A probe is one round trip: we note our time t_send, the peer stamps its own
+time t_remote when the probe arrives, and we note t_recv when the reply is
+back.  If the two legs take equally long the peer's clock read t_remote at
+our (t_send + t_recv) / 2, so that sample's offset is accurate to +- half
+its round-trip time.  The estimate is anchored on the sample with the
+shortest round trip among the last `window`; the drift is the least-squares
+slope of the offsets of the samples whose round trip is close to that
+shortest one, so a delayed reply does not bend it.
+
+Over the OSSM command/echo path the probe is the command "sync:<seq>", and a
+peer that supports it (test/ossm_ble_sim.py) echoes "sync:<seq>:<its ms>".
+Local times are ms since `origin` (the device passes the origin of its
+STROKE_LOG and telemetry timestamps), so trace() lines
+  K,<name>,<t_ms>,<remote_ms>,<rtt_ms>,<drift_ppm>
+map device log times onto the peer's log; see tools/latency_join.py.
+"""
+
+from time import ticks_ms, ticks_diff
+
+SYNC_WINDOW = 16        # probes kept for the estimate (at least; see window_for())
+RTT_SLACK_MS = 4        # samples within this of the shortest round trip fit the drift
+MIN_SPAN_MS = 10_000    # local time the drift fit must span before it is used
+
+
+def probe(seq):
+    """Probe command for sequence number `seq`."""
+    return "sync:{}".format(seq)
+
+
+def parse_reply(data, seq):
+    """Peer time (ms) from an echo answering probe `seq`, or None for any other echo."""
+    try:
+        parts = bytes(data).decode().split(":")
+        if len(parts) == 3 and parts[0] == "sync" and int(parts[1]) == seq:
+            return int(parts[2])
+    except (ValueError, UnicodeError):
+        pass
+    return None
+
+
+def window_for(period_ms, window=SYNC_WINDOW):
+    """Probes to keep when probing every `period_ms`.
+
+    The drift is only fitted once the kept samples span MIN_SPAN_MS, so a
+    fixed window of `window` probes would never fit it for periods below
+    MIN_SPAN_MS / (window - 1); the window grows to cover the span instead.
+    Probes are at least `period_ms` apart (the wait follows the round trip).
+    """
+    if period_ms <= 0:
+        return window
+    return max(window, -(-MIN_SPAN_MS // period_ms) + 2)
+
+
+class ClockSync:
+    def __init__(self, origin=None, window=SYNC_WINDOW, period_ms=0):
+        """`period_ms` is the probe period; with it the window is window_for(period_ms, window)."""
+        self._origin = ticks_ms() if origin is None else origin
+        self._window = window_for(period_ms, window)
+        self._samples = []      # (local midpoint, offset, rtt), oldest first
+        self._anchor = 0        # local time at which `offset` holds
+        self.offset = None      # remote - local at the anchor; None until synced
+        self.drift = 0.0        # remote ms gained per local ms
+        self.rtt_ms = None      # round trip of the anchor sample
+        self.probes = 0         # samples added
+
+    def now(self):
+        """Local time, ms since the origin."""
+        return ticks_diff(ticks_ms(), self._origin)
+
+    @property
+    def synced(self):
+        return self.offset is not None
+
+    def add(self, t_send, t_remote, t_recv):
+        """Add one probe (local times from now()); returns its round trip in ms."""
+        rtt = t_recv - t_send
+        mid = (t_send + t_recv) / 2
+        samples = self._samples
+        samples.append((mid, t_remote - mid, rtt))
+        if len(samples) > self._window:
+            samples.pop(0)
+        self.probes += 1
+        best = samples[0]
+        for s in samples:
+            if s[2] <= best[2]:
+                best = s
+        self._anchor, self.offset, self.rtt_ms = best
+        self._fit_drift(best[2])
+        return rtt
+
+    def _fit_drift(self, rtt_min):
+        good = [s for s in self._samples if s[2] <= rtt_min + RTT_SLACK_MS]
+        if len(good) < 2 or good[-1][0] - good[0][0] < MIN_SPAN_MS:
+            return
+        n = len(good)
+        mx = sum(s[0] for s in good) / n
+        my = sum(s[1] for s in good) / n
+        var = sum((s[0] - mx) ** 2 for s in good)
+        self.drift = sum((s[0] - mx) * (s[1] - my) for s in good) / var
+
+    def to_remote(self, t):
+        """Peer time at local time t (ms since the origin)."""
+        return t + self.offset + self.drift * (t - self._anchor)
+
+    def to_local(self, r):
+        """Local time (ms since the origin) at peer time r."""
+        return (r - self.offset + self.drift * self._anchor) / (1 + self.drift)
+
+    def trace(self, name):
+        """K-line for the log: the current mapping at the current local time."""
+        t = self.now()
+        return "K,{},{},{},{},{:.1f}".format(
+            name, t, round(self.to_remote(t)), self.rtt_ms, self.drift * 1e6)
@@ -5,10 +5,50 @@ from machine import Pin
 BLE_SPEED = 100
 BLE_DEPTH = 100 
 BLE_STROKE = 100     # Scale 1:1 for 160mm typical OSSM stroke length
+BLE_PEERS = 1           # number of OSSMs driven at once from the same input (see ossm_fleet.py)
+BLE_PEER_SETTINGS = None  # optional list of per-peer settings dicts overriding the three above
+TELEMETRY = False       # advertise the live telemetry service (see telemetry.py)
+CLOCK_SYNC_MS = 0       # probe each OSSM's clock this often and log K-lines (see clock_sync.py); 0 = off
+                        # drift needs 10 s of probes: short periods keep more (clock_sync.window_for)
+
+# On-device session recorder (see recorder.py, tools/rec_export.py)
+RECORD = False           # log frames and emits to a ring of flash segments
+RECORD_DECIMATION = 1    # record every Nth sensor frame
+RECORD_MAX_BPS = 2048    # average flash write budget; records beyond it are dropped
+
+# Host offload (see serial_offload.py, tools/host_bridge.py)
+OFFLOAD = False         # only stream raw frames over USB serial; the host does the rest
+OFFLOAD_PERIOD_MS = 20  # frame period while offloading
 
 # Power management
 WAKEUP_PIN = 21          # RTC-capable GPIO for EXT0 deep-sleep wakeup (active-low button)
 SLEEP_TIMEOUT_MS = 30_000  # idle time before deep sleep (ms)
+WAKE_ON_TOUCH = False      # also wake from deep sleep when the device is picked up
+WAKE_TOUCH_SENSOR = 0      # electrode (index) that wakes; the S3 wakes on a single pad
+WAKE_TOUCH_LEVEL = 0.3     # wake threshold, as a fraction of that electrode's calibrated range
+
+# Startup
+CALIBRATE_AT_BOOT = False  # ask to calibrate at boot when uncalibrated (blocks on input())
+
+# Adaptive scan rate (see scan_scheduler.py)
+SCAN_ACTIVE_MS         = 100              # wait between frames while touched
+SCAN_IDLE_MS           = 500              # wait between frames while idle
+SCAN_IDLE_AFTER        = 10               # inactive frames before dropping to idle rate
+SCAN_IDLE_CHANNELS     = (0, 2, 4, 6, 8)  # idle frames alternate these and the rest
+SCAN_LIGHTSLEEP        = False            # light-sleep between idle frames when BLE is quiet
+SCAN_LIGHTSLEEP_MIN_MS = 50               # shorter waits use asyncio.sleep_ms instead
+SCAN_ROI               = False            # at full rate, scan only electrodes near the edge/center
+SCAN_ROI_SWEEP         = 1                # far electrodes refreshed per ROI frame (round-robin)
+
+# Dedicated sampling thread (see touch_sensor.ThreadedSampler)
+SAMPLER_THREAD    = False  # scan on a _thread worker instead of in the asyncio loop
+SAMPLER_PERIOD_MS = 20     # worker scan period
+
+# Per-channel prefilter ahead of the metrics (see touch_analysis.ChannelFilter)
+PREFILTER            = None   # None, "median" (spike removal) or "iir" (low-pass)
+PREFILTER_WINDOW     = 3      # median window, frames
+PREFILTER_SHIFT      = 1      # iir: y += (x - y) >> shift
+PREFILTER_HYSTERESIS = 0.0    # extra fraction above threshold to turn a channel on (0 = off)
 
 # Stroke detection (see stroke_detector.py)
 STROKE_EMA_ALPHA         = 0.25  # smoothing factor (lower = smoother, more lag)
@@ -21,6 +61,15 @@ STROKE_MIN_MOVE_MS       = 300   # floor for stream interval_ms sent to OSSM
 STROKE_INITIAL_MOVE_MS   = 2000  # interval_ms for the first emit after connect (gentle start)
 STROKE_MOTION_MARGIN_MS  = 50    # extra wait after interval_ms before consuming next queue item
 STROKE_LOG               = False # print CSV lines for plotting (t_ms,raw,ema,emit)
+STROKE_SIGNAL            = "insertion"  # analyze() key fed to the detector; "depth" is smoother
+
+# Live OSSM settings from other signals (see stroke_detector.SignalBank).
+# Each entry: (analyze() key, OSSM setting, value at 0, value at 1), e.g.
+#   SIGNAL_MAP = (("center", "depth", 30, 100), ("focus", "stroke", 40, 100))
+SIGNAL_MAP         = ()    # empty = off
+SIGNAL_EMA_ALPHA   = 0.2   # smoothing per signal
+SIGNAL_DEADBAND    = 5     # min change (setting units) worth a set: write
+SIGNAL_MIN_MS      = 1000  # min time between set: writes for one setting
 
 def set_global_exception():
     def handle_exception(loop, context):
@@ -0,0 +1,216 @@
+"""frame_codec.py - Compact binary records for streaming and capturing sensor data.
+
+Shared by the device (telemetry, serial offload, session recorder) and the
+desktop tools that decode them.  Pure `struct`, no allocation on the encode
+path: records are packed straight into a caller-provided bytearray.
+
+Every record starts with a 5-byte header: type (B), t_ms (I, little-endian).
+Payloads, for n sensors:
+  REC_RAW      n x H   raw TouchPad values (saturated at 65535)
+  REC_NORM     n x B   normalized values scaled to 0-255
+  REC_METRICS  4 x B   insertion, focus, center (0-255), active sensor count
+  REC_EMIT     B H     position (0-100), interval_ms
+  REC_STROKE   B H b   detector sample: raw insertion (0-100), EMA x 100,
+                       emitted position or -1 (same fields as STROKE_LOG lines)
+
+A capture file/stream is CAPTURE_MAGIC, one byte n, then records back to back.
+
+Over a byte stream with no message boundaries (USB serial), each record is
+wrapped in a packet:
+  PACKET_SYNC (A5 5A), seq (H), length (B), record, checksum (B)
+seq counts packets modulo 65536 so the receiver can count lost ones; the
+checksum is the low byte of the sum of seq, length and record bytes.  The
+receiver resynchronizes on the next sync pattern after any corrupt or
+foreign bytes (e.g. a stray print on the same port).
+"""
+
+import struct
+
+REC_RAW     = 1
+REC_NORM    = 2
+REC_METRICS = 3
+REC_EMIT    = 4
+REC_STROKE  = 5
+
+CAPTURE_MAGIC = b'TDC1'
+
+_HEADER = '<BI'
+HEADER_SIZE = 5
+
+PACKET_SYNC = b'\xa5\x5a'
+PACKET_HEADER = 5           # sync, seq, length; the record follows
+PACKET_OVERHEAD = 6         # header + checksum
+
+_FIXED = {
+    REC_METRICS: '<BBBB',
+    REC_EMIT:    '<BH',
+    REC_STROKE:  '<BHb',
+}
+
+
+def record_size(rtype, n):
+    """Total size in bytes (header included) of a record of `rtype` for n sensors."""
+    if rtype == REC_RAW:
+        return HEADER_SIZE + 2 * n
+    if rtype == REC_NORM:
+        return HEADER_SIZE + n
+    return HEADER_SIZE + struct.calcsize(_FIXED[rtype])
+
+
+def _u8(v):
+    v = int(v * 255)
+    return 0 if v < 0 else 255 if v > 255 else v
+
+
+def pack_raw(buf, off, t_ms, values):
+    struct.pack_into(_HEADER, buf, off, REC_RAW, t_ms & 0xFFFFFFFF)
+    off += HEADER_SIZE
+    for v in values:
+        struct.pack_into('<H', buf, off, v if v < 65535 else 65535)
+        off += 2
+    return off
+
+
+def pack_norm(buf, off, t_ms, normalized):
+    struct.pack_into(_HEADER, buf, off, REC_NORM, t_ms & 0xFFFFFFFF)
+    off += HEADER_SIZE
+    for v in normalized:
+        buf[off] = _u8(v)
+        off += 1
+    return off
+
+
+def pack_metrics(buf, off, t_ms, insertion, focus, center, active):
+    struct.pack_into('<BIBBBB', buf, off, REC_METRICS, t_ms & 0xFFFFFFFF,
+                     _u8(insertion), _u8(focus), _u8(center), active)
+    return off + HEADER_SIZE + 4
+
+
+def pack_emit(buf, off, t_ms, pos, interval_ms):
+    struct.pack_into('<BIBH', buf, off, REC_EMIT, t_ms & 0xFFFFFFFF, pos, interval_ms)
+    return off + HEADER_SIZE + 3
+
+
+def pack_stroke(buf, off, t_ms, raw, ema, emit_pos):
+    struct.pack_into('<BIBHb', buf, off, REC_STROKE, t_ms & 0xFFFFFFFF,
+                     raw, int(ema * 100), emit_pos)
+    return off + HEADER_SIZE + 4
+
+
+def unpack(data, n, off=0):
+    """Decode back-to-back records from `data` starting at `off`.
+
+    Yields (rtype, t_ms, fields).  Decoding stops at the first incomplete
+    record; unknown record types raise ValueError.  Normalized and metric
+    fields are returned as floats in [0, 1], EMA as a float in 0-100.
+    """
+    end = len(data)
+    while off + HEADER_SIZE <= end:
+        rtype, t_ms = struct.unpack_from(_HEADER, data, off)
+        if rtype not in (REC_RAW, REC_NORM, REC_METRICS, REC_EMIT, REC_STROKE):
+            raise ValueError("unknown record type {} at offset {}".format(rtype, off))
+        size = record_size(rtype, n)
+        if off + size > end:
+            return
+        body = off + HEADER_SIZE
+        if rtype == REC_RAW:
+            fields = struct.unpack_from('<{}H'.format(n), data, body)
+        elif rtype == REC_NORM:
+            fields = tuple(b / 255 for b in data[body:body + n])
+        elif rtype == REC_METRICS:
+            i, f, c, active = struct.unpack_from(_FIXED[rtype], data, body)
+            fields = (i / 255, f / 255, c / 255, active)
+        elif rtype == REC_STROKE:
+            raw, ema, emit = struct.unpack_from(_FIXED[rtype], data, body)
+            fields = (raw, ema / 100, emit)
+        else:
+            fields = struct.unpack_from(_FIXED[rtype], data, body)
+        yield rtype, t_ms, fields
+        off += size
+
+
+def capture_header(n):
+    return CAPTURE_MAGIC + bytes((n,))
+
+
+def read_capture(data):
+    """Parse a whole capture (bytes) -> (n, list of decoded records)."""
+    if data[:4] != CAPTURE_MAGIC:
+        raise ValueError("not a capture file")
+    n = data[4]
+    return n, list(unpack(data, n, 5))
+
+
+def _checksum(buf, start, end):
+    total = 0
+    for i in range(start, end):
+        total += buf[i]
+    return total & 0xFF
+
+
+def pack_packet(buf, seq, length):
+    """Wrap the record already packed at buf[PACKET_HEADER:PACKET_HEADER + length].
+
+    Returns the total packet size.
+    """
+    buf[0] = 0xA5
+    buf[1] = 0x5A
+    struct.pack_into('<HB', buf, 2, seq & 0xFFFF, length)
+    end = PACKET_HEADER + length
+    buf[end] = _checksum(buf, 2, end)
+    return end + 1
+
+
+class PacketReader:
+    """Reassembles packets from arbitrary chunks of a byte stream.
+
+    feed() yields (seq, record bytes) for every complete, valid packet.
+    Counters: packets, lost (sequence gaps), bad (checksum failures),
+    skipped (bytes discarded while searching for a sync pattern) and
+    restarts.  A packet with seq 0 is taken as a sender restart, not a gap,
+    unless it follows seq 0xFFFF: that is the normal wrap.
+    """
+
+    def __init__(self):
+        self._buf = bytearray()
+        self._seq = None
+        self.packets = 0
+        self.lost = 0
+        self.bad = 0
+        self.skipped = 0
+        self.restarts = 0
+
+    def feed(self, data):
+        buf = self._buf
+        buf.extend(data)
+        while True:
+            start = buf.find(PACKET_SYNC)
+            if start < 0:
+                # Keep a trailing first sync byte; it may complete next time.
+                keep = 1 if buf and buf[-1] == 0xA5 else 0
+                self.skipped += len(buf) - keep
+                del buf[:len(buf) - keep]
+                return
+            if start:
+                self.skipped += start
+                del buf[:start]
+            if len(buf) < PACKET_HEADER:
+                return
+            seq, length = struct.unpack_from('<HB', buf, 2)
+            end = PACKET_HEADER + length
+            if len(buf) <= end:
+                return
+            if buf[end] != _checksum(buf, 2, end):
+                self.bad += 1
+                del buf[:1]         # resync from the next sync pattern
+                continue
+            record = bytes(buf[PACKET_HEADER:end])
+            del buf[:end + 1]
+            if self._seq is not None:
+                if seq == 0 and self._seq != 0xFFFF:
+                    self.restarts += 1
+                else:
+                    self.lost += (seq - self._seq - 1) & 0xFFFF
+            self._seq = seq
+            self.packets += 1
+            yield seq, record
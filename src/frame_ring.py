@@ -0,0 +1,61 @@
+"""frame_ring.py - Preallocated single-producer/single-consumer frame ring.
+
+Each slot holds a timestamp and a fixed number of integer values.  The
+producer only ever writes `_head` and the consumer only ever writes `_tail`,
+and each publishes its index after the slot data, so one thread may push
+while another pops without a lock.  Nothing is allocated after __init__.
+One slot is kept empty to tell "full" from "empty".
+"""
+
+from array import array
+
+
+class FrameRing:
+    def __init__(self, num_values, capacity=16):
+        self._n = num_values
+        self._cap = capacity
+        self._stamps = array('l', [0] * capacity)
+        self._values = array('l', [0] * (capacity * num_values))
+        self._head = 0          # next slot to write (producer only)
+        self._tail = 0          # next slot to read (consumer only)
+        self.overruns = 0       # frames dropped because the ring was full (producer only)
+
+    def push(self, stamp, values):
+        """Producer: copy one frame in.  Returns False (and counts an overrun) if full."""
+        head = self._head
+        nxt = head + 1
+        if nxt == self._cap:
+            nxt = 0
+        if nxt == self._tail:
+            self.overruns += 1
+            return False
+        n = self._n
+        base = head * n
+        buf = self._values
+        for i in range(n):
+            buf[base + i] = values[i]
+        self._stamps[head] = stamp
+        self._head = nxt        # publish
+        return True
+
+    def pop(self, out):
+        """Consumer: copy the oldest frame into `out`; returns its stamp or None if empty."""
+        tail = self._tail
+        if tail == self._head:
+            return None
+        n = self._n
+        base = tail * n
+        buf = self._values
+        for i in range(n):
+            out[i] = buf[base + i]
+        stamp = self._stamps[tail]
+        tail += 1
+        self._tail = 0 if tail == self._cap else tail   # release
+        return stamp
+
+    def __len__(self):
+        return (self._head - self._tail) % self._cap
+
+    @property
+    def capacity(self):
+        return self._cap - 1
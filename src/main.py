@@ -1,56 +1,141 @@
+import boot_trace
+boot_trace.mark("main")
 import asyncio, machine, esp32
 from machine import Pin
-from time import ticks_ms, ticks_diff
-import touch_sensor, touch_analysis
+from time import ticks_ms, ticks_diff, ticks_us
+import touch_sensor, touch_analysis, profiler, rtc_state
 from config import (
-    WAKEUP_PIN, SLEEP_TIMEOUT_MS, BLE_SPEED, BLE_DEPTH, BLE_STROKE,
+    WAKEUP_PIN, SLEEP_TIMEOUT_MS, WAKE_ON_TOUCH, WAKE_TOUCH_SENSOR, WAKE_TOUCH_LEVEL,
+    CALIBRATE_AT_BOOT, BLE_SPEED, BLE_DEPTH, BLE_STROKE,
+    BLE_PEERS, BLE_PEER_SETTINGS, TELEMETRY, CLOCK_SYNC_MS, OFFLOAD, OFFLOAD_PERIOD_MS,
+    RECORD, RECORD_DECIMATION, RECORD_MAX_BPS,
     STROKE_EMA_ALPHA, STROKE_MIN_AMPLITUDE,
     STROKE_STOPPED_WINDOW, STROKE_STOPPED_THRESHOLD,
     STROKE_PEAK_HISTORY, STROKE_POLL_MS, STROKE_MIN_MOVE_MS, STROKE_INITIAL_MOVE_MS,
-    STROKE_LOG,
+    STROKE_LOG, STROKE_SIGNAL, SCAN_LIGHTSLEEP, SCAN_ROI, SAMPLER_THREAD, SAMPLER_PERIOD_MS,
+    SIGNAL_MAP, SIGNAL_EMA_ALPHA, SIGNAL_DEADBAND, SIGNAL_MIN_MS,
+    PREFILTER, PREFILTER_WINDOW, PREFILTER_SHIFT, PREFILTER_HYSTERESIS,
 )
 from touch_analysis import ACTIVE_THRESHOLD
-from ble_remote import OSSMRemote, RECONNECT_DELAY_MS
-from stroke_detector import StrokeDetector
+from stroke_detector import StrokeDetector, SignalBank
+from scan_scheduler import ScanScheduler
 from queue import Queue, QueueFull
 
 # IO21: RTC pin, internal pull-up; button shorts to GND to wake from deep sleep.
 # hold=True ensures that pull-up is maintained in deep-sleep.
 _wakeup_pin = Pin(WAKEUP_PIN, Pin.IN, Pin.PULL_UP, hold=True)
 
-# Log wakeup reason once on boot.
+# Log wakeup reason once on boot.  A deep-sleep wake resumes from the state
+# _save_state() left in RTC memory.
 _reset_cause = machine.reset_cause()
-if _reset_cause == machine.DEEPSLEEP_RESET:
-    print("Woke from deep sleep (button press).")
+_resume = rtc_state.woke_from_deepsleep()
+if _resume:
+    touched = machine.wake_reason() == machine.TOUCHPAD_WAKE
+    print("Woke from deep sleep ({}).".format("touch" if touched else "button press"))
 else:
     print(f"Cold boot (reset cause {_reset_cause}).")
 
-s = touch_sensor.MultiTouchSensor()
-a = touch_analysis.TouchAnalyzer(s)
+_touch = s = touch_sensor.MultiTouchSensor()
+if SAMPLER_THREAD:
+    s = touch_sensor.ThreadedSampler(s, SAMPLER_PERIOD_MS)
+_prefilter = touch_analysis.ChannelFilter(s.num_pins, PREFILTER, PREFILTER_WINDOW,
+                                          PREFILTER_SHIFT) if PREFILTER else None
+# After a deep-sleep wake the calibration cached in RTC memory is used as is.
+a = touch_analysis.TouchAnalyzer(s, prefilter=_prefilter, hysteresis=PREFILTER_HYSTERESIS,
+                                 resume=_resume)
+boot_trace.mark("calibration")
+if SAMPLER_THREAD:
+    s.start()
+# The threaded sampler reads every channel, so there is no region to narrow.
+_scan = ScanScheduler(s.num_pins, roi=SCAN_ROI and not SAMPLER_THREAD)
+
+# BLE (telemetry and the OSSM fleet) is brought up by ble_task after the first
+# frame, so importing bluetooth/aioble does not delay touch sampling.
+_telemetry = None
+_fleet = None
+_first_frame = asyncio.Event()
+
+if RECORD and not OFFLOAD:
+    from recorder import Recorder
+    _recorder = Recorder(s.num_pins, decimation=RECORD_DECIMATION, max_bps=RECORD_MAX_BPS)
+else:
+    _recorder = None
 
 # Shared state: run_output writes here; ble_task reads from it.
 _last_analyzed = {}
 
-if not a._calibrated:
-    yn = input("Do you want to calibrate now (y/n)?")
-    if yn.lower() in ("y", "yes"):
-        asyncio.run(a.calibrate())
+# In OFFLOAD mode the host owns calibration and the serial port carries frames.
+if not a._calibrated and not OFFLOAD:
+    if CALIBRATE_AT_BOOT:
+        yn = input("Do you want to calibrate now (y/n)?")
+        if yn.lower() in ("y", "yes"):
+            asyncio.run(a.auto_calibrate())
+    else:
+        print("Not calibrated: run autocalibrate() from the REPL.")
 
 # Shared idle-tracking state.
 _last_active_ms = ticks_ms()
+# Origin for STROKE_LOG and telemetry timestamps.
+_t0 = ticks_ms()
+
+def recalibrate(profile=None):
+    asyncio.run(a.calibrate(profile=profile))
+
+def autocalibrate(profile=None):
+    """Prompt-free calibration; rest and handling phases are detected automatically."""
+    asyncio.run(a.auto_calibrate(profile=profile))
 
-def recalibrate():
-    asyncio.run(a.calibrate())
+def profiles():
+    """List stored calibration profiles (active one marked with *)."""
+    print(a.profiles())
+
+def use_profile(name):
+    try:
+        a.use_profile(name)
+    except ValueError as e:
+        print(e)
+
+def stats():
+    """Print and reset per-stage CPU time, GC count, heap, scan rate and OSSM link stats."""
+    profiler.report()
+    _scan.report()
+    if SAMPLER_THREAD:
+        s.report()
+    if _fleet:
+        _fleet.report()
+    if _recorder:
+        _recorder.report()
+    boot_trace.report()
 
 def _record_activity():
     global _last_active_ms
     _last_active_ms = ticks_ms()
 
 
+def _save_state():
+    """Leave what a wake needs in RTC memory: baseline, detector, last OSSM per peer."""
+    a.cache_calibration()
+    state = _detector.pack_state()
+    if state:
+        rtc_state.put(rtc_state.DETECTOR, state)
+    if _fleet:
+        rtc_state.put_peers([peer.remote.last_device for peer in _fleet.peers])
+
+
 def _enter_deepsleep():
-    print(f"Entering deep sleep. Press IO{WAKEUP_PIN} button to wake.")
-    # EXT0 wakeup: wake when the pin is driven low (button press pulls to GND).
-    esp32.wake_on_ext0(_wakeup_pin, 0)
+    _save_state()
+    if _recorder:
+        _recorder.close()
+    if WAKE_ON_TOUCH and a._calibrated:
+        print(f"Entering deep sleep. Pick up the device or press IO{WAKEUP_PIN} button to wake.")
+        _touch.config_wake(WAKE_TOUCH_SENSOR, a.wake_threshold(WAKE_TOUCH_SENSOR, WAKE_TOUCH_LEVEL))
+        esp32.wake_on_touch(True)
+        # Touch wake cannot be combined with EXT0; the button uses EXT1 instead.
+        esp32.wake_on_ext1((_wakeup_pin,), esp32.WAKEUP_ALL_LOW)
+    else:
+        print(f"Entering deep sleep. Press IO{WAKEUP_PIN} button to wake.")
+        # EXT0 wakeup: wake when the pin is driven low (button press pulls to GND).
+        esp32.wake_on_ext0(_wakeup_pin, 0)
     machine.deepsleep()
 
 
@@ -58,42 +143,73 @@ async def idle_monitor():
     """Sleep the device after SLEEP_TIMEOUT_MS of no touch activity."""
     while True:
         await asyncio.sleep_ms(1000)
+        t = ticks_us()
         if ticks_diff(ticks_ms(), _last_active_ms) >= SLEEP_TIMEOUT_MS:
             _enter_deepsleep()
+        profiler.add("idle_monitor", t)
 
 
 async def run_output():
     global _last_analyzed
     while True:
-        analyzed = await a.analyze()
+        analyzed = await a.analyze(None if SAMPLER_THREAD else _scan.channels())
+        t = ticks_us()
         _last_analyzed = analyzed
+        if not _first_frame.is_set():
+            boot_trace.mark("first_frame")
+            _first_frame.set()
         if analyzed["insertion"] >= ACTIVE_THRESHOLD:
             _record_activity()
+        if _telemetry or _recorder:
+            t_ms = ticks_diff(ticks_ms(), _t0)
+            if _telemetry:
+                _telemetry.frame(t_ms, analyzed["raw"], analyzed["normalized"], analyzed)
+            if _recorder:
+                _recorder.frame(t_ms, analyzed["raw"], analyzed["normalized"], analyzed)
         print(
             f"focus: {analyzed['focus'] * 100:.0f} insertion: {analyzed['insertion'] * 100:.0f} center: {analyzed['center'] * 100:.0f}"
         )
-        await asyncio.sleep_ms(100)
+        delay = _scan.update(analyzed["active"] > 0, analyzed["edge"], analyzed["center"])
+        # Light sleep only while BLE is idle: the fleet between connection
+        # attempts, and no telemetry subscriber connected.
+        _scan.lightsleep_ok = SCAN_LIGHTSLEEP and _fleet is not None and _fleet.quiet \
+            and not (_telemetry and _telemetry.subscribed)
+        profiler.add("run_output", t)
+        await _scan.sleep(delay)
 
 
 _stroke_queue = Queue(maxsize=4)
 
+_detector = StrokeDetector(
+    STROKE_EMA_ALPHA, STROKE_MIN_AMPLITUDE,
+    STROKE_STOPPED_WINDOW, STROKE_STOPPED_THRESHOLD,
+    STROKE_PEAK_HISTORY,
+)
+if _resume:
+    _detector.restore(rtc_state.get(rtc_state.DETECTOR))
+
 
 async def stroke_task():
-    """Detect stroke extrema and enqueue (position, interval_ms) tuples."""
-    detector = StrokeDetector(
-        STROKE_EMA_ALPHA, STROKE_MIN_AMPLITUDE,
-        STROKE_STOPPED_WINDOW, STROKE_STOPPED_THRESHOLD,
-        STROKE_PEAK_HISTORY,
-    )
+    """Detect stroke extrema and enqueue (position, interval_ms) tuples.
+
+    With SIGNAL_MAP set, also hand live OSSM settings driven by other
+    analyzer signals to the fleet, once it is up.
+    """
+    detector = _detector
     last_emit_ms = ticks_ms()
     prev_elapsed = None
 
-    t0 = ticks_ms()
+    t0 = _t0
     while True:
-        raw = int(_last_analyzed.get("insertion", 0) * 100)
+        t = ticks_us()
+        raw = int(_last_analyzed.get(STROKE_SIGNAL, 0) * 100)
         emit, pos = detector.update(raw)
         if STROKE_LOG:
             print(f"S,{ticks_diff(ticks_ms(), t0)},{raw},{detector.smoothed:.2f},{pos if emit else -1}")
+        if _telemetry:
+            _telemetry.stroke(ticks_diff(ticks_ms(), t0), raw, detector.smoothed, pos if emit else -1)
+        if _recorder:
+            _recorder.stroke(ticks_diff(ticks_ms(), t0), raw, detector.smoothed, pos if emit else -1)
         if emit:
             now = ticks_ms()
             elapsed = ticks_diff(now, last_emit_ms)
@@ -103,30 +219,74 @@ async def stroke_task():
                 interval_ms = max(STROKE_MIN_MOVE_MS, min(prev_elapsed, 2000))
             prev_elapsed = elapsed
             last_emit_ms = now
+            if _telemetry:
+                _telemetry.emit(ticks_diff(now, t0), pos, interval_ms)
+            if _recorder:
+                _recorder.emit(ticks_diff(now, t0), pos, interval_ms)
             try:
                 _stroke_queue.put_nowait((pos, interval_ms))
             except QueueFull:
                 pass  # BLE not consuming; drop this event
+        profiler.add("stroke_task", t)
+        if _fleet and _fleet.bank:
+            t = ticks_us()
+            _fleet.bank.dispatch(_fleet, _last_analyzed, ticks_ms())
+            profiler.add("signal_bank", t)
         await asyncio.sleep_ms(STROKE_POLL_MS)
 
 
+def _make_fleet():
+    """One OSSMRemote per peer; after a wake each first tries its last OSSM directly.
+
+    With CLOCK_SYNC_MS each peer's clock is tracked against _t0, the origin
+    of the S-lines and telemetry timestamps, so K-lines map those onto it.
+    """
+    from ble_remote import OSSMRemote, BLETransport
+    from clock_sync import ClockSync
+    from ossm_fleet import OSSMFleet
+    claimed = set()
+    remotes = []
+    last = rtc_state.get_peers(BLE_PEERS) if _resume else [None] * BLE_PEERS
+    for i in range(BLE_PEERS):
+        if BLE_PEER_SETTINGS:
+            settings = BLE_PEER_SETTINGS[i]
+        else:
+            settings = {"speed": BLE_SPEED, "depth": BLE_DEPTH, "stroke": BLE_STROKE}
+        name = "BLE" if BLE_PEERS == 1 else f"BLE{i}"
+        remotes.append(OSSMRemote(settings, transport=BLETransport(last[i]), name=name,
+                                  claimed=claimed, resume=last[i] is not None,
+                                  clock=ClockSync(_t0, period_ms=CLOCK_SYNC_MS) if CLOCK_SYNC_MS else None))
+    bank = SignalBank(SIGNAL_MAP, SIGNAL_EMA_ALPHA, SIGNAL_DEADBAND, SIGNAL_MIN_MS) \
+        if SIGNAL_MAP else None
+    return OSSMFleet(remotes, bank=bank)
+
+
 async def ble_task():
-    remote = OSSMRemote({"speed": BLE_SPEED, "depth": BLE_DEPTH, "stroke": BLE_STROKE})
-    while True:
-        await remote.connect()
-        if remote.connected:
-            # Drain stale events queued while disconnected.
-            while not _stroke_queue.empty():
-                _stroke_queue.get_nowait()
-            await remote.run(_stroke_queue)
-        await asyncio.sleep_ms(RECONNECT_DELAY_MS)
+    """Bring up BLE once touch sampling runs: telemetry, then the OSSM fleet."""
+    global _telemetry, _fleet
+    await _first_frame.wait()
+    if TELEMETRY:
+        from telemetry import TelemetryService
+        _telemetry = TelemetryService(s.num_pins)
+        asyncio.create_task(_telemetry.run())
+    _fleet = _make_fleet()
+    boot_trace.mark("ble_ready")
+    await _fleet.run(_stroke_queue)
 
 
 async def main():
+    if OFFLOAD:
+        from serial_offload import SerialOffload
+        await SerialOffload(s).run(OFFLOAD_PERIOD_MS)
+        return
     asyncio.create_task(idle_monitor())
     asyncio.create_task(stroke_task())
     asyncio.create_task(ble_task())
     await run_output()
 
 
-asyncio.run(main())
+try:
+    asyncio.run(main())
+finally:
+    if _recorder:
+        _recorder.close()       # keep the last partial block on Ctrl-C
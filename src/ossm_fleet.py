@@ -0,0 +1,107 @@
+"""ossm_fleet.py - Fan one stroke-event stream out to several OSSM peripherals.
+
+Each peer wraps its own OSSMRemote (own transport, settings, send pacing and
+statistics) and its own small queue.  The fan-out task copies every event
+from the source queue into each connected peer's queue without waiting; a
+peer whose queue is full drops its oldest event, so a slow or stalled OSSM
+never holds back the others.
+
+Live settings from a SignalBank take their own path: each peer's OSSMRemote
+keeps the latest value per setting (set_live()) and writes it without waiting
+for the stream, and reports each write back to the bank.  A peer that
+reconnects resets the bank, since connect() wrote the static settings over
+the live ones.
+
+Connection attempts are serialized through one lock: aioble can only run one
+scan at a time, and a device must be claimed by one peer before the next
+peer scans, or two peers could pick the same OSSM.
+"""
+
+import asyncio
+from queue import Queue, QueueFull
+from ble_remote import RECONNECT_DELAY_MS
+
+
+class Peer:
+    def __init__(self, remote, maxsize=4, bank=None):
+        self.remote = remote
+        self.queue = Queue(maxsize=maxsize)
+        self.bank = bank
+        self.dropped = 0        # events discarded because this peer fell behind
+        self.waiting = False    # sleeping between connection attempts
+        if bank is not None:
+            remote.on_set = bank.mark_sent
+
+    def offer(self, item):
+        if not self.remote.connected:
+            return
+        try:
+            self.queue.put_nowait(item)
+        except QueueFull:
+            self.queue.get_nowait()     # drop the oldest; keep the newest
+            self.queue.put_nowait(item)
+            self.dropped += 1
+
+    def offer_setting(self, key, value):
+        if self.remote.connected:
+            self.remote.set_live(key, value)
+
+    async def run(self, connect_lock):
+        remote = self.remote
+        while True:
+            async with connect_lock:
+                await remote.connect()
+            if remote.connected:
+                # Drain stale events queued while disconnected.
+                while not self.queue.empty():
+                    self.queue.get_nowait()
+                if self.bank is not None:
+                    self.bank.reset()   # re-send the live settings over the static ones
+                await remote.run(self.queue)
+                continue            # link lost: reconnect straight away
+            self.waiting = True
+            await asyncio.sleep_ms(RECONNECT_DELAY_MS)
+            self.waiting = False
+
+
+class OSSMFleet:
+    def __init__(self, remotes, maxsize=4, bank=None):
+        """bank: SignalBank whose live settings go to every peer (None = none)."""
+        self.bank = bank
+        self.peers = [Peer(r, maxsize, bank) for r in remotes]
+        self._connect_lock = asyncio.Lock()
+
+    async def run(self, source):
+        """Start every peer and forward events from `source` to all of them."""
+        for peer in self.peers:
+            asyncio.create_task(peer.run(self._connect_lock))
+        while True:
+            item = await source.get()
+            for peer in self.peers:
+                peer.offer(item)
+
+    def offer_setting(self, key, value):
+        """Hand a live setting to every connected peer (see SignalBank.dispatch)."""
+        for peer in self.peers:
+            peer.offer_setting(key, value)
+
+    @property
+    def quiet(self):
+        """True while every peer is waiting between connection attempts (radio idle)."""
+        for peer in self.peers:
+            if not peer.waiting:
+                return False
+        return True
+
+    def report(self):
+        """Print per-peer health and send statistics, then reset them."""
+        for peer in self.peers:
+            r = peer.remote
+            print("{}: {}  sent {}  set {}  send avg {} us max {} us  dropped {}  connects {}  failures {}"
+                  "  trips {}  detect max {} ms  outage max {} ms".format(
+                r.name, "up" if r.connected else "down", r.sent, r.settings_sent,
+                r.send_us_total // r.sent if r.sent else 0, r.send_us_max,
+                peer.dropped, r.connects, r.failures,
+                r.trips, r.detect_ms_max, r.outage_ms_max))
+            r.reset_stats()
+            peer.dropped = 0
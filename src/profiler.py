@@ -0,0 +1,71 @@
+"""profiler.py - Lightweight per-stage timing counters.
+
+Each stage records call count, cumulative and maximum time (ticks_us).
+Heap usage is sampled on every record to track the high-water mark and to
+count garbage collections (detected as a drop in allocated bytes).
+
+Usage:
+    t = ticks_us()
+    ...work...
+    profiler.add("stage", t)
+
+Call report() from the REPL (main.stats()) to print and reset the counters.
+"""
+
+import gc
+from time import ticks_us, ticks_diff
+
+try:
+    _mem_alloc = gc.mem_alloc
+except AttributeError:     # CPython: no heap introspection
+    _mem_alloc = None
+
+# name -> [count, total_us, max_us]
+_stages = {}
+_heap_high = 0
+_heap_last = 0
+_gc_count = 0
+_t_reset = ticks_us()
+
+
+def add(name, start_us):
+    """Record one call of stage `name` that started at ticks_us() == start_us."""
+    global _heap_high, _heap_last, _gc_count
+    dt = ticks_diff(ticks_us(), start_us)
+    s = _stages.get(name)
+    if s is None:
+        s = _stages[name] = [0, 0, 0]
+    s[0] += 1
+    s[1] += dt
+    if dt > s[2]:
+        s[2] = dt
+    if _mem_alloc is not None:
+        alloc = _mem_alloc()
+        if alloc < _heap_last:
+            _gc_count += 1
+        _heap_last = alloc
+        if alloc > _heap_high:
+            _heap_high = alloc
+
+
+def reset():
+    global _heap_high, _heap_last, _gc_count, _t_reset
+    _stages.clear()
+    _heap_high = 0
+    _heap_last = 0
+    _gc_count = 0
+    _t_reset = ticks_us()
+
+
+def report():
+    """Print all stage counters since the last report, then reset them."""
+    window_us = ticks_diff(ticks_us(), _t_reset)
+    print("stage            calls   total_ms   avg_us   max_us   cpu%")
+    for name in sorted(_stages):
+        count, total, peak = _stages[name]
+        print("{:<14} {:>7} {:>10.1f} {:>8} {:>8} {:>6.1f}".format(
+            name, count, total / 1000, total // count if count else 0, peak,
+            100 * total / window_us if window_us > 0 else 0.0))
+    print("window: {:.1f} s  gc: {}  heap high: {}".format(
+        window_us / 1_000_000, _gc_count, _heap_high))
+    reset()
@@ -0,0 +1,231 @@
+"""recorder.py - Session recorder: frame_codec records in a ring of flash segments.
+
+Records are packed into one preallocated BLOCK-byte buffer and written to
+flash a whole block at a time, so the filesystem sees few, large writes.
+The log is a ring of SEGMENTS files; when the current one is full the oldest
+is overwritten, which spreads wear and bounds the space used.  A token bucket
+caps the average write rate: records offered faster than max_bps are dropped
+(and counted) rather than stalling the frame loop with flash writes.
+
+Segment file layout (little-endian):
+  header:  magic b'TDR1', num_pins (B), reserved (B), reserved (H), seq (I)
+  records: frame_codec records, back to back
+`seq` increases with every segment started, so the oldest data comes first
+when the segments are read in seq order.
+
+export() streams the whole log to stdout as one frame_codec capture, prefixed
+with its length, for tools/rec_export.py.
+"""
+
+import os
+import struct
+import sys
+from time import ticks_ms, ticks_us, ticks_diff
+import frame_codec
+import profiler
+from frame_codec import REC_RAW, REC_NORM, REC_METRICS, REC_EMIT, REC_STROKE
+
+REC_DIR = '/rec'
+BLOCK = 4096                # one flash sector
+SEGMENTS = 8
+SEGMENT_BYTES = 64 * 1024
+MAX_BPS = 2048              # average flash write budget, bytes/s
+DEFAULT_MASK = (1 << REC_RAW) | (1 << REC_METRICS) | (1 << REC_EMIT)
+
+_MAGIC = b'TDR1'
+_SEG_HEADER = '<4sBBHI'
+_SEG_HEADER_SIZE = 12
+
+
+def _seg_path(d, i):
+    return '{}/seg{}.bin'.format(d, i)
+
+
+def segments(d=None):
+    """(seq, path, num_pins) of every valid segment in REC_DIR, oldest first."""
+    d = d or REC_DIR
+    found = []
+    for i in range(SEGMENTS):
+        path = _seg_path(d, i)
+        try:
+            with open(path, 'rb') as f:
+                head = f.read(_SEG_HEADER_SIZE)
+        except OSError:
+            continue
+        if len(head) == _SEG_HEADER_SIZE:
+            magic, n, _, _, seq = struct.unpack(_SEG_HEADER, head)
+            if magic == _MAGIC:
+                found.append((seq, path, n))
+    found.sort()
+    return found
+
+
+class Recorder:
+    def __init__(self, num_pins, mask=DEFAULT_MASK, decimation=1, max_bps=MAX_BPS,
+                 path=None):
+        """
+        mask       - bit per frame_codec record type to record (as in telemetry)
+        decimation - record every Nth sensor frame; emit events are never decimated
+        max_bps    - average flash write budget; bursts of up to a block, or one
+                     second's budget if larger, are allowed
+        path       - directory for the segments (default REC_DIR, looked up late)
+        """
+        self._n = num_pins
+        self._dir = path or REC_DIR
+        self.mask = mask
+        self.decimation = max(1, decimation)
+        self._max_bps = max_bps
+        self._burst = max(BLOCK, max_bps)
+        self._buf = bytearray(BLOCK)
+        self._mv = memoryview(self._buf)
+        self._len = 0
+        self._frame = 0
+        self._tokens = self._burst
+        self._t_tokens = ticks_ms()
+        self._file = None
+        self._seg_bytes = 0
+        try:
+            os.mkdir(self._dir)
+        except OSError:
+            pass
+        found = segments(self._dir)
+        self._seq = found[-1][0] + 1 if found else 0
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.records = 0            # records accepted
+        self.dropped = 0            # records over the write budget
+        self.written = 0            # bytes written to flash
+        self.flushes = 0
+        self.flush_us_max = 0
+
+    # ------------------------------------------------------------------ #
+    # Recording                                                            #
+    # ------------------------------------------------------------------ #
+
+    def _room(self, rtype):
+        """Offset for a record of `rtype`, or -1 if it is masked out or over budget."""
+        if not self.mask & (1 << rtype):
+            return -1
+        size = frame_codec.record_size(rtype, self._n)
+        now = ticks_ms()
+        tokens = self._tokens + ticks_diff(now, self._t_tokens) * self._max_bps // 1000
+        self._t_tokens = now
+        self._tokens = tokens if tokens < self._burst else self._burst
+        if self._tokens < size:
+            self.dropped += 1
+            return -1
+        self._tokens -= size
+        if self._len + size > BLOCK:
+            self.flush()
+        self.records += 1
+        return self._len
+
+    def frame(self, t, raw, normalized, analyzed):
+        """Record one sensor frame (raw/normalized/metrics, per the mask and decimation)."""
+        t0 = ticks_us()
+        self._frame += 1
+        if self._frame % self.decimation:
+            return
+        buf = self._buf
+        off = self._room(REC_RAW)
+        if off >= 0:
+            self._len = frame_codec.pack_raw(buf, off, t, raw)
+        off = self._room(REC_NORM)
+        if off >= 0:
+            self._len = frame_codec.pack_norm(buf, off, t, normalized)
+        off = self._room(REC_METRICS)
+        if off >= 0:
+            self._len = frame_codec.pack_metrics(
+                buf, off, t, analyzed['insertion'], analyzed['focus'],
+                analyzed['center'], analyzed['active'])
+        profiler.add("recorder", t0)
+
+    def stroke(self, t_ms, raw, ema, emit_pos):
+        off = self._room(REC_STROKE)
+        if off >= 0:
+            self._len = frame_codec.pack_stroke(self._buf, off, t_ms, raw, ema, emit_pos)
+
+    def emit(self, t_ms, pos, interval_ms):
+        off = self._room(REC_EMIT)
+        if off >= 0:
+            self._len = frame_codec.pack_emit(self._buf, off, t_ms, pos, interval_ms)
+
+    def flush(self):
+        """Write the buffered records to the current segment (rotating if it is full)."""
+        if not self._len:
+            return
+        t = ticks_us()
+        if self._file is None or self._seg_bytes + self._len > SEGMENT_BYTES:
+            self._next_segment()
+        self._file.write(self._mv[:self._len])
+        self._file.flush()
+        self._seg_bytes += self._len
+        self.written += self._len
+        self._len = 0
+        self.flushes += 1
+        dt = ticks_diff(ticks_us(), t)
+        if dt > self.flush_us_max:
+            self.flush_us_max = dt
+        profiler.add("recorder_flush", t)
+
+    def _next_segment(self):
+        if self._file is not None:
+            self._file.close()
+        seq = self._seq
+        self._seq += 1
+        self._file = open(_seg_path(self._dir, seq % SEGMENTS), 'wb')
+        self._file.write(struct.pack(_SEG_HEADER, _MAGIC, self._n, 0, 0, seq))
+        self._seg_bytes = _SEG_HEADER_SIZE
+        self.written += _SEG_HEADER_SIZE
+
+    def close(self):
+        self.flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def report(self):
+        print("recorder: {} records  dropped {}  {} B in {} flushes  flush max {} us  seq {}".format(
+            self.records, self.dropped, self.written, self.flushes, self.flush_us_max,
+            self._seq - 1))
+        self.reset_stats()
+
+
+# ---------------------------------------------------------------------- #
+# Export                                                                   #
+# ---------------------------------------------------------------------- #
+
+def export(out=None, path=None):
+    """Write the log as one frame_codec capture, oldest record first.
+
+    Output: total length (<I), capture header, then the records of every
+    segment in seq order, copied a block at a time.  Segments recorded with
+    a different sensor count than the newest one (from before a hardware
+    change) are skipped, so the latest recordings are always exported.
+    """
+    out = out or sys.stdout.buffer
+    found = segments(path)
+    n = found[-1][2] if found else 0
+    found = [(seq, p) for seq, p, m in found if m == n]
+    total = 5
+    for _, p in found:
+        total += os.stat(p)[6] - _SEG_HEADER_SIZE
+    out.write(struct.pack('<I', total))
+    out.write(frame_codec.capture_header(n))
+    buf = bytearray(BLOCK)
+    mv = memoryview(buf)
+    for _, p in found:
+        with open(p, 'rb') as f:
+            f.seek(_SEG_HEADER_SIZE)
+            while True:
+                k = f.readinto(buf)
+                if not k:
+                    break
+                out.write(mv[:k])
+
+
+def erase(path=None):
+    """Delete every segment."""
+    for _, p, _ in segments(path):
+        os.remove(p)
@@ -0,0 +1,120 @@
+"""rtc_state.py - Pipeline state cached in RTC memory across deep sleep.
+
+RTC memory survives deep sleep (but not power loss or a hard reset), so state
+kept here lets a wake skip work a cold boot has to do, such as reading the
+calibration profile store from flash.
+
+Layout (little-endian):
+  header:  magic b'TDS1', count (B)
+  section: tag (B), length (H), payload
+Sections are independent; put() rewrites the whole blob, which is cheap
+because RTC memory is RAM.
+"""
+
+import struct
+import machine
+
+# Section tags
+CAL = 1         # active calibration profile (cal_profiles.pack_profile record)
+DETECTOR = 2    # StrokeDetector.pack_state()
+PEERS = 3       # last OSSM per fleet peer, see put_peers()
+
+RTC_MEMORY_MAX = 2048   # bytes of user RTC memory on the ESP32 port
+
+_MAGIC = b'TDS1'
+_HEADER = '<4sB'
+_SECTION = '<BH'
+_PEER = '<B6s'          # BLE address type (0xFF = none), address
+
+_sections = None        # tag -> payload, parsed on first use
+
+
+def woke_from_deepsleep():
+    """True when RTC memory may still hold state from before the last sleep."""
+    return machine.reset_cause() == machine.DEEPSLEEP_RESET
+
+
+def _load():
+    global _sections
+    _sections = {}
+    data = machine.RTC().memory()
+    hsize = struct.calcsize(_HEADER)
+    ssize = struct.calcsize(_SECTION)
+    if len(data) < hsize:
+        return
+    magic, count = struct.unpack_from(_HEADER, data, 0)
+    if magic != _MAGIC:
+        return
+    pos = hsize
+    for _ in range(count):
+        if pos + ssize > len(data):
+            break
+        tag, length = struct.unpack_from(_SECTION, data, pos)
+        pos += ssize
+        if pos + length > len(data):
+            break
+        _sections[tag] = bytes(data[pos:pos + length])
+        pos += length
+
+
+def _save():
+    hsize = struct.calcsize(_HEADER)
+    ssize = struct.calcsize(_SECTION)
+    size = hsize + sum(ssize + len(p) for p in _sections.values())
+    if size > RTC_MEMORY_MAX:
+        raise ValueError("RTC state too large: {} bytes".format(size))
+    buf = bytearray(size)
+    struct.pack_into(_HEADER, buf, 0, _MAGIC, len(_sections))
+    pos = hsize
+    for tag, payload in _sections.items():
+        struct.pack_into(_SECTION, buf, pos, tag, len(payload))
+        pos += ssize
+        buf[pos:pos + len(payload)] = payload
+        pos += len(payload)
+    machine.RTC().memory(buf)
+
+
+def get(tag):
+    """Payload of a section, or None if it was never stored."""
+    if _sections is None:
+        _load()
+    return _sections.get(tag)
+
+
+def put(tag, payload):
+    if _sections is None:
+        _load()
+    _sections[tag] = bytes(payload)
+    _save()
+
+
+def put_peers(devices):
+    """Store one (address type, address) or None per fleet peer."""
+    size = struct.calcsize(_PEER)
+    buf = bytearray(size * len(devices))
+    for i, device in enumerate(devices):
+        if device is None:
+            struct.pack_into(_PEER, buf, i * size, 0xFF, b'')
+        else:
+            struct.pack_into(_PEER, buf, i * size, device[0], device[1])
+    put(PEERS, buf)
+
+
+def get_peers(count):
+    """Inverse of put_peers(), padded with None to `count` peers."""
+    data = get(PEERS) or b''
+    size = struct.calcsize(_PEER)
+    devices = []
+    for i in range(count):
+        if (i + 1) * size > len(data):
+            devices.append(None)
+            continue
+        addr_type, addr = struct.unpack_from(_PEER, data, i * size)
+        devices.append(None if addr_type == 0xFF else (addr_type, addr))
+    return devices
+
+
+def clear():
+    global _sections
+    _sections = {}
+    machine.RTC().memory(b'')
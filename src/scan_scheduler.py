@@ -0,0 +1,132 @@
+"""scan_scheduler.py - Adaptive duty cycle for the touch sampling loop.
+
+While someone is touching the device every electrode is scanned every
+SCAN_ACTIVE_MS.  After SCAN_IDLE_AFTER consecutive inactive frames the
+scheduler drops to one frame every SCAN_IDLE_MS, scanning SCAN_IDLE_CHANNELS
+and the remaining electrodes on alternate frames, so a touch on any electrode
+is seen within two idle frames; the first frame that shows activity switches
+straight back to full rate.
+
+At full rate with SCAN_ROI enabled, each frame scans only the region of
+interest - the electrodes around the insertion boundary (analyze()['edge'])
+and the center of activity - plus SCAN_ROI_SWEEP far electrodes taken
+round-robin.  The wait after a frame shrinks in proportion to the electrodes skipped, so the sensor
+time budget is unchanged but the electrodes that matter update more often.
+Skipped electrodes carry their last value forward (see analyze()['ages']).
+
+Between idle-mode frames it sleeps with machine.lightsleep() when the owner
+has set `lightsleep_ok` (nothing else, e.g. BLE, needs the CPU awake),
+otherwise with asyncio.sleep_ms().  Full-rate waits never light-sleep: the
+wake-up latency would come straight out of the frame rate while touched.
+"""
+
+import asyncio
+import machine
+from time import ticks_ms, ticks_diff
+from config import (
+    SCAN_ACTIVE_MS, SCAN_IDLE_MS, SCAN_IDLE_AFTER, SCAN_IDLE_CHANNELS,
+    SCAN_LIGHTSLEEP_MIN_MS, SCAN_ROI, SCAN_ROI_SWEEP,
+)
+
+
+class ScanScheduler:
+    def __init__(self, num_pins, active_ms=SCAN_ACTIVE_MS, idle_ms=SCAN_IDLE_MS,
+                 idle_after=SCAN_IDLE_AFTER, idle_channels=SCAN_IDLE_CHANNELS,
+                 roi=SCAN_ROI, roi_sweep=SCAN_ROI_SWEEP):
+        self._n = num_pins
+        self.active_ms = active_ms
+        self.idle_ms = idle_ms
+        self.idle_after = idle_after
+        self.idle_channels = idle_channels
+        rest = tuple(i for i in range(num_pins) if i not in idle_channels)
+        self._idle_sets = (idle_channels, rest) if rest else (idle_channels,)
+        self._idle_turn = 0     # index into _idle_sets for the next idle frame
+        self.roi = roi
+        self.roi_sweep = roi_sweep
+        self.lightsleep_ok = False
+        self._quiet = 0
+        self._full = True
+        self._plan = None       # ROI channel list for the next frame (None = all)
+        self._sweep = 0         # round-robin pointer over far electrodes
+        self.reset_stats()
+
+    def channels(self):
+        """Channel indices to scan this frame (None = all)."""
+        return self._plan if self._full else self._idle_sets[self._idle_turn]
+
+    @property
+    def full_rate(self):
+        return self._full
+
+    def update(self, active, edge=-1, center=0.0):
+        """Account for the frame just analyzed; returns ms to wait before the next.
+
+        active - the frame showed touch activity
+        edge   - index of the insertion boundary electrode (-1 if none)
+        center - center of activity [0, 1]
+        """
+        now = ticks_ms()
+        dt = ticks_diff(now, self._t_frame)
+        self._t_frame = now
+        self._frames += 1
+        scanned = self.channels()
+        self._reads += self._n if scanned is None else len(scanned)
+        if self._full:
+            self._full_ms += dt
+        if active:
+            self._quiet = 0
+            self._full = True
+        elif self._full:
+            self._quiet += 1
+            if self._quiet >= self.idle_after:
+                self._full = False
+        if not self._full:
+            self._idle_turn = (self._idle_turn + 1) % len(self._idle_sets)
+            return self.idle_ms
+        self._plan = self._region(edge, center) if self.roi and edge >= 0 else None
+        if self._plan is None:
+            return self.active_ms
+        return self.active_ms * len(self._plan) // self._n
+
+    def _region(self, edge, center):
+        n = self._n
+        plan = []
+        for i in (edge - 1, edge, edge + 1, round(center * (n - 1))):
+            if 0 <= i < n and i not in plan:
+                plan.append(i)
+        swept = 0
+        for _ in range(n):
+            if swept >= self.roi_sweep:
+                break
+            i = self._sweep
+            self._sweep = (i + 1) % n
+            if i not in plan:
+                plan.append(i)
+                swept += 1
+        return plan
+
+    async def sleep(self, ms):
+        if self.lightsleep_ok and not self._full and ms >= SCAN_LIGHTSLEEP_MIN_MS:
+            machine.lightsleep(ms)
+            self._sleep_ms += ms
+        else:
+            await asyncio.sleep_ms(ms)
+
+    def reset_stats(self):
+        self._t_start = self._t_frame = ticks_ms()
+        self._frames = 0
+        self._full_ms = 0
+        self._sleep_ms = 0
+        self._reads = 0
+
+    def report(self):
+        """Print average scan rate and active/light-sleep time fractions, then reset."""
+        window = ticks_diff(ticks_ms(), self._t_start)
+        if window <= 0:
+            return
+        frames = self._frames
+        print("scan: {:.2f} frames/s  {:.1f} electrodes/frame  full-rate {:.0f}%  light-sleep {:.0f}%  ({} frames, {:.1f} s)".format(
+            frames * 1000 / window, self._reads / frames if frames else 0.0,
+            100 * self._full_ms / window, 100 * self._sleep_ms / window,
+            frames, window / 1000))
+        self.reset_stats()
@@ -0,0 +1,60 @@
+"""serial_offload.py - Stream raw sensor frames to a host over USB serial.
+
+In OFFLOAD mode the device only scans the electrodes.  Each frame is written
+to stdout (the USB CDC serial port) as a REC_RAW record wrapped in a
+frame_codec packet.  tools/host_bridge.py runs calibration, analysis, stroke
+detection and the OSSM link on the host CPU instead.
+
+With 9 sensors a packet is 29 bytes, so 50 frames/s needs about 1.5 kB/s.
+That is well inside even a 115200-baud UART and a tiny share of USB CDC.
+"""
+
+import asyncio
+import sys
+from time import ticks_ms, ticks_diff, ticks_add, ticks_us
+import frame_codec
+import profiler
+from frame_codec import REC_RAW, PACKET_HEADER, PACKET_OVERHEAD
+
+
+class SerialOffload:
+    def __init__(self, sensor, out=None):
+        self._sensor = sensor
+        self._out = out or sys.stdout.buffer
+        self._record = frame_codec.record_size(REC_RAW, sensor.num_pins)
+        self._buf = bytearray(self._record + PACKET_OVERHEAD)
+        self._seq = 0
+        self.frames = 0
+
+    def budget(self, period_ms):
+        """(bytes per frame, bytes per second) at one frame every period_ms."""
+        size = len(self._buf)
+        return size, size * 1000 // period_ms
+
+    def send(self, t_ms, values):
+        """Write one frame as a packet."""
+        buf = self._buf
+        frame_codec.pack_raw(buf, PACKET_HEADER, t_ms, values)
+        frame_codec.pack_packet(buf, self._seq, self._record)
+        self._out.write(buf)
+        self._seq = (self._seq + 1) & 0xFFFF
+        self.frames += 1
+
+    async def run(self, period_ms):
+        """Scan and send one frame every period_ms, forever."""
+        size, rate = self.budget(period_ms)
+        print("Offload: {} B/frame every {} ms = {} B/s".format(size, period_ms, rate))
+        t0 = ticks_ms()
+        deadline = t0
+        while True:
+            values = self._sensor.read()    # one blocking full scan, no per-pad yields
+            t = ticks_us()
+            self.send(ticks_diff(ticks_ms(), t0), values)
+            profiler.add("offload_send", t)
+            deadline = ticks_add(deadline, period_ms)
+            wait = ticks_diff(deadline, ticks_ms())
+            if wait < 0:
+                # Fell behind (e.g. the host stopped reading): drop the backlog.
+                deadline = ticks_ms()
+                wait = 0
+            await asyncio.sleep_ms(wait)
@@ -1,3 +1,9 @@
+import struct
+from time import ticks_diff
+
+_STATE = '<5fbBB'     # see StrokeDetector.pack_state
+
+
 class StrokeDetector:
     """
     Detects stroke extrema (peaks and troughs) in a 0-100 insertion signal.
@@ -42,6 +48,24 @@ class StrokeDetector:
         self._last_emit = None
         self._stopped_armed = True
 
+    def pack_state(self):
+        """Detector state as bytes, for RTC memory across deep sleep; None before any update."""
+        if self._smoothed is None:
+            return None
+        return struct.pack(_STATE, self._smoothed, self._prev, self._raw_extreme,
+                           self._last_extreme, self._last_emit, self._direction,
+                           min(self._stable_count, 255), self._stopped_armed)
+
+    def restore(self, data):
+        """Resume from pack_state() output; returns False (and keeps state) if it does not fit."""
+        if data is None or len(data) != struct.calcsize(_STATE):
+            return False
+        (self._smoothed, self._prev, self._raw_extreme, self._last_extreme,
+         self._last_emit, self._direction, self._stable_count,
+         armed) = struct.unpack(_STATE, data)
+        self._stopped_armed = bool(armed)
+        return True
+
     def update(self, raw):
         """
         Feed the next insertion sample (0-100, int or float).
@@ -120,3 +144,95 @@ class StrokeDetector:
     @property
     def smoothed(self):
         return self._smoothed if self._smoothed is not None else 0.0
+
+
+class SignalBank:
+    """
+    Maps several analyzer signals onto live OSSM settings (e.g. center ->
+    depth, focus -> stroke) with one update() call per frame.
+
+    Each signal is a (source key, setting, out_lo, out_hi) tuple: the analyzed
+    value (0-1) is scaled to out_lo..out_hi and EMA-smoothed.  A setting is due
+    for sending when its smoothed value has moved at least `deadband` from the
+    last value sent and `min_interval_ms` has passed since then, so set:
+    writes stay rare next to the stream: commands.  A value counts as sent
+    only once an OSSM reports it written (mark_sent), so it stays due until
+    then.  Signals hold their value while no sensor is active.  State lives in
+    preallocated lists, so update() allocates nothing beyond float
+    temporaries.
+    """
+
+    def __init__(self, signals, ema_alpha, deadband, min_interval_ms):
+        n = len(signals)
+        self.signals = signals
+        self.ema_alpha = ema_alpha
+        self.deadband = deadband
+        self.min_interval_ms = min_interval_ms
+        self._smoothed = [0.0] * n
+        self._sent = [-1] * n        # last value sent per setting (-1 = never)
+        self._sent_ms = [0] * n
+        self._primed = False
+
+    def update(self, analyzed, now_ms):
+        """
+        Feed one analyze() result.  Returns a bitmask of signals due for
+        sending (bit i = signals[i]); send item(i), and call mark_sent()
+        once it is written.  While no sensor is active the held values are
+        due only if they were never sent (after reset()).
+        """
+        sent = self._sent
+        if not analyzed.get('active'):
+            due = 0
+            if self._primed:
+                for i in range(len(sent)):
+                    if sent[i] < 0:
+                        due |= 1 << i
+            return due
+        alpha = self.ema_alpha
+        smoothed = self._smoothed
+        sent_ms = self._sent_ms
+        due = 0
+        for i in range(len(smoothed)):
+            key, _, lo, hi = self.signals[i]
+            v = lo + analyzed[key] * (hi - lo)
+            if self._primed:
+                v = alpha * v + (1 - alpha) * smoothed[i]
+            smoothed[i] = v
+            if sent[i] < 0:
+                due |= 1 << i
+            elif abs(v - sent[i]) >= self.deadband and \
+                    ticks_diff(now_ms, sent_ms[i]) >= self.min_interval_ms:
+                due |= 1 << i
+        self._primed = True
+        return due
+
+    def dispatch(self, fleet, analyzed, now_ms):
+        """
+        update(), then hand every setting due to fleet.offer_setting()
+        (OSSMFleet, which reports writes back through mark_sent()).
+        """
+        due = self.update(analyzed, now_ms)
+        i = 0
+        while due:
+            if due & 1:
+                key, value = self.item(i)
+                fleet.offer_setting(key, value)
+            due >>= 1
+            i += 1
+
+    def item(self, i):
+        """(setting, value) for signal i."""
+        return self.signals[i][1], round(self._smoothed[i])
+
+    def mark_sent(self, setting, value, now_ms):
+        """Record that `value` was written to an OSSM for `setting`."""
+        for i in range(len(self.signals)):
+            if self.signals[i][1] == setting:
+                self._sent[i] = value
+                self._sent_ms[i] = now_ms
+
+    def reset(self):
+        """Forget sent values so every setting is re-sent, held values included
+        (call after reconnecting)."""
+        for i in range(len(self._sent)):
+            self._sent[i] = -1
@@ -0,0 +1,112 @@
+"""tcp_transport.py - OSSM link over a TCP line protocol (simulator / host runs).
+
+Stands in for BLETransport when talking to test/ossm_ble_sim.py started with
+--tcp, so several simulated OSSMs can be driven from one process without a
+radio.  Works under CPython asyncio and MicroPython asyncio streams.
+
+Protocol (newline-terminated UTF-8 lines):
+  client -> server:  "<command>"            one OSSM command per line
+  server -> client:  "S <state json>"       CURRENT_STATE notification
+                     "C <text>"             PRIMARY_COMMAND notification (echo)
+"""
+
+import asyncio
+
+ECHO_BACKLOG = 8            # echo lines kept for echo(); older ones are dropped
+
+
+class TCPTransport:
+    """Transport with the same interface as ble_remote.BLETransport."""
+
+    def __init__(self, host, port):
+        self._host = host
+        self._port = port
+        self._reader = None
+        self._writer = None
+        self._task = None
+        self._state = None
+        self._state_evt = asyncio.Event()
+        self._echoes = []           # unread echo lines, newest last (at most ECHO_BACKLOG)
+        self._echo_evt = asyncio.Event()
+        self.address = None
+
+    async def open(self, exclude=()):
+        address = (self._host, self._port)
+        if address in exclude:
+            return False
+        try:
+            self._reader, self._writer = await asyncio.open_connection(self._host, self._port)
+        except OSError as e:
+            print(f"TCP: connect to {self._host}:{self._port} failed: {e}")
+            return False
+        self._state = None
+        self._state_evt.clear()
+        self._echoes = []
+        self._echo_evt.clear()
+        self.address = address
+        self._task = asyncio.create_task(self._read_loop())
+        return True
+
+    async def _read_loop(self):
+        try:
+            while True:
+                line = await self._reader.readline()
+                if not line:
+                    break
+                kind, payload = line[:1], line[2:].rstrip(b"\r\n")
+                if kind == b"S":
+                    self._state = payload
+                    self._state_evt.set()
+                elif kind == b"C":
+                    self._echoes.append(payload)
+                    if len(self._echoes) > ECHO_BACKLOG:
+                        self._echoes.pop(0)
+                    self._echo_evt.set()
+        except (OSError, asyncio.CancelledError):
+            pass
+        self._reader = None
+        self._state_evt.set()     # wake any waiter so it sees the closed link
+        self._echo_evt.set()
+
+    async def _wait(self, evt, timeout_ms):
+        await asyncio.wait_for(evt.wait(), timeout_ms / 1000)
+        evt.clear()
+        if self._reader is None:
+            raise OSError("connection closed")
+
+    async def write(self, data, response=False):
+        if self._writer is None or self._reader is None:
+            raise OSError("not connected")
+        self._writer.write(data + b"\n")
+        await self._writer.drain()
+
+    async def subscribe_state(self):
+        pass
+
+    async def state(self, timeout_ms):
+        await self._wait(self._state_evt, timeout_ms)
+        return self._state
+
+    async def subscribe_echo(self):
+        pass
+
+    async def echo(self, timeout_ms):
+        while not self._echoes:     # the event may still be set from lines already read
+            await self._wait(self._echo_evt, timeout_ms)
+        return self._echoes.pop(0)
+
+    def is_connected(self):
+        return self._reader is not None
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._writer is not None:
+            try:
+                self._writer.close()
+                await self._writer.wait_closed()
+            except Exception:
+                pass
+        self._writer = None
+        self._reader = None
@@ -0,0 +1,160 @@
+"""telemetry.py - BLE peripheral service streaming live sensor data.
+
+While the device drives an OSSM as a BLE central, it also advertises this
+service as a peripheral.  A subscriber (tools/telemetry_client.py) receives
+frame_codec records packed back to back into notifications: as many whole
+records as fit in the negotiated MTU, or fewer if it asked for smaller batches.
+A partly filled notification is sent after FLUSH_MS so slow streams still flow.
+
+Control characteristic (write, 3 bytes):
+  mask        bit per record type to send (bit 1 = REC_RAW ... bit 5 = REC_STROKE)
+  batch       max records per notification (0 = as many as fit)
+  decimation  send every Nth sensor frame (1 = all); emit events are never dropped
+"""
+
+import asyncio
+import frame_codec
+from frame_codec import REC_RAW, REC_NORM, REC_METRICS, REC_EMIT, REC_STROKE
+
+TELEMETRY_UUID = "e1e70000-7d1d-4c5e-9b6f-0a0a5444494e"
+DATA_UUID      = "e1e70001-7d1d-4c5e-9b6f-0a0a5444494e"
+CONTROL_UUID   = "e1e70002-7d1d-4c5e-9b6f-0a0a5444494e"
+
+ADV_NAME = "TDInput"
+ADV_INTERVAL_US = 250_000
+MAX_PAYLOAD = 509           # 512-byte MTU minus the 3-byte ATT header
+FLUSH_MS = 200              # send a partly filled notification after this long
+DEFAULT_MASK = (1 << REC_METRICS) | (1 << REC_EMIT) | (1 << REC_STROKE)
+
+
+class TelemetryService:
+    def __init__(self, num_pins):
+        import bluetooth
+        import aioble
+        self._aioble = aioble
+        bluetooth.BLE().config(mtu=MAX_PAYLOAD + 3)
+        service = aioble.Service(bluetooth.UUID(TELEMETRY_UUID))
+        self._data = aioble.Characteristic(service, bluetooth.UUID(DATA_UUID), notify=True)
+        self._control = aioble.Characteristic(service, bluetooth.UUID(CONTROL_UUID),
+                                              write=True)
+        aioble.register_services(service)
+        self._service_uuid = bluetooth.UUID(TELEMETRY_UUID)
+        self._n = num_pins
+        self._buf = bytearray(MAX_PAYLOAD)
+        self._mv = memoryview(self._buf)
+        self._len = 0
+        self._count = 0
+        self._frame = 0
+        self._sample = 0
+        self._conn = None
+        self._limit = 20            # payload limit until the MTU is known
+        self.mask = DEFAULT_MASK
+        self.batch = 0
+        self.decimation = 1
+        self.sent = 0               # notifications sent
+        self.records = 0            # records sent
+        self.oversize = 0           # records dropped: larger than the payload limit
+
+    async def run(self):
+        """Advertise, accept one subscriber at a time, and apply control writes."""
+        while True:
+            conn = await self._aioble.advertise(
+                ADV_INTERVAL_US, name=ADV_NAME, services=[self._service_uuid])
+            print("Telemetry: subscriber", conn.device)
+            self._len = self._count = 0
+            self._limit = min(MAX_PAYLOAD, (conn.mtu or 23) - 3)   # mtu is None before an exchange
+            self._conn = conn
+            control = asyncio.create_task(self._control_loop())
+            flusher = asyncio.create_task(self._flush_loop())
+            await conn.disconnected(timeout_ms=None)
+            control.cancel()
+            flusher.cancel()
+            self._conn = None
+            print("Telemetry: subscriber gone")
+
+    async def _control_loop(self):
+        while True:
+            await self._control.written()
+            data = self._control.read()
+            if len(data) >= 3:
+                self.mask, self.batch, self.decimation = data[0], data[1], max(1, data[2])
+                # Any MTU exchange has completed by the time the client configures us.
+                self._limit = min(MAX_PAYLOAD, (self._conn.mtu or 23) - 3)
+                print("Telemetry: mask={:#x} batch={} decimation={} payload={}".format(
+                    self.mask, self.batch, self.decimation, self._limit))
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep_ms(FLUSH_MS)
+            self.flush()
+
+    @property
+    def subscribed(self):
+        """True while a subscriber is connected (light sleep would drop it)."""
+        return self._conn is not None
+
+    def _room(self, rtype):
+        """Make room for one record; returns the write offset or -1 if not wanted
+        or if it cannot fit one notification (before an MTU exchange a raw
+        frame is 23 B against a 20 B payload)."""
+        if self._conn is None or not self.mask & (1 << rtype):
+            return -1
+        size = frame_codec.record_size(rtype, self._n)
+        if size > self._limit:
+            self.oversize += 1
+            return -1
+        if self._len + size > self._limit:
+            self.flush()
+        return self._len
+
+    def _added(self, end):
+        self._len = end
+        self._count += 1
+        if self.batch and self._count >= self.batch:
+            self.flush()
+
+    def flush(self):
+        if self._len and self._conn is not None:
+            try:
+                self._data.notify(self._conn, self._mv[:self._len])
+                self.sent += 1
+                self.records += self._count
+            except Exception as e:
+                print("Telemetry: notify failed:", e)
+        self._len = self._count = 0
+
+    def frame(self, t, raw, normalized, analyzed):
+        """Queue one sensor frame (raw/normalized/metrics, per the mask and decimation)."""
+        if self._conn is None:
+            return
+        self._frame += 1
+        if self._frame % self.decimation:
+            return
+        off = self._room(REC_RAW)
+        if off >= 0:
+            self._added(frame_codec.pack_raw(self._buf, off, t, raw))
+        off = self._room(REC_NORM)
+        if off >= 0:
+            self._added(frame_codec.pack_norm(self._buf, off, t, normalized))
+        off = self._room(REC_METRICS)
+        if off >= 0:
+            self._added(frame_codec.pack_metrics(
+                self._buf, off, t, analyzed['insertion'], analyzed['focus'],
+                analyzed['center'], analyzed['active']))
+
+    def stroke(self, t_ms, raw, ema, emit_pos):
+        """Queue one detector sample (decimated like frames)."""
+        if self._conn is None:
+            return
+        self._sample += 1
+        if self._sample % self.decimation:
+            return
+        off = self._room(REC_STROKE)
+        if off >= 0:
+            self._added(frame_codec.pack_stroke(self._buf, off, t_ms, raw, ema, emit_pos))
+
+    def emit(self, t_ms, pos, interval_ms):
+        """Queue an emit event (never decimated)."""
+        off = self._room(REC_EMIT)
+        if off >= 0:
+            self._added(frame_codec.pack_emit(self._buf, off, t_ms, pos, interval_ms))
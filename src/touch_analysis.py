@@ -1,57 +1,293 @@
 """touch_analysis.py - Calibration and analysis of multi-touch sensor values.
 
-Provides normalization using persistent calibration data, and derives:
+Provides normalization using persistent calibration profiles, and derives:
   - insertion: fraction of sensors actively engaged
   - focus: concentration of activity (higher when fewer sensors active)
   - center: weighted-average position of activity along the shaft (0=base, 1=tip)
+  - depth: covered length from the tip, interpolated within the boundary electrode
 """
 
 import asyncio
-from time import ticks_ms, ticks_diff
+import os
+from time import ticks_ms, ticks_diff, ticks_us
+import profiler
+import rtc_state
+from cal_profiles import (ProfileStore, DEFAULT_PROFILE, profile_size, pack_profile,
+                          unpack_profile, profile_name)
 
 try:
     import ujson as json
 except ImportError:
     import json
 
-CALIBRATION_FILE = '/calibration.json'
+CALIBRATION_FILE = '/calibration.json'   # legacy/imported format; see _import_json
 ACTIVE_THRESHOLD = 0.1   # normalized value to consider a sensor "active"
+PROFILE_MATCH_FRAMES = 4 # idle frames averaged to pick a calibration profile at boot
+
+# Baseline drift tracking (see BaselineTracker)
+BASELINE_RISE_STEP  = 1        # raw counts an idle baseline may climb per frame
+BASELINE_FALL_SHIFT = 2        # falling baseline closes 1/2**shift of the gap per frame
+BASELINE_HOLDOFF    = 20       # inactive frames required before a channel adapts again
+BASELINE_SAVE_DELTA = 200      # raw counts of accumulated drift worth persisting
+BASELINE_SAVE_MS    = 600_000  # minimum interval between calibration writes (flash wear)
+
+# Automatic calibration (see TouchAnalyzer.auto_calibrate)
+CAL_REST_FRAMES    = 200    # consecutive quiet frames that make up the rest phase
+CAL_TOUCH_SIGMAS   = 8      # deviation (in rest sigmas) that counts as handling
+CAL_TOUCH_MIN      = 300    # ...but never less than this many raw counts
+CAL_PEAK_RANK      = 8      # robust peak = CAL_PEAK_RANK-th largest handling sample
+CAL_NOISE_SIGMAS   = 4      # per-channel active threshold = this many sigmas of noise
+CAL_THRESHOLD_MIN  = 0.03   # floor for the measured per-channel active threshold
+
+
+class BaselineTracker:
+    """Incremental per-channel idle-baseline follower.
+
+    Tracks temperature/humidity/cover drift by nudging the calibration offsets
+    in place.  A channel adapts only after it has been inactive (normalized
+    value below the active threshold) for BASELINE_HOLDOFF frames:
+      - raw below offset:  offset falls quickly toward it (minimum follower)
+      - raw above offset:  offset climbs by at most BASELINE_RISE_STEP per frame
+    so a slow drift is absorbed while a touch, which makes the channel
+    active and freezes it, is not.
+    """
+
+    def __init__(self, offsets):
+        self._offsets = offsets
+        self._saved = list(offsets)
+        self._idle = [0] * len(offsets)
+        self._last_save = ticks_ms()
+
+    def update(self, raw_values, normalized, thresholds, channels=None):
+        """Adapt offsets from one frame; returns True if they should be persisted.
+
+        channels - indices freshly read this frame (None = all); carried-forward
+                   values are skipped so a stale reading is not counted twice.
+        """
+        offsets = self._offsets
+        idle = self._idle
+        for i in (range(len(offsets)) if channels is None else channels):
+            if normalized[i] >= thresholds[i]:
+                idle[i] = 0
+                continue
+            if idle[i] < BASELINE_HOLDOFF:
+                idle[i] += 1
+                continue
+            gap = raw_values[i] - offsets[i]
+            if gap < 0:
+                offsets[i] += gap >> BASELINE_FALL_SHIFT
+            elif gap > 0:
+                offsets[i] += min(gap, BASELINE_RISE_STEP)
+        if ticks_diff(ticks_ms(), self._last_save) < BASELINE_SAVE_MS:
+            return False
+        saved = self._saved
+        for i in range(len(offsets)):
+            if abs(offsets[i] - saved[i]) >= BASELINE_SAVE_DELTA:
+                return True
+        return False
+
+    def mark_saved(self):
+        self._saved = list(self._offsets)
+        self._last_save = ticks_ms()
+
+
+class ChannelFilter:
+    """Per-channel filter on raw values, ahead of normalization.
+
+    mode 'median': running median over the last `window` readings; removes
+                   single-frame spikes at a cost of window // 2 frames of delay
+    mode 'iir':    first-order low-pass, y += (x - y) >> shift, in integer counts
+    State lives in preallocated per-channel lists updated in place; only the
+    channels read this frame are advanced, so carried-forward values are not
+    counted twice.
+    """
+
+    def __init__(self, num_pins, mode, window=3, shift=1):
+        if mode not in ('median', 'iir'):
+            raise ValueError("unknown filter mode: {}".format(mode))
+        self.mode = mode
+        self._n = num_pins
+        self._shift = shift
+        self.out = [0] * num_pins           # filtered values
+        self._primed = [False] * num_pins
+        if mode == 'median':
+            self._window = window
+            self._history = [[0] * window for _ in range(num_pins)]
+            self._pos = [0] * num_pins
+            self._scratch = [0] * window
+
+    def update(self, raw_values, channels=None):
+        """Advance the filter with one frame; returns the filtered values (self.out)."""
+        out = self.out
+        primed = self._primed
+        median = self.mode == 'median'
+        for i in (range(self._n) if channels is None else channels):
+            x = raw_values[i]
+            if not primed[i]:
+                primed[i] = True
+                out[i] = x
+                if median:
+                    h = self._history[i]
+                    for j in range(self._window):
+                        h[j] = x
+                continue
+            if not median:
+                out[i] += (x - out[i]) >> self._shift
+                continue
+            h = self._history[i]
+            pos = self._pos[i]
+            h[pos] = x
+            self._pos[i] = (pos + 1) % self._window
+            if self._window == 3:
+                a, b, c = h[0], h[1], h[2]
+                if a > b:
+                    a, b = b, a
+                out[i] = a if c < a else (b if c > b else c)
+            else:
+                scratch = self._scratch
+                for j in range(self._window):
+                    scratch[j] = h[j]
+                scratch.sort()
+                out[i] = scratch[self._window // 2]
+        return out
 
 
 class TouchAnalyzer:
     """Wraps a MultiTouchSensor to add calibration, normalization, and metrics."""
 
-    def __init__(self, sensor, active_threshold=ACTIVE_THRESHOLD):
+    def __init__(self, sensor, active_threshold=ACTIVE_THRESHOLD, prefilter=None,
+                 hysteresis=0.0, resume=False):
+        """
+        prefilter  - optional ChannelFilter applied to raw values before normalize()
+        hysteresis - a channel becomes active only at threshold * (1 + hysteresis)
+                     and stays active until it drops below its threshold; while
+                     inactive, values under the upper level read as 0.0 (0 = off)
+        resume     - take the calibration cached in RTC memory, if any, instead of
+                     reading the profile store (use after a deep-sleep wake)
+        """
         self._sensor = sensor
         self._n = sensor.num_pins
         self._active_threshold = active_threshold
+        self._prefilter = prefilter
+        self._hysteresis = hysteresis
+        self._gate_open = [False] * self._n
         self._offsets = [27000] * self._n   # idle baseline per sensor
         self._scales  = [12000] * self._n   # touch range per sensor
-        self._calibrated = self._load_calibration()
+        self._noise   = None                # rest-phase sigma per sensor (raw counts)
+        self._thresholds = [active_threshold] * self._n  # per-sensor active level
+        self._store = None                  # ProfileStore, opened on first use
+        self._center = 0.0                  # last defined center of activity
+        self._calibrated = (resume and self._load_cached()) or self._load_calibration()
+        self._baseline = BaselineTracker(self._offsets)
 
     # ------------------------------------------------------------------ #
     # Calibration                                                          #
     # ------------------------------------------------------------------ #
 
     def _load_calibration(self) -> bool:
+        """Select the calibration profile that best matches the idle sensors.
+
+        A CALIBRATION_FILE dropped onto the filesystem is imported into the
+        profile store first (and renamed), so the JSON parse only happens once.
+        """
+        self._profile = DEFAULT_PROFILE
+        names = self._open_store().names()
+        if not names:
+            print("No valid calibration found; using defaults.")
+            return False
+        if len(names) == 1:
+            name = names[0]
+        else:
+            idle = [0] * self._n
+            for _ in range(PROFILE_MATCH_FRAMES):
+                raw = self._sensor.read()
+                for i in range(self._n):
+                    idle[i] += raw[i]
+            name = self._store.closest([v / PROFILE_MATCH_FRAMES for v in idle])
+        self.use_profile(name)
+        return True
+
+    def _load_cached(self) -> bool:
+        """Apply the calibration cached in RTC memory by use_profile(); no flash access."""
+        data = rtc_state.get(rtc_state.CAL)
+        if data is None or len(data) != profile_size(self._n):
+            return False
+        name, profile = unpack_profile(self._n, data)
+        self._apply(name, profile)
+        print("Calibration profile:", name, "(cached)")
+        return True
+
+    def cache_calibration(self):
+        """Copy the active calibration, with current baseline offsets, to RTC memory."""
+        buf = bytearray(profile_size(self._n))
+        pack_profile(self._n, buf, 0, self._profile,
+                     (self._offsets, self._scales, self._noise, self._thresholds))
+        rtc_state.put(rtc_state.CAL, buf)
+
+    def _open_store(self):
+        if self._store is None:
+            self._store = ProfileStore(self._n)
+            self._import_json()
+        return self._store
+
+    def _import_json(self):
         try:
             with open(CALIBRATION_FILE, 'r') as f:
                 data = json.load(f)
-            self._offsets = data['offsets']
-            self._scales  = data['scales']
-            print("Calibration loaded.")
-            return True
-        except (OSError, KeyError, ValueError):
-            print("No valid calibration found; using defaults.")
-            return False
+            name = data.get('name', DEFAULT_PROFILE)
+            self._store.put(name, data['offsets'], data['scales'], data.get('noise'),
+                            data.get('thresholds') or self._thresholds)
+        except OSError:
+            return
+        except (KeyError, ValueError, TypeError):
+            print("Ignoring invalid", CALIBRATION_FILE)
+            return
+        self._store.save()
+        os.rename(CALIBRATION_FILE, CALIBRATION_FILE + '.imported')
+        print("Imported", CALIBRATION_FILE, "as profile", name)
+
+    def use_profile(self, name):
+        """Apply a stored calibration profile by name; ValueError if there is none."""
+        profile = self._open_store().get(name)
+        if profile is None:
+            raise ValueError("no calibration profile '{}' (have: {})".format(
+                name, ", ".join(self._store.names())))
+        self._apply(profile_name(name), profile)
+        self.cache_calibration()
+        print("Calibration profile:", name)
+
+    def _apply(self, name, profile):
+        offsets, scales, noise, thresholds = profile
+        self._profile = name
+        self._offsets = list(offsets)
+        self._scales = list(scales)
+        self._noise = noise
+        self._thresholds = list(thresholds)
+        self._baseline = BaselineTracker(self._offsets)
+        self._calibrated = True
+
+    def wake_threshold(self, channel, level):
+        """TouchPad.config() value that wakes on `level` (0-1) of a channel's range.
+
+        On the ESP32-S2/S3 the touch threshold is the rise above the pad's
+        benchmark, so it is a fraction of the calibrated scale.
+        """
+        return int(level * self._scales[channel])
 
-    def _save_calibration(self):
-        data = {'offsets': self._offsets, 'scales': self._scales}
-        with open(CALIBRATION_FILE, 'w') as f:
-            json.dump(data, f)
-        print("Calibration saved.")
+    def profiles(self):
+        """Names of the stored calibration profiles; the active one is marked with *."""
+        return [n + ('*' if n == self._profile else '') for n in self._open_store().names()]
 
-    async def calibrate(self, rest_ms=3000, handle_ms=10000, sample_interval_ms=50):
+    def _save_calibration(self):
+        store = self._open_store()
+        store.put(self._profile, self._offsets, self._scales, self._noise,
+                  self._thresholds)
+        store.save()
+        self.cache_calibration()
+        print("Calibration saved as profile", self._profile)
+
+    async def calibrate(self, rest_ms=3000, handle_ms=10000, sample_interval_ms=50,
+                        profile=None):
         """Two-phase calibration.
 
         Phase 1 (rest_ms):   set the device down and do not touch it.
@@ -63,7 +299,8 @@ class TouchAnalyzer:
           offset = minimum seen at rest  (idle baseline)
           scale  = peak during handling - offset  (full dynamic range)
 
-        Results are persisted to CALIBRATION_FILE.
+        Results are persisted to the profile store, under `profile` if given
+        (otherwise the active profile).
         """
         n = self._n
 
@@ -93,14 +330,128 @@ class TouchAnalyzer:
             await asyncio.sleep_ms(sample_interval_ms)
 
         self._offsets = list(rest_mins)
+        self._baseline = BaselineTracker(self._offsets)
         # Guard against a sensor that was never touched: floor scale at 1
         self._scales  = [max(1, handle_maxs[i] - rest_mins[i]) for i in range(n)]
+        self._noise = None
+        self._thresholds = [self._active_threshold] * n
 
         print("Calibration done.")
         print("  offsets:", self._offsets)
         print("  scales: ", self._scales)
+        if profile:
+            self._profile = profile_name(profile)
+        self._calibrated = True
         self._save_calibration()
 
+    async def auto_calibrate(self, rest_frames=CAL_REST_FRAMES, handle_ms=10000,
+                             timeout_ms=60000, profile=None):
+        """Non-interactive calibration at full scan rate.
+
+        Rest and handling phases are detected from the signal itself:
+          rest:   Welford running mean/variance per sensor over rest_frames
+                  consecutive frames; any frame that deviates by more than
+                  the touch margin restarts the phase.
+          handle: starts at the first frame above the touch margin and runs
+                  for handle_ms, keeping the CAL_PEAK_RANK largest samples
+                  per sensor so isolated spikes cannot set the scale.
+
+        offset = rest mean, scale = robust peak - offset, noise = rest sigma,
+        threshold = max(CAL_THRESHOLD_MIN, CAL_NOISE_SIGMAS * noise / scale).
+        Results are persisted like calibrate().  Returns False on timeout.
+        """
+        n = self._n
+        read = self._sensor.read
+
+        # --- Phase 1: rest (Welford) ---
+        print("Auto-calibration: set the device down - do not touch it.")
+        count = 0
+        mean = [0.0] * n
+        m2 = [0.0] * n
+        start = ticks_ms()
+        while count < rest_frames:
+            if ticks_diff(ticks_ms(), start) > timeout_ms:
+                print("Auto-calibration: device never at rest; aborted.")
+                return False
+            raw = read()
+            if count >= 10:
+                for i in range(n):
+                    sigma = (m2[i] / (count - 1)) ** 0.5
+                    if abs(raw[i] - mean[i]) > max(CAL_TOUCH_MIN, CAL_TOUCH_SIGMAS * sigma):
+                        # Moved or touched: start the rest phase again.
+                        count = 0
+                        mean = [0.0] * n
+                        m2 = [0.0] * n
+                        break
+                if count == 0:
+                    await asyncio.sleep_ms(0)
+                    continue
+            count += 1
+            for i in range(n):
+                d = raw[i] - mean[i]
+                mean[i] += d / count
+                m2[i] += d * (raw[i] - mean[i])
+            await asyncio.sleep_ms(0)
+        noise = [(m2[i] / (count - 1)) ** 0.5 for i in range(n)]
+        margins = [max(CAL_TOUCH_MIN, CAL_TOUCH_SIGMAS * sd) for sd in noise]
+        rest_rate = count * 1000 // max(1, ticks_diff(ticks_ms(), start))
+
+        # --- Phase 2: handle (top-K peaks) ---
+        print("Auto-calibration: rest captured; now pick up and handle the device.")
+        peaks = [[0] * CAL_PEAK_RANK for _ in range(n)]    # ascending per sensor
+        handle_start = None
+        start = ticks_ms()
+        while True:
+            now = ticks_ms()
+            if handle_start is None:
+                if ticks_diff(now, start) > timeout_ms:
+                    print("Auto-calibration: no handling detected; aborted.")
+                    return False
+            elif ticks_diff(now, handle_start) >= handle_ms:
+                break
+            raw = read()
+            for i in range(n):
+                v = raw[i]
+                top = peaks[i]
+                if v > top[0]:
+                    j = 1
+                    while j < CAL_PEAK_RANK and top[j] < v:
+                        top[j - 1] = top[j]
+                        j += 1
+                    top[j - 1] = v
+                if handle_start is None and v - mean[i] > margins[i]:
+                    handle_start = now
+                    print("Auto-calibration: handling detected ({} s).".format(
+                        handle_ms // 1000))
+            await asyncio.sleep_ms(0)
+
+        offsets = [round(m) for m in mean]
+        scales = []
+        for i in range(n):
+            span = peaks[i][0] - offsets[i]
+            if span <= margins[i]:
+                print("  sensor {} never touched; keeping scale {}".format(i, self._scales[i]))
+                span = self._scales[i]
+            scales.append(max(1, round(span)))
+        self._offsets = offsets
+        self._scales = scales
+        self._noise = [round(sd, 1) for sd in noise]
+        self._thresholds = [
+            round(max(CAL_THRESHOLD_MIN, CAL_NOISE_SIGMAS * noise[i] / scales[i]), 3)
+            for i in range(n)]
+        self._baseline = BaselineTracker(self._offsets)
+
+        print("Calibration done ({} rest frames/s).".format(rest_rate))
+        print("  offsets:   ", self._offsets)
+        print("  scales:    ", self._scales)
+        print("  noise:     ", self._noise)
+        print("  thresholds:", self._thresholds)
+        if profile:
+            self._profile = profile_name(profile)
+        self._calibrated = True
+        self._save_calibration()
+        return True
+
     # ------------------------------------------------------------------ #
     # Normalization                                                        #
     # ------------------------------------------------------------------ #
@@ -120,6 +471,34 @@ class TouchAnalyzer:
                 result.append(max(0.0, min(1.0, v)))
         return result
 
+    def gate(self, normalized):
+        """Apply activity hysteresis to normalized values in place."""
+        thresholds = self._thresholds
+        is_open = self._gate_open
+        up = 1.0 + self._hysteresis
+        for i in range(self._n):
+            v = normalized[i]
+            if is_open[i]:
+                if v < thresholds[i]:
+                    is_open[i] = False
+                    normalized[i] = 0.0
+            elif v >= thresholds[i] * up:
+                is_open[i] = True
+            else:
+                normalized[i] = 0.0
+
+    def track_baseline(self, raw_values, normalized, channels=None):
+        """Let idle channels follow baseline drift; persist it occasionally.
+
+        Uncalibrated, the drift is followed in RAM only: saving it would
+        store the default offsets and scales as a real "default" profile.
+        """
+        if self._baseline.update(raw_values, normalized, self._thresholds, channels) \
+                and self._calibrated:
+            print("Baseline drift:", self._offsets)
+            self._save_calibration()
+            self._baseline.mark_saved()
+
     async def read_normalized(self):
         """Read sensors and return a list of normalized [0.0, 1.0] values."""
         return self.normalize(await self._sensor.read_async())
@@ -138,6 +517,54 @@ class TouchAnalyzer:
         n = len(normalized)
         return sum(normalized) / n if n else 0.0
 
+    def active_count(self, normalized):
+        """Number of sensors at or above their active threshold."""
+        thresholds = self._thresholds
+        count = 0
+        for i in range(len(normalized)):
+            if normalized[i] >= thresholds[i]:
+                count += 1
+        return count
+
+    def edge(self, normalized):
+        """Index of the insertion boundary electrode, or -1 if there is none.
+
+        Insertion covers the shaft from the tip (sensor n-1) down, so the
+        boundary is the base-most active electrode whose neighbour towards
+        the tip is also active (or which is the tip electrode), and a lone
+        noisy electrode further down cannot move it.
+        """
+        thresholds = self._thresholds
+        last = len(normalized) - 1
+        for i in range(last + 1):
+            if normalized[i] >= thresholds[i] and \
+                    (i == last or normalized[i + 1] >= thresholds[i + 1]):
+                return i
+        return -1
+
+    def depth(self, normalized, edge=None):
+        """Covered length of the shaft from the tip [0.0, 1.0], continuous
+        between electrodes.
+
+        Electrodes between the boundary (see edge(); pass it if already
+        known) and the tip count as covered; the boundary electrode adds the
+        fraction of it that is covered, estimated as its value relative to
+        its neighbour towards the tip.  So the position moves smoothly across
+        each ring, and does not shrink with a lighter grip the way insertion
+        does.
+        """
+        if edge is None:
+            edge = self.edge(normalized)
+        if edge < 0:
+            return 0.0
+        n = len(normalized)
+        v = normalized[edge]
+        full = normalized[edge + 1] if edge < n - 1 else 1.0
+        if full < v:
+            full = v
+        frac = v / full if full > 0.0 else 0.0
+        return (n - 1 - edge + frac) / n
+
     def focus(self, normalized):
         """Focus level [0.0, 1.0].
 
@@ -152,14 +579,11 @@ class TouchAnalyzer:
         if n == 0:
             return 0.0
 
-        max_val = max(normalized)
-        if max_val < self._active_threshold:
+        num_active = self.active_count(normalized)
+        if num_active == 0:
             return 0.0          # nothing is happening
 
-        min_val = min(normalized)
-        spread = max_val - min_val  # contrast between most and least active
-
-        num_active = sum(1 for v in normalized if v >= self._active_threshold)
+        spread = max(normalized) - min(normalized)  # contrast between most and least active
 
         # concentration: 1.0 when only 1 sensor active, 0.0 when all active
         concentration = (1.0 - (num_active - 1) / (n - 1)) if n > 1 else 1.0
@@ -190,21 +614,54 @@ class TouchAnalyzer:
     # Convenience                                                          #
     # ------------------------------------------------------------------ #
 
-    async def analyze(self):
+    async def analyze(self, channels=None):
         """Read sensors and return a dict with all metrics.
 
+        channels - sensor indices to scan this frame (None = all); the others
+                   carry their previous reading forward and are left out of
+                   baseline tracking for this frame.
+
         Keys:
-          'normalized' - list of per-sensor normalized values
+          'raw'        - list of per-sensor raw values (unfiltered)
+          'normalized' - list of per-sensor normalized values (after the
+                         prefilter and hysteresis, if configured)
           'insertion'  - float [0, 1]
+          'depth'      - float [0, 1], interpolated covered length
           'focus'      - float [0, 1]
-          'center'     - float [0, 1]
+          'center'     - float [0, 1]; holds its last value while focus is 0
+          'active'     - number of sensors above their active threshold
+          'edge'       - index of the insertion boundary electrode (-1 if none)
+          'ages'       - ms since each value was read (only with a partial scan)
         """
-        normalized = await self.read_normalized()
+        raw = await self._sensor.read_async(channels)
+        t = ticks_us()
+        values = raw
+        if self._prefilter is not None:
+            values = self._prefilter.update(raw, channels)
+        normalized = self.normalize(values)
+        profiler.add("normalize", t)
+        t = ticks_us()
+        self.track_baseline(values, normalized, channels)
+        profiler.add("baseline", t)
+        t = ticks_us()
+        if self._hysteresis:
+            self.gate(normalized)
         focus = self.focus(normalized)
-        center = 0.0 if focus == 0.0 else self.center_of_activity(normalized)
-        return {
+        if focus != 0.0:
+            self._center = self.center_of_activity(normalized)
+        center = self._center
+        edge = self.edge(normalized)
+        result = {
+            'raw':        raw,
             'normalized': normalized,
             'insertion':  self.insertion(normalized),
+            'depth':      self.depth(normalized, edge),
             'focus':      focus,
-            'center':     center
+            'center':     center,
+            'active':     self.active_count(normalized),
+            'edge':       edge,
         }
+        if channels is not None:
+            result['ages'] = self._sensor.ages()
+        profiler.add("metrics", t)
+        return result
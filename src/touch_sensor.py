@@ -1,6 +1,8 @@
 import asyncio
 from machine import TouchPad, Pin
 from micropython import const
+from time import ticks_ms, ticks_us, ticks_diff, ticks_add, sleep_ms, sleep_us
+from frame_ring import FrameRing
 
 _NUM_PINS = const(9)
 _ALL_PINS = range(1, _NUM_PINS + 1)
@@ -18,18 +20,161 @@ class MultiTouchSensor:
         # Configure all the touch pins (1-9) on the ESP32 TinyS3 board
         for i, pin_num in enumerate(pins):
             self._touch_pins[i] = TouchPad(Pin(pin_num))
+        # Last value read from each pin; channels skipped by a partial read
+        # keep (carry forward) their previous value, stamped when it was read.
+        self._values = [0] * self.num_pins
+        self._read_ms = [ticks_ms()] * self.num_pins
 
     def read(self):
         # Read all the touch pins
         return [pin.read() for pin in self._touch_pins]
 
-    async def read_async(self):
-        # Read all the touch pins
-        retval = [] * self.num_pins
-        for pin in self._touch_pins:
-            retval.append(await _read_pin_async(pin))
-        return retval
+    def config_wake(self, channel, threshold):
+        # Set one pad's touch threshold, for esp32.wake_on_touch()
+        self._touch_pins[channel].config(threshold)
+
+    def read_into(self, buf):
+        # Read all the touch pins into a preallocated list/array
+        pins = self._touch_pins
+        for i in range(self._num_pins):
+            buf[i] = pins[i].read()
+
+    async def read_async(self, channels=None):
+        # Read the given channel indices (all pins if None); returns all values
+        pins = self._touch_pins
+        values = self._values
+        if channels is None:
+            channels = range(self.num_pins)
+        stamps = self._read_ms
+        for i in channels:
+            values[i] = await _read_pin_async(pins[i])
+            stamps[i] = ticks_ms()
+        return list(values)
+
+    def ages(self):
+        # Milliseconds since each value returned by read_async was read
+        now = ticks_ms()
+        return [ticks_diff(now, t) for t in self._read_ms]
 
     @property
     def num_pins(self):
         return self._num_pins
+
+
+class ThreadedSampler:
+    """Runs the touch scan on a _thread worker at a fixed period.
+
+    Frames (ticks_us stamp + raw values) go into a preallocated FrameRing that
+    the asyncio side drains, so BLE work, console output and other tasks in
+    the event loop no longer delay sampling.  Drop-in for MultiTouchSensor:
+    read_async() returns the newest complete frame (older queued frames are
+    counted as coalesced) and ignores partial-scan channel lists.
+
+    Counters (see report()): frames, ring overruns, coalesced frames, and
+    schedule jitter (how far each scan started from its slot).  The worker's
+    counters are only ever written by the worker; reset_stats() snapshots
+    them, and asks for a new jitter maximum through an epoch number.
+    """
+
+    def __init__(self, sensor, period_ms=20, capacity=16, poll_ms=5):
+        self._sensor = sensor
+        self._n = sensor.num_pins
+        self._period_us = period_ms * 1000
+        self._poll_ms = poll_ms
+        self._ring = FrameRing(self._n, capacity)
+        self._scan = [0] * self._n      # worker-owned scan buffer
+        self._latest = [0] * self._n    # consumer-owned newest frame
+        self._stamp = None
+        self._running = False
+        self._frames = 0                # worker-owned counters
+        self._jitter_sum = 0
+        self._jitter_max = 0
+        self._max_epoch = 0             # epoch _jitter_max belongs to
+        self._epoch = 0                 # consumer-owned: bumped to restart the max
+        self.reset_stats()
+
+    def start(self):
+        import _thread
+        self._running = True
+        _thread.start_new_thread(self._worker, ())
+
+    def stop(self):
+        self._running = False
+
+    def _worker(self):
+        ring = self._ring
+        buf = self._scan
+        period = self._period_us
+        due = ticks_us()
+        while self._running:
+            late = abs(ticks_diff(ticks_us(), due))
+            if self._max_epoch != self._epoch:
+                self._max_epoch = self._epoch
+                self._jitter_max = 0
+            if late > self._jitter_max:
+                self._jitter_max = late
+            self._jitter_sum += late
+            t = ticks_us()
+            self._sensor.read_into(buf)
+            ring.push(t, buf)
+            self._frames += 1
+            due = ticks_add(due, period)
+            wait = ticks_diff(due, ticks_us())
+            if wait < 0:
+                due = ticks_us()        # overran the period: resync, don't burst
+            else:
+                # sleep_us busy-waits holding the GIL on the ESP32; sleep_ms
+                # releases it, so only the sub-ms remainder spins.
+                if wait >= 1000:
+                    sleep_ms(wait // 1000)
+                sleep_us(wait % 1000)
+
+    def _drain(self):
+        ring = self._ring
+        got = 0
+        while True:
+            stamp = ring.pop(self._latest)
+            if stamp is None:
+                break
+            self._stamp = stamp
+            got += 1
+        if got > 1:
+            self._coalesced += got - 1
+        return got
+
+    def read(self):
+        if not self._running:
+            return self._sensor.read()
+        while not self._drain():
+            sleep_ms(1)
+        return list(self._latest)
+
+    async def read_async(self, channels=None):
+        while not self._drain():
+            await asyncio.sleep_ms(self._poll_ms)
+        return list(self._latest)
+
+    @property
+    def stamp_us(self):
+        """ticks_us() at which the frame last returned by a read was scanned."""
+        return self._stamp
+
+    @property
+    def num_pins(self):
+        return self._n
+
+    def reset_stats(self):
+        self._frames0 = self._frames
+        self._jitter_sum0 = self._jitter_sum
+        self._epoch += 1
+        self._coalesced = 0
+        self._overruns0 = self._ring.overruns
+
+    def report(self):
+        frames = self._frames - self._frames0
+        jitter = self._jitter_sum - self._jitter_sum0
+        print("sampler: {} frames  overruns {}  coalesced {}  jitter avg {} us max {} us".format(
+            frames, self._ring.overruns - self._overruns0, self._coalesced,
+            jitter // frames if frames else 0,
+            self._jitter_max if self._max_epoch == self._epoch else 0))
+        self.reset_stats()
@@ -0,0 +1,89 @@
+"""
+Check of baseline drift persistence in TouchAnalyzer.track_baseline().
+
+An analyzer that was never calibrated must follow idle drift in RAM only:
+no profile written to the store and nothing cached in RTC memory, so the
+next boot still knows it is uncalibrated.  Once calibrated, the same drift
+must be saved.  BASELINE_SAVE_MS is set to 0 so the first drifted frames
+qualify.
+
+Runs on CPython and the MicroPython unix port:
+    python test/baseline_check.py
+"""
+
+import sys
+import os
+
+_here = __file__.rsplit("/", 1)[0] if "/" in __file__ else "."
+sys.path.insert(0, _here + "/../tools")
+import desktop_shim
+desktop_shim.install()
+
+import asyncio
+import cal_profiles
+import rtc_state
+import touch_analysis
+
+NUM_PINS = 9
+PROFILE_FILE = "/tmp/baseline_check.bin"
+DRIFT = 1000                # raw counts the idle readings move by
+
+
+class DriftedSensor:
+    """Untouched sensor reading DRIFT counts above the default offsets."""
+    num_pins = NUM_PINS
+
+    def read(self):
+        return [27000 + DRIFT] * NUM_PINS
+
+    async def read_async(self, channels=None):
+        return self.read()
+
+
+def exists(path):
+    try:
+        os.stat(path)
+        return True
+    except OSError:
+        return False
+
+
+async def drift(a):
+    for _ in range(touch_analysis.BASELINE_HOLDOFF + 2 * DRIFT // touch_analysis.BASELINE_RISE_STEP):
+        await a.analyze()
+
+
+def main():
+    if exists(PROFILE_FILE):
+        os.remove(PROFILE_FILE)
+    cal_profiles.PROFILE_FILE = PROFILE_FILE
+    touch_analysis.CALIBRATION_FILE = "/nonexistent/baseline_check.json"
+    touch_analysis.BASELINE_SAVE_MS = 0
+    rtc_state.clear()
+    failures = 0
+
+    a = touch_analysis.TouchAnalyzer(DriftedSensor())
+    asyncio.run(drift(a))
+    if a._offsets[0] == 27000:
+        print("uncalibrated: offsets did not follow the drift")
+        failures += 1
+    if exists(PROFILE_FILE) or rtc_state.get(rtc_state.CAL) is not None:
+        print("uncalibrated: drift was persisted")
+        failures += 1
+    print("uncalibrated: {}".format("FAIL" if failures else "ok"))
+
+    before = failures
+    a._calibrated = True
+    a._offsets[:] = [27000] * NUM_PINS
+    asyncio.run(drift(a))
+    if not exists(PROFILE_FILE) or rtc_state.get(rtc_state.CAL) is None:
+        print("calibrated: drift was not persisted")
+        failures += 1
+    print("calibrated: {}".format("FAIL" if failures > before else "ok"))
+    if exists(PROFILE_FILE):
+        os.remove(PROFILE_FILE)
+    if failures:
+        sys.exit(1)
+
+
+main()
@@ -0,0 +1,97 @@
+"""
+Check of TouchAnalyzer.depth() against tip-first coverage.
+
+Insertion covers the shaft from the tip (sensor n-1) down.  This sweeps the
+covered length from nothing to the whole shaft in small steps, builds the
+normalized frame an evenly calibrated sensor would read (each electrode at
+the fraction of it that is covered), and requires depth to rise steadily:
+never falling, never jumping by more than one electrode between steps, and
+staying within half an electrode of the true length.  The sweep is repeated
+with a lighter grip (every value scaled down), within one electrode, and a
+lone noisy electrode near the base must not move depth until the covered
+length reaches its neighbour.
+
+Runs on CPython and the MicroPython unix port:
+    python test/depth_check.py
+"""
+
+import sys
+
+_here = __file__.rsplit("/", 1)[0] if "/" in __file__ else "."
+sys.path.insert(0, _here + "/../tools")
+import desktop_shim
+desktop_shim.install()
+
+import cal_profiles
+import touch_analysis
+
+NUM_PINS = 9
+STEPS = 20                  # sweep steps per electrode
+
+
+def make_analyzer():
+    # Keep calibration off the filesystem: defaults only.
+    cal_profiles.PROFILE_FILE = touch_analysis.CALIBRATION_FILE = '/nonexistent/depth_check'
+
+    class Idle:
+        num_pins = NUM_PINS
+
+        def read(self):
+            return [27000] * NUM_PINS
+
+    return touch_analysis.TouchAnalyzer(Idle())
+
+
+def frame(covered, grip=1.0, noisy=None):
+    """Normalized values with `covered` electrodes' worth of the shaft covered from the tip."""
+    values = []
+    for i in range(NUM_PINS):
+        c = covered - (NUM_PINS - 1 - i)
+        values.append(grip * (0.0 if c <= 0 else 1.0 if c >= 1 else c))
+    if noisy is not None:
+        values[noisy] = max(values[noisy], 0.5)
+    return values
+
+
+def sweep(a, label, tolerance, **kw):
+    """Sweep from uncovered to fully covered; tolerance is in electrodes."""
+    failures = 0
+    prev = 0.0
+    for k in range(NUM_PINS * STEPS + 1):
+        covered = k / STEPS
+        d = a.depth(frame(covered, **kw))
+        true = covered / NUM_PINS
+        if d < prev - 1e-9 or d - prev > 1.0 / NUM_PINS + 1e-9 or \
+                abs(d - true) > tolerance / NUM_PINS:
+            print("{}: covered {:.2f} electrodes: depth {:.3f} after {:.3f} (true {:.3f})".format(
+                label, covered, d, prev, true))
+            failures += 1
+        prev = d
+    print("{}: {}".format(label, "FAIL" if failures else "ok"))
+    return failures
+
+
+def lone_noise(a, noisy):
+    """A noisy electrode whose tip-side neighbour is uncovered must not move depth."""
+    failures = 0
+    for k in range((NUM_PINS - 2 - noisy) * STEPS + 1):
+        covered = k / STEPS
+        clean, d = a.depth(frame(covered)), a.depth(frame(covered, noisy=noisy))
+        if d != clean:
+            print("noise at sensor {}: covered {:.2f} electrodes: depth {:.3f}, {:.3f} without".format(
+                noisy, covered, d, clean))
+            failures += 1
+    print("noise at sensor {}: {}".format(noisy, "FAIL" if failures else "ok"))
+    return failures
+
+
+def main():
+    a = make_analyzer()
+    failures = sweep(a, "full grip", 0.5)
+    failures += sweep(a, "light grip", 1.0, grip=0.6)
+    failures += lone_noise(a, 1)
+    if failures:
+        sys.exit(1)
+
+
+main()
@@ -0,0 +1,82 @@
+"""
+Two-thread stress test for src/frame_ring.py (the ThreadedSampler ring).
+
+A producer thread pushes frames whose values encode a sequence number while
+the main thread pops them concurrently.  Every frame popped must be
+internally consistent (all values from the same push, i.e. no torn slots) and
+sequence numbers must strictly increase, with any gaps exactly accounted for
+by the ring's overrun counter.  Two rounds run: one where the producer pushes
+flat out (overruns expected), and a lossless one where it waits for space
+(every frame must arrive, wrapping the ring many times).
+
+Runs on the MicroPython unix port and on CPython:
+    micropython test/frame_ring_stress.py [frames]
+    python test/frame_ring_stress.py [frames]
+"""
+
+import sys
+import _thread
+
+_here = __file__.rsplit("/", 1)[0] if "/" in __file__ else "."
+sys.path.insert(0, _here + "/../src")
+from frame_ring import FrameRing
+
+if hasattr(sys, "setswitchinterval"):
+    sys.setswitchinterval(1e-6)     # CPython: force frequent thread switches
+
+NUM_VALUES = 9
+CAPACITY = 16
+
+
+def run(total, lossless):
+    ring = FrameRing(NUM_VALUES, CAPACITY)
+    done = [False]
+
+    def producer():
+        frame = [0] * NUM_VALUES
+        for seq in range(1, total + 1):
+            for i in range(NUM_VALUES):
+                frame[i] = seq * 16 + i
+            if lossless:
+                while len(ring) >= ring.capacity:
+                    pass
+            ring.push(seq, frame)
+        done[0] = True
+
+    _thread.start_new_thread(producer, ())
+
+    out = [0] * NUM_VALUES
+    last = 0
+    popped = 0
+    gaps = 0
+    torn = 0
+    while True:
+        stamp = ring.pop(out)
+        if stamp is None:
+            if done[0] and len(ring) == 0:
+                break
+            continue
+        popped += 1
+        for i in range(NUM_VALUES):
+            if out[i] != stamp * 16 + i:
+                torn += 1
+                break
+        if stamp <= last:
+            print("FAIL: sequence went backwards", last, "->", stamp)
+            sys.exit(1)
+        gaps += stamp - last - 1
+        last = stamp
+
+    gaps += total - last
+    print("{}: pushed {}  popped {}  overruns {}  gaps {}  torn {}".format(
+        "lossless" if lossless else "flat-out", total, popped, ring.overruns, gaps, torn))
+    ok = not torn and gaps == ring.overruns and popped + ring.overruns == total
+    return ok and not (lossless and ring.overruns)
+
+
+if __name__ == "__main__":
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    if not (run(total, False) and run(total, True)):
+        print("FAIL")
+        sys.exit(1)
+    print("OK")
@@ -3,30 +3,44 @@ OSSM BLE peripheral simulator for testing ble_remote.py without real hardware.
 
 Advertises the full OSSM GATT service profile (matching the C++ reference
 firmware) and prints every command written to the PRIMARY_COMMAND
-characteristic by the teledildonics device.
+characteristic by the teledildonics device.  Clock probes "sync:<seq>"
+(src/clock_sync.py) are answered with "sync:<seq>:<ms>", in the timebase of
+the log lines (ms since start), so tools/latency_join.py can line the log
+up with the device's.
 
 Usage:
     pip install bless
     python ossm_ble_sim.py
 
+    # No radio: serve the same command/state protocol over TCP (see
+    # src/tcp_transport.py).  Run several instances on different ports to
+    # simulate multiple OSSMs.
+    python ossm_ble_sim.py --tcp 7001
+
 Requirements:
     - Linux: BlueZ with bluetoothd running, or macOS with CoreBluetooth.
     - bless >= 0.2.1  (https://github.com/kevincar/bless)
+    (neither is needed for --tcp)
 """
 
+import argparse
 import asyncio
 import json
 import logging
 import time
 import uuid
 
-from bless import BlessServer, GATTCharacteristicProperties, GATTAttributePermissions
+_START = time.monotonic()
+
+
+def _sim_ms() -> int:
+    """Simulator clock: ms since start, the timebase of the log lines."""
+    return int((time.monotonic() - _START) * 1000)
+
 
 class _MsecFormatter(logging.Formatter):
-    _start = time.monotonic()
     def format(self, record):
-        ms = int((time.monotonic() - self._start) * 1000)
-        return f"{ms:>8}ms {record.levelname} {record.getMessage()}"
+        return f"{_sim_ms():>8}ms {record.levelname} {record.getMessage()}"
 
 _handler = logging.StreamHandler()
 _handler.setFormatter(_MsecFormatter())
@@ -85,14 +99,26 @@ _last_write: float | None = None
 _central_active = False
 _server: "BlessServer | None" = None
 _loop: "asyncio.AbstractEventLoop | None" = None
+_tcp_clients: "set[asyncio.StreamWriter]" = set()
 
 
 def _state_json() -> str:
     return json.dumps({"timestamp": int(time.monotonic() * 1000), **_state})
 
 
+def _tcp_notify(kind: str, text: str):
+    line = f"{kind} {text}\n".encode()
+    for writer in list(_tcp_clients):
+        try:
+            writer.write(line)
+        except Exception:
+            _tcp_clients.discard(writer)
+
+
 def _push_state():
     """Update the CURRENT_STATE characteristic value and notify."""
+    if _tcp_clients:
+        _tcp_notify("S", _state_json())
     if _server is None:
         return
     char = _server.get_characteristic(CURRENT_STATE_UUID)
@@ -160,12 +186,20 @@ def on_write(_characteristic, value: bytearray):
 
 
 async def _handle_async(cmd: str):
-    _handle_command(cmd)
-    # Echo response on COMMAND characteristic (matches reference firmware "ok:<cmd>")
+    if cmd.startswith("sync:"):
+        # Clock probe (src/clock_sync.py): answer with our clock, no state change.
+        reply = f"{cmd}:{_sim_ms()}"
+        logger.debug(f"clock probe {cmd!r}")
+    else:
+        _handle_command(cmd)
+        # Echo response on COMMAND characteristic (matches reference firmware "ok:<cmd>")
+        reply = f"ok:{cmd}"
+    if _tcp_clients:
+        _tcp_notify("C", reply)
     if _server:
         char = _server.get_characteristic(COMMAND_UUID)
         if char:
-            char.value = bytearray(f"ok:{cmd}".encode())
+            char.value = bytearray(reply.encode())
             _server.update_value(SERVICE_UUID, COMMAND_UUID)
 
 
@@ -193,8 +227,45 @@ async def state_heartbeat():
             _push_state()
 
 
+async def _tcp_client(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    global _central_active, _last_write
+    peer = writer.get_extra_info("peername")
+    logger.info(f"Central connected (tcp {peer})")
+    _tcp_clients.add(writer)
+    _central_active = True
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            _last_write = time.monotonic()
+            cmd = line.decode("utf-8", errors="replace").strip()
+            if cmd:
+                await _handle_async(cmd)
+    except ConnectionError:
+        pass
+    finally:
+        _tcp_clients.discard(writer)
+        _central_active = bool(_tcp_clients)
+        writer.close()
+        logger.info(f"Central disconnected (tcp {peer})")
+
+
+async def run_tcp(port: int):
+    """Serve the OSSM command/state protocol over TCP instead of BLE."""
+    server = await asyncio.start_server(_tcp_client, "127.0.0.1", port)
+    logger.info(f"OSSM TCP simulator listening on 127.0.0.1:{port}. Press Ctrl-C to stop.")
+    heartbeat = asyncio.ensure_future(state_heartbeat())
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        heartbeat.cancel()
+
+
 async def run():
     global _server, _loop
+    from bless import BlessServer, GATTCharacteristicProperties, GATTAttributePermissions
     _loop = asyncio.get_event_loop()
     _server = BlessServer(name="OSSM", loop=_loop)
     server = _server
@@ -274,4 +345,11 @@ async def run():
 
 
 if __name__ == "__main__":
-    asyncio.run(run())
+    parser = argparse.ArgumentParser(description="OSSM peripheral simulator")
+    parser.add_argument("--tcp", type=int, metavar="PORT",
+                        help="serve over TCP on 127.0.0.1:PORT instead of BLE")
+    args = parser.parse_args()
+    try:
+        asyncio.run(run_tcp(args.tcp) if args.tcp else run())
+    except KeyboardInterrupt:
+        pass
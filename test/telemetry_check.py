@@ -0,0 +1,92 @@
+"""
+Check that TelemetryService never notifies more than the payload limit.
+
+bluetooth and aioble are replaced by stand-ins that record notifications.
+A subscriber is attached with mtu=23 (no exchange yet: 20 B payloads), then
+mtu=None (aioble before an exchange), then mtu=247.  Every notification must
+fit the payload, raw frames (23 B for nine sensors) must be dropped and
+counted while they cannot fit, and sent once they can.
+
+Runs on CPython:
+    python test/telemetry_check.py
+"""
+
+import sys
+
+_here = __file__.rsplit("/", 1)[0] if "/" in __file__ else "."
+sys.path.insert(0, _here + "/../tools")
+import desktop_shim
+desktop_shim.install()
+
+import types
+
+NUM_PINS = 9
+notified = []
+
+
+class _Characteristic:
+    def __init__(self, service, uuid, **kw):
+        pass
+
+    def notify(self, conn, data):
+        notified.append(bytes(data))
+
+
+class _BLE:
+    def config(self, **kw):
+        pass
+
+
+sys.modules["bluetooth"] = types.SimpleNamespace(BLE=_BLE, UUID=str)
+sys.modules["aioble"] = types.SimpleNamespace(
+    Service=lambda uuid: None, Characteristic=_Characteristic,
+    register_services=lambda *services: None)
+
+import frame_codec
+import telemetry
+from frame_codec import REC_RAW, REC_METRICS
+
+
+class Conn:
+    def __init__(self, mtu):
+        self.mtu = mtu
+
+
+def run(mtu, frames=20):
+    svc = telemetry.TelemetryService(NUM_PINS)
+    conn = Conn(mtu)
+    svc._conn = conn
+    svc._limit = min(telemetry.MAX_PAYLOAD, (conn.mtu or 23) - 3)     # as run() does
+    svc.mask = (1 << REC_RAW) | (1 << REC_METRICS)
+    del notified[:]
+    analyzed = {'insertion': 0.5, 'focus': 0.2, 'center': 0.7, 'active': 3}
+    for t in range(frames):
+        svc.frame(t, [27000 + t] * NUM_PINS, [0.5] * NUM_PINS, analyzed)
+    svc.flush()
+    raw = 0
+    for data in notified:
+        off = 0
+        while off < len(data):
+            rtype = data[off]
+            raw += rtype == REC_RAW
+            off += frame_codec.record_size(rtype, NUM_PINS)
+    failures = 0
+    biggest = max(len(d) for d in notified) if notified else 0
+    if biggest > svc._limit:
+        print("mtu={}: {} B notification over the {} B limit".format(mtu, biggest, svc._limit))
+        failures += 1
+    fits = frame_codec.record_size(REC_RAW, NUM_PINS) <= svc._limit
+    if (raw, svc.oversize) != ((frames, 0) if fits else (0, frames)):
+        print("mtu={}: {} raw records sent, {} dropped as oversize".format(mtu, raw, svc.oversize))
+        failures += 1
+    print("mtu={}: {}".format(mtu, "FAIL" if failures else "ok"))
+    return failures
+
+
+def main():
+    failures = run(23) + run(None) + run(247)
+    if failures:
+        sys.exit(1)
+
+
+main()
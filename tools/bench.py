@@ -0,0 +1,356 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks for the per-frame firmware code, on CPython or MicroPython.
+
+Times TouchAnalyzer.normalize / focus / center_of_activity / depth / analyze,
+StrokeDetector.update, SignalBank.dispatch, Recorder.frame (flash writes
+amortized; files go to REC_BENCH_DIR) and Queue put/get on a synthetic stroke
+session (or raw frames from a frame_codec capture), and reports per benchmark:
+  us/op    best mean over --repeat runs
+  B/op     MicroPython: heap bytes allocated per op (GC disabled while measured)
+           CPython:     peak transient bytes per op (tracemalloc)
+Allocation figures are only comparable within one interpreter, and so are
+timings: keep one baseline file per interpreter (and per machine).
+
+Usage:
+  python tools/bench.py [--capture session.bin] [--save out.json]
+                        [--baseline base.json] [--tolerance 0.1] [--repeat 5]
+  micropython tools/bench.py ...          (MicroPython unix port)
+
+With --baseline, benchmarks that got slower than the baseline by more than
+--tolerance, or allocate more, are flagged and the exit status is 1.
+"""
+
+import sys
+import gc
+import math
+
+import desktop_shim
+desktop_shim.install()
+
+import asyncio
+from time import ticks_us, ticks_diff
+
+try:
+    import ujson as json
+except ImportError:
+    import json
+
+import cal_profiles
+import frame_codec
+import touch_analysis
+from recorder import Recorder
+from stroke_detector import StrokeDetector, SignalBank
+from queue import Queue
+from config import (STROKE_EMA_ALPHA, STROKE_MIN_AMPLITUDE, STROKE_STOPPED_WINDOW,
+                    STROKE_STOPPED_THRESHOLD, STROKE_PEAK_HISTORY,
+                    SIGNAL_EMA_ALPHA, SIGNAL_DEADBAND, SIGNAL_MIN_MS)
+
+NUM_PINS = 9
+SYNTH_FRAMES = 500          # 10 s at 50 frames/s
+OPS = 2000                  # ops per timed run
+ALLOC_OPS = 100             # ops per allocation measurement
+QUEUE_ITEMS = 500           # items per async producer/consumer run
+BANK_SIGNALS = (("center", "depth", 30, 100), ("focus", "stroke", 40, 100))
+REC_BENCH_DIR = "/tmp/bench_rec"
+
+
+# ---------------------------------------------------------------------- #
+# Inputs                                                                   #
+# ---------------------------------------------------------------------- #
+
+def synthetic_frames(count=SYNTH_FRAMES):
+    """Stroke session: the length touched from the tip follows a 1.2 s sine, with noise.
+
+    Uses its own LCG so both interpreters see identical frames.
+    """
+    seed = 12345
+    frames = []
+    for k in range(count):
+        depth = 4.5 + 4.5 * math.sin(2 * math.pi * k / 60)
+        frame = []
+        for i in range(NUM_PINS):
+            seed = (seed * 1103515245 + 12345) & 0x7FFFFFFF
+            v = 27000 + (seed >> 16) % 61 - 30
+            cover = depth - (NUM_PINS - 1 - i)     # covered from the tip down
+            if cover > 0:
+                v += int(9000 * (cover if cover < 1 else 1))
+            frame.append(v)
+        frames.append(frame)
+    return frames
+
+
+def capture_frames(path):
+    with open(path, 'rb') as f:
+        n, records = frame_codec.read_capture(f.read())
+    if n != NUM_PINS:
+        raise SystemExit("capture has {} sensors, expected {}".format(n, NUM_PINS))
+    frames = [list(fields) for rtype, _, fields in records if rtype == frame_codec.REC_RAW]
+    if not frames:
+        raise SystemExit("capture has no raw frames (record with --records raw)")
+    return frames
+
+
+class ReplaySensor:
+    """Sensor stand-in that returns the given frames in a loop without waiting."""
+
+    def __init__(self, frames):
+        self.num_pins = NUM_PINS
+        self._frames = frames
+        self._i = 0
+
+    def read(self):
+        frame = self._frames[self._i]
+        self._i = (self._i + 1) % len(self._frames)
+        return frame
+
+    async def read_async(self, channels=None):
+        return self.read()
+
+    def ages(self):
+        return [0] * NUM_PINS
+
+
+def make_analyzer(frames, prefilter=None, hysteresis=0.0):
+    # Keep calibration off the filesystem: defaults, then calibrated offsets.
+    cal_profiles.PROFILE_FILE = touch_analysis.CALIBRATION_FILE = '/nonexistent/bench'
+    a = touch_analysis.TouchAnalyzer(ReplaySensor(frames), prefilter=prefilter,
+                                     hysteresis=hysteresis)
+    a._offsets[:] = [27000] * NUM_PINS
+    a._scales[:] = [9000] * NUM_PINS
+    a._save_calibration = lambda: None
+    return a
+
+
+def run_sync(coro):
+    """Run a coroutine that never suspends (ReplaySensor) without an event loop."""
+    try:
+        coro.send(None)
+    except StopIteration as e:
+        return e.value
+    raise RuntimeError("coroutine suspended")
+
+
+# ---------------------------------------------------------------------- #
+# Measurement                                                              #
+# ---------------------------------------------------------------------- #
+
+def time_op(op, repeat):
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        t = ticks_us()
+        for i in range(OPS):
+            op(i)
+        us = ticks_diff(ticks_us(), t) / OPS
+        if best is None or us < best:
+            best = us
+    return best
+
+
+def alloc_op(op):
+    gc.collect()
+    if desktop_shim.MICROPYTHON:
+        gc.disable()
+        before = gc.mem_alloc()
+        for i in range(ALLOC_OPS):
+            op(i)
+        used = gc.mem_alloc() - before
+        gc.enable()
+        return used / ALLOC_OPS
+    import tracemalloc
+    tracemalloc.start()
+    op(0)                           # warm caches outside the measurement
+    peak = 0
+    for i in range(ALLOC_OPS):
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        op(i)
+        used = tracemalloc.get_traced_memory()[1] - before
+        if used > peak:
+            peak = used
+    tracemalloc.stop()
+    return peak
+
+
+def queue_async(repeat):
+    """Producer/consumer through a maxsize=4 Queue; returns (us per item, B per item)."""
+
+    async def pair():
+        q = Queue(maxsize=4)
+
+        async def produce():
+            for i in range(QUEUE_ITEMS):
+                await q.put((i, 400))
+
+        async def consume():
+            for _ in range(QUEUE_ITEMS):
+                await q.get()
+
+        t = ticks_us()
+        await asyncio.gather(produce(), consume())
+        return ticks_diff(ticks_us(), t) / QUEUE_ITEMS
+
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        us = asyncio.run(pair())
+        if best is None or us < best:
+            best = us
+    gc.collect()
+    before = gc.mem_alloc() if desktop_shim.MICROPYTHON else 0
+    if desktop_shim.MICROPYTHON:
+        gc.disable()
+        asyncio.run(pair())
+        used = (gc.mem_alloc() - before) / QUEUE_ITEMS
+        gc.enable()
+    else:
+        used = None                 # asyncio's own loop allocations dominate
+    return best, used
+
+
+def benchmarks(frames):
+    a = make_analyzer(frames)
+    normalized = [a.normalize(f) for f in frames]
+    insertion = [int(a.insertion(v) * 100) for v in normalized]
+    n = len(frames)
+    detector = StrokeDetector(STROKE_EMA_ALPHA, STROKE_MIN_AMPLITUDE,
+                              STROKE_STOPPED_WINDOW, STROKE_STOPPED_THRESHOLD,
+                              STROKE_PEAK_HISTORY)
+    analyzed = [run_sync(a.analyze()) for _ in frames]
+    bank = SignalBank(BANK_SIGNALS, SIGNAL_EMA_ALPHA, SIGNAL_DEADBAND, SIGNAL_MIN_MS)
+
+    class Written:
+        """Fleet stand-in: every setting offered is written at once."""
+        now = 0
+
+        def offer_setting(self, key, value):
+            bank.mark_sent(key, value, self.now)
+
+    written = Written()
+
+    def bank_update(i):
+        written.now = i * 20
+        bank.dispatch(written, analyzed[i % n], written.now)
+
+    rec = Recorder(NUM_PINS, max_bps=1 << 30, path=REC_BENCH_DIR)
+
+    def recorder_frame(i):
+        r = analyzed[i % n]
+        rec.frame(i * 20, r["raw"], r["normalized"], r)
+
+    q = Queue(maxsize=4)
+    item = (50, 400)
+
+    def queue_nowait(i):
+        q.put_nowait(item)
+        q.get_nowait()
+
+    return [
+        ("normalize", lambda i: a.normalize(frames[i % n])),
+        ("focus", lambda i: a.focus(normalized[i % n])),
+        ("center_of_activity", lambda i: a.center_of_activity(normalized[i % n])),
+        ("depth", lambda i: a.depth(normalized[i % n])),
+        ("analyze", lambda i: run_sync(a.analyze())),
+        ("stroke_update", lambda i: detector.update(insertion[i % n])),
+        ("signal_bank", bank_update),
+        ("recorder_frame", recorder_frame),
+        ("queue_nowait", queue_nowait),
+    ]
+
+
+def run(frames, repeat):
+    results = {}
+    ops = benchmarks(frames)
+    print("{:<20} {:>10} {:>10}".format("benchmark", "us/op", "B/op"))
+    for name, op in ops:
+        op(0)
+        results[name] = {"us_per_op": round(time_op(op, repeat), 3),
+                         "bytes_per_op": round(alloc_op(op), 1)}
+        print_row(name, results[name])
+    us, used = queue_async(repeat)
+    results["queue_async"] = {"us_per_op": round(us, 3),
+                              "bytes_per_op": None if used is None else round(used, 1)}
+    print_row("queue_async", results["queue_async"])
+    return results
+
+
+def print_row(name, r, base=None, flag=""):
+    b = "-" if r["bytes_per_op"] is None else "{:.1f}".format(r["bytes_per_op"])
+    line = "{:<20} {:>10.2f} {:>10}".format(name, r["us_per_op"], b)
+    if base is not None:
+        line += "   base {:>9.2f} us ({:+.0f}%)  {}".format(
+            base["us_per_op"], 100 * (r["us_per_op"] / base["us_per_op"] - 1), flag)
+    print(line)
+
+
+def compare(results, baseline, tolerance):
+    """Print results against a baseline; returns the number of regressions."""
+    if baseline.get("interpreter") != interpreter():
+        print("warning: baseline is from", baseline.get("interpreter"))
+    regressions = 0
+    print("\n{:<20} {:>10} {:>10}".format("vs baseline", "us/op", "B/op"))
+    for name in sorted(results):
+        r = results[name]
+        base = baseline["results"].get(name)
+        if base is None:
+            print_row(name, r, None)
+            continue
+        flags = []
+        if r["us_per_op"] > base["us_per_op"] * (1 + tolerance):
+            flags.append("SLOWER")
+        if (r["bytes_per_op"] is not None and base["bytes_per_op"] is not None
+                and r["bytes_per_op"] > base["bytes_per_op"] + max(8, base["bytes_per_op"] * tolerance)):
+            flags.append("MORE ALLOC")
+        regressions += len(flags) > 0
+        print_row(name, r, base, " ".join(flags))
+    return regressions
+
+
+def interpreter():
+    impl = sys.implementation
+    return "{} {}".format(impl.name, ".".join(str(v) for v in impl.version[:3]))
+
+
+def parse_args(argv):
+    opts = {"capture": None, "save": None, "baseline": None, "tolerance": 0.1, "repeat": 5}
+    i = 0
+    while i < len(argv):
+        key = argv[i][2:].replace("-", "_") if argv[i].startswith("--") else None
+        if key not in opts or i + 1 >= len(argv):
+            raise SystemExit(__doc__)
+        value = argv[i + 1]
+        opts[key] = float(value) if key == "tolerance" else int(value) if key == "repeat" else value
+        i += 2
+    return opts
+
+
+def main():
+    opts = parse_args(sys.argv[1:])
+    if opts["capture"]:
+        frames = capture_frames(opts["capture"])
+        source = opts["capture"]
+    else:
+        frames = synthetic_frames()
+        source = "synthetic"
+    print("{}, {} frames from {}".format(interpreter(), len(frames), source))
+    results = run(frames, opts["repeat"])
+    out = {"interpreter": interpreter(), "input": source, "results": results}
+    if opts["save"]:
+        with open(opts["save"], "w") as f:
+            try:
+                f.write(json.dumps(out, indent=1))
+            except TypeError:       # MicroPython json has no indent
+                f.write(json.dumps(out))
+        print("saved", opts["save"])
+    if opts["baseline"]:
+        with open(opts["baseline"]) as f:
+            baseline = json.loads(f.read())
+        regressions = compare(results, baseline, opts["tolerance"])
+        if regressions:
+            print("{} regression(s)".format(regressions))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
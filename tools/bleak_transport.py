@@ -0,0 +1,75 @@
+"""
+OSSM link for host tools: ble_remote's transport interface over bleak.
+
+Lets OSSMRemote (and OSSMFleet) run under CPython via desktop_shim and drive
+a real OSSM from the desktop's Bluetooth adapter.  Import after
+desktop_shim.install().
+"""
+
+import asyncio
+
+from ble_remote import _SERVICE_UUID, _COMMAND_UUID, _STATE_UUID, SCAN_DURATION_MS
+
+
+class BleakTransport:
+    """Transport with the same interface as ble_remote.BLETransport."""
+
+    def __init__(self):
+        self._client = None
+        self._states = asyncio.Queue()
+        self._echoes = asyncio.Queue()
+        self.address = None
+
+    async def open(self, exclude=()):
+        from bleak import BleakClient, BleakScanner
+
+        self._client = None
+        self.address = None
+        print("Bleak: scanning for OSSM...")
+        devices = await BleakScanner.discover(
+            timeout=SCAN_DURATION_MS / 1000, service_uuids=[_SERVICE_UUID])
+        for device in devices:
+            if device.address in exclude:
+                continue
+            print(f"Bleak: found OSSM at {device.address}")
+            client = BleakClient(device)
+            try:
+                await client.connect()
+            except Exception as e:
+                print(f"Bleak: connect failed: {e}")
+                return False
+            self._client = client
+            self._states = asyncio.Queue()
+            self._echoes = asyncio.Queue()
+            self.address = device.address
+            return True
+        print("Bleak: no OSSM found")
+        return False
+
+    async def write(self, data, response=False):
+        await self._client.write_gatt_char(_COMMAND_UUID, data, response=response)
+
+    async def subscribe_state(self):
+        await self._client.start_notify(
+            _STATE_UUID, lambda _, data: self._states.put_nowait(bytes(data)))
+
+    async def state(self, timeout_ms):
+        return await asyncio.wait_for(self._states.get(), timeout_ms / 1000)
+
+    async def subscribe_echo(self):
+        await self._client.start_notify(
+            _COMMAND_UUID, lambda _, data: self._echoes.put_nowait(bytes(data)))
+
+    async def echo(self, timeout_ms):
+        return await asyncio.wait_for(self._echoes.get(), timeout_ms / 1000)
+
+    def is_connected(self):
+        return self._client is not None and self._client.is_connected
+
+    async def close(self):
+        if self._client is not None:
+            try:
+                await self._client.disconnect()
+            except Exception:
+                pass
+        self._client = None
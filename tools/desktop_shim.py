@@ -0,0 +1,138 @@
+"""
+Desktop shim: lets the firmware modules in src/ import and run under CPython.
+
+Provides just enough of the MicroPython environment for the pipeline
+modules (touch_sensor, touch_analysis, stroke_detector, queue, ...):
+  - time.ticks_ms / ticks_us / ticks_diff / ticks_add / sleep_ms / sleep_us
+  - asyncio.sleep_ms
+  - micropython.const
+  - machine.Pin / TouchPad / RTC / lightsleep / deepsleep (fakes)
+  - gc.mem_alloc / mem_free (backed by tracemalloc, when tracing)
+
+Usage (from a tool in tools/):
+    import desktop_shim
+    desktop_shim.install()
+    import touch_sensor            # now resolves to src/touch_sensor.py
+
+Fake TouchPad values come from desktop_shim.touch_source, a callable
+(pin_number) -> raw value; replace it to drive the sensors.
+
+install(time_scale=K) runs the firmware's clock K times faster than the
+wall clock: ticks_* advance K ms per real ms and sleep_ms(ms) sleeps ms / K,
+so long sessions can be simulated in a fraction of the time.
+
+Under the MicroPython unix port install() only adds src/ to sys.path and
+fakes the hardware modules that port lacks.
+"""
+
+import sys
+import os
+import time
+
+try:
+    SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+except AttributeError:      # MicroPython unix port without os.path
+    SRC = (__file__.rsplit("/", 1)[0] if "/" in __file__ else ".") + "/../src"
+
+MICROPYTHON = sys.implementation.name == "micropython"
+
+
+def _idle_value(pin_num):
+    return 27000
+
+
+touch_source = _idle_value       # (pin_num) -> raw TouchPad value
+lightsleep_ms = 0                # total time the fake machine.lightsleep() slept
+
+
+class _Pin:
+    IN = 0
+    OUT = 1
+    PULL_UP = 2
+    PULL_DOWN = 3
+
+    def __init__(self, num, *args, **kwargs):
+        self.num = num
+
+    def value(self, *args):
+        return 1
+
+
+class _TouchPad:
+    def __init__(self, pin):
+        self._num = pin.num
+        self._threshold = 0
+
+    def read(self):
+        return int(touch_source(self._num))
+
+    def config(self, value):
+        self._threshold = value
+
+
+class _RTC:
+    _memory = b""
+
+    def memory(self, data=None):
+        if data is None:
+            return _RTC._memory
+        _RTC._memory = bytes(data)
+
+
+def _lightsleep(ms=0):
+    global lightsleep_ms
+    lightsleep_ms += ms
+    time.sleep(ms / 1000)
+
+
+def _deepsleep(ms=0):
+    raise SystemExit("machine.deepsleep()")
+
+
+class _Module:
+    def __init__(self, name, **attrs):
+        self.__name__ = name
+        for k, v in attrs.items():
+            setattr(self, k, v)
+
+
+def install(time_scale=1.0):
+    """Install the fakes and put src/ on sys.path.  Safe to call twice."""
+    if SRC in sys.path:
+        return
+    if not MICROPYTHON:
+        import asyncio
+        import gc
+        import tracemalloc
+        # Import everything that needs the stdlib `queue` before src/queue.py
+        # (Peter Hinch's asyncio Queue) takes over that name below.
+        import concurrent.futures  # noqa: F401
+        import logging.handlers    # noqa: F401
+
+        t0 = time.perf_counter_ns()
+        k = time_scale
+        time.ticks_ms = lambda: int((time.perf_counter_ns() - t0) * k) // 1_000_000
+        time.ticks_us = lambda: int((time.perf_counter_ns() - t0) * k) // 1_000
+        time.ticks_diff = lambda a, b: a - b
+        time.ticks_add = lambda a, b: a + b
+        time.sleep_ms = lambda ms: time.sleep(ms / 1000 / k)
+        time.sleep_us = lambda us: time.sleep(us / 1_000_000 / k)
+
+        async def sleep_ms(ms):
+            await asyncio.sleep(ms / 1000 / k)
+        asyncio.sleep_ms = sleep_ms
+
+        # Heap figures are only non-zero once a tool calls tracemalloc.start().
+        gc.mem_alloc = lambda: tracemalloc.get_traced_memory()[0]
+        gc.mem_free = lambda: 0
+
+        sys.modules["micropython"] = _Module("micropython", const=lambda x: x)
+
+    if "machine" not in sys.modules or not hasattr(sys.modules["machine"], "TouchPad"):
+        sys.modules["machine"] = _Module(
+            "machine", Pin=_Pin, TouchPad=_TouchPad, RTC=_RTC,
+            lightsleep=_lightsleep, deepsleep=_deepsleep,
+            reset_cause=lambda: 0, DEEPSLEEP_RESET=4)
+    sys.path.insert(0, SRC)
+    if not MICROPYTHON:
+        sys.modules.pop("queue", None)
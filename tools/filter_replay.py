@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Replay sensor frames through TouchAnalyzer with each prefilter setting.
+
+Shows what the per-channel prefilter (touch_analysis.ChannelFilter and the
+activity hysteresis) buys in noise and costs in latency, and whether the
+stroke detector's EMA can then be relaxed.  --signal picks the stroke signal
+(insertion, or the interpolated depth) that is scored and fed to the detector.
+
+Synthetic input (default) is a stroke session with still phases, generated
+clean and then with Gaussian noise plus occasional single-frame spikes.  A
+covered electrode reads --grip of its calibrated range, varied by +-10% per
+electrode, as with a lighter hold than during calibration.  The
+clean run through the unfiltered analyzer is the reference:
+  lag       delay (ms) that best aligns the filtered signal with the reference
+  err       RMS error of signal / center / focus vs the clean reference,
+            after removing that delay (so it measures noise, not latency)
+  spikes    frames whose (delay-aligned) signal is off by more than 0.05
+  emits     stroke detector events per EMA alpha (reference count in the header);
+            extra events are noise-triggered false strokes
+  us/frame  analyze() cost on this machine
+
+With --capture (raw frames from telemetry_client --records raw --save), there
+is no reference: err is replaced by the frame-to-frame jitter of the signal
+and lag is measured against the unfiltered run.
+
+Usage:
+  python tools/filter_replay.py [--signal depth] [--capture session.bin]
+                                [--noise 30] [--spikes 0.01]
+"""
+
+import argparse
+import math
+import random
+
+import desktop_shim
+desktop_shim.install()
+
+from time import ticks_us, ticks_diff
+
+import touch_analysis
+from stroke_detector import StrokeDetector
+from config import (STROKE_EMA_ALPHA, STROKE_MIN_AMPLITUDE, STROKE_STOPPED_WINDOW,
+                    STROKE_STOPPED_THRESHOLD, STROKE_PEAK_HISTORY)
+from bench import NUM_PINS, make_analyzer, run_sync, capture_frames
+
+FRAME_MS = 20
+POLL_EVERY = 5              # detector runs every 5th frame (100 ms), as on the device
+ALPHAS = (STROKE_EMA_ALPHA, 0.4, 0.6)
+MAX_LAG = 10                # frames searched for the best alignment
+
+# (label, prefilter mode, window, shift, hysteresis)
+CONFIGS = [
+    ("none",            None,     3, 1, 0.0),
+    ("median3",         "median", 3, 1, 0.0),
+    ("median5",         "median", 5, 1, 0.0),
+    ("iir>>1",          "iir",    3, 1, 0.0),
+    ("iir>>2",          "iir",    3, 2, 0.0),
+    ("hyst0.5",         None,     3, 1, 0.5),
+    ("median3+hyst0.5", "median", 3, 1, 0.5),
+]
+
+
+def depth_at(k):
+    """Length touched from the tip (electrodes) at frame k: strokes of varying speed with pauses."""
+    t = k * FRAME_MS / 1000
+    phase = t % 16
+    if phase < 6:
+        return 4.5 + 4.5 * math.sin(2 * math.pi * t / 1.2)
+    if phase < 8:
+        return 6.0
+    if phase < 14:
+        return 4.0 + 4.0 * math.sin(2 * math.pi * t / 2.0)
+    return 0.0
+
+
+def make_frames(count, noise, spikes, grip, seed=1):
+    rng = random.Random(seed)
+    gains = [9000 * grip * (1 + 0.1 * math.sin(3 * i)) for i in range(NUM_PINS)]
+    clean, noisy = [], []
+    for k in range(count):
+        depth = depth_at(k)
+        c = []
+        for i in range(NUM_PINS):
+            cover = depth - (NUM_PINS - 1 - i)     # covered from the tip down
+            c.append(27000 + (int(gains[i] * min(cover, 1)) if cover > 0 else 0))
+        n = []
+        for v in c:
+            v += int(rng.gauss(0, noise))
+            if rng.random() < spikes:
+                v += rng.choice((-1, 1)) * 3000
+            n.append(v)
+        clean.append(c)
+        noisy.append(n)
+    return clean, noisy
+
+
+def replay(frames, signal, mode=None, window=3, shift=1, hysteresis=0.0):
+    """Run every frame through analyze(); returns (signal, center, focus, us/frame)."""
+    prefilter = touch_analysis.ChannelFilter(NUM_PINS, mode, window, shift) if mode else None
+    a = make_analyzer(frames, prefilter, hysteresis)
+    ins, cen, foc = [], [], []
+    t = ticks_us()
+    for _ in frames:
+        r = run_sync(a.analyze())
+        ins.append(r[signal])
+        cen.append(r["center"])
+        foc.append(r["focus"])
+    us = ticks_diff(ticks_us(), t) / len(frames)
+    return ins, cen, foc, us
+
+
+def rms(signal, reference, lag=0):
+    """RMS difference after shifting `signal` back by `lag` frames."""
+    n = len(reference) - lag
+    return math.sqrt(sum((signal[i + lag] - reference[i]) ** 2 for i in range(n)) / n)
+
+
+def jitter(a):
+    return math.sqrt(sum((a[i] - a[i - 1]) ** 2 for i in range(1, len(a))) / (len(a) - 1))
+
+
+def best_lag(signal, reference):
+    """Frames by which `signal` trails `reference` (least squared error)."""
+    best, best_err = 0, None
+    n = len(reference) - MAX_LAG
+    for lag in range(MAX_LAG + 1):
+        err = sum((signal[i + lag] - reference[i]) ** 2 for i in range(n))
+        if best_err is None or err < best_err:
+            best, best_err = lag, err
+    return best
+
+
+def emits(signal, alpha):
+    d = StrokeDetector(alpha, STROKE_MIN_AMPLITUDE, STROKE_STOPPED_WINDOW,
+                       STROKE_STOPPED_THRESHOLD, STROKE_PEAK_HISTORY)
+    count = 0
+    for k in range(0, len(signal), POLL_EVERY):
+        emit, _ = d.update(int(signal[k] * 100))
+        count += emit
+    return count
+
+
+def main(args):
+    alphas = "/".join("a={}".format(a) for a in ALPHAS)
+    if args.capture:
+        frames = capture_frames(args.capture)
+        reference = replay(frames, args.signal)[0]
+        print("{} frames from {}; lag vs unfiltered".format(len(frames), args.capture))
+        print("{:<16} {:>9} {:>7} {:>16} {:>9}".format(
+            "filter", "jitter", "lag ms", "emits " + alphas, "us/frame"))
+    else:
+        clean, frames = make_frames(args.seconds * 1000 // FRAME_MS, args.noise, args.spikes,
+                                    args.grip)
+        reference, ref_cen, ref_foc, _ = replay(clean, args.signal)
+        print("{} s synthetic {}, noise {} counts, spikes {:.1%}; reference emits {}".format(
+            args.seconds, args.signal, args.noise, args.spikes,
+            "/".join(str(emits(reference, a)) for a in ALPHAS)))
+        print("{:<16} {:>22} {:>7} {:>7} {:>16} {:>9}".format(
+            "filter", "err sig/center/focus", "spikes", "lag ms", "emits " + alphas, "us/frame"))
+    for label, mode, window, shift, hyst in CONFIGS:
+        ins, cen, foc, us = replay(frames, args.signal, mode, window, shift, hyst)
+        lag = best_lag(ins, reference)
+        counts = "/".join(str(emits(ins, a)) for a in ALPHAS)
+        if args.capture:
+            print("{:<16} {:>9.4f} {:>7} {:>16} {:>9.1f}".format(
+                label, jitter(ins), lag * FRAME_MS, counts, us))
+        else:
+            spikes = sum(1 for i in range(len(reference) - lag)
+                         if abs(ins[i + lag] - reference[i]) > 0.05)
+            err = "{:.4f}/{:.4f}/{:.4f}".format(
+                rms(ins, reference, lag), rms(cen, ref_cen, lag), rms(foc, ref_foc, lag))
+            print("{:<16} {:>22} {:>7} {:>7} {:>16} {:>9.1f}".format(
+                label, err, spikes, lag * FRAME_MS, counts, us))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--signal", choices=("insertion", "depth"), default="insertion")
+    parser.add_argument("--capture", help="frame_codec capture with raw frames")
+    parser.add_argument("--seconds", type=int, default=64)
+    parser.add_argument("--noise", type=float, default=30, help="Gaussian noise, raw counts")
+    parser.add_argument("--spikes", type=float, default=0.01,
+                        help="per-channel per-frame spike probability")
+    parser.add_argument("--grip", type=float, default=0.7,
+                        help="covered-electrode reading as a fraction of its calibrated range")
+    main(parser.parse_args())
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+Fit calibration offline from recorded raw captures, robustly.
+
+TouchAnalyzer.calibrate() takes one min/max pass over a short interactive
+session, so a single noise spike can set a channel's scale for good.  This
+tool fits the same calibration (offsets, scales, noise, thresholds) from any
+amount of recorded data instead, with numpy over all frames at once:
+
+  segmentation  rest vs handling is found in the data: a frame is touched
+                when some channel is over its rough baseline (5th
+                percentile) by the touch margin auto_calibrate() uses,
+                for at least two frames running, so single-frame spikes
+                do not count.  Rest is every stretch of at least
+                MIN_REST_FRAMES untouched frames, trimmed by GUARD_FRAMES
+                at both ends.
+  offset        median of the channel at rest
+  noise         MAD of the channel at rest, as a Gaussian sigma
+  scale         PEAK_PERCENTILE of the channel while it is over its own
+                margin (again two frames running), minus the offset; a
+                channel never touched in the data keeps its old scale (or
+                the median of the others)
+  threshold     as auto_calibrate(): CAL_NOISE_SIGMAS noise sigmas of the
+                scale, at least CAL_THRESHOLD_MIN
+
+The report compares the old calibration (from --profiles/--profile or
+--calibration if given, otherwise calibrate()'s min/max rule on the same
+data) with the fit, on the same frames: insertion at rest (mean, sd and the
+share of frames with some channel over its threshold), frame-to-frame
+jitter of insertion while handled, the share of touched values clipped at
+full scale, and the 95th percentile of insertion while handled.
+
+Captures are frame_codec files with raw records (telemetry_client.py
+--records raw --save, rec_export.py, workload.py --save).  The result goes
+to --out as a calibration.json the device imports at the next boot, and/or
+into a profile store with --profiles (copy it back with mpremote cp).
+
+Usage:
+  python tools/fit_calibration.py session1.bin [session2.bin ...]
+                                  [--out calibration.json] [--name condom]
+                                  [--profiles calprofiles.bin [--profile default]]
+Needs numpy.
+"""
+
+import argparse
+import json
+
+import desktop_shim
+desktop_shim.install()
+
+import numpy as np
+
+import cal_profiles
+import frame_codec
+from frame_codec import REC_RAW, HEADER_SIZE
+from touch_analysis import (CAL_TOUCH_SIGMAS, CAL_TOUCH_MIN, CAL_NOISE_SIGMAS,
+                            CAL_THRESHOLD_MIN, ACTIVE_THRESHOLD)
+
+ROUGH_PERCENTILE = 5        # rough baseline; at least this share of frames must be at rest
+NOISE_PERCENTILE = 20       # rough noise from the spread below this percentile
+PEAK_PERCENTILE = 99        # scale point among touched frames
+MIN_REST_FRAMES = 50        # shortest untouched stretch that counts as rest
+GUARD_FRAMES = 10           # dropped at each end of a rest stretch (hands approaching)
+MIN_TOUCHED = 20            # touched frames a channel needs for its own scale
+MAD_SIGMA = 1.4826          # MAD -> sigma for Gaussian noise
+# Width of the 5th..20th percentile band of a Gaussian, in sigmas.
+_BAND_SIGMAS = 1.6449 - 0.8416
+
+
+# ---------------------------------------------------------------------- #
+# Loading                                                                  #
+# ---------------------------------------------------------------------- #
+
+def load(path):
+    """Raw frames of a capture as a (frames, sensors) uint16 array."""
+    with open(path, "rb") as f:
+        data = f.read()
+    if data[:4] != frame_codec.CAPTURE_MAGIC or len(data) < 5:
+        raise SystemExit("{}: not a frame_codec capture".format(path))
+    n = data[4]
+    size = frame_codec.record_size(REC_RAW, n)
+    body = np.frombuffer(data, np.uint8, offset=5)
+    dtype = np.dtype([("type", "u1"), ("t", "<u4"), ("v", "<u2", (n,))])
+    if len(body) % size == 0:
+        recs = body.view(dtype)
+        if (recs["type"] == REC_RAW).all():
+            return n, recs["v"]
+    # Mixed record types: walk the headers, then gather the raw payloads at once.
+    starts = []
+    off = 5
+    while off + HEADER_SIZE <= len(data):
+        rtype = data[off]
+        try:
+            rsize = frame_codec.record_size(rtype, n)
+        except KeyError:
+            break               # unknown record type: the rest is unreadable
+        if rtype == REC_RAW and off + rsize <= len(data):
+            starts.append(off + HEADER_SIZE)
+        off += rsize
+    raw = np.frombuffer(data, np.uint8)
+    idx = np.asarray(starts)[:, None] + np.arange(2 * n)
+    return n, raw[idx].view("<u2").reshape(len(starts), n) if starts else np.zeros((0, n), "<u2")
+
+
+# ---------------------------------------------------------------------- #
+# Segmentation and fit                                                     #
+# ---------------------------------------------------------------------- #
+
+def _runs(mask):
+    """(start, end) of every run of True in a 1-D boolean array."""
+    d = np.diff(np.concatenate(([0], mask.view(np.int8), [0])))
+    return np.flatnonzero(d == 1), np.flatnonzero(d == -1)
+
+
+def segment(x):
+    """Boolean (rest, touched) frame masks for frames x (frames, sensors)."""
+    base = np.percentile(x, ROUGH_PERCENTILE, axis=0)
+    sigma = (np.percentile(x, NOISE_PERCENTILE, axis=0) - base) / _BAND_SIGMAS
+    margin = np.maximum(CAL_TOUCH_MIN, CAL_TOUCH_SIGMAS * sigma)
+    over = ((x - base) > margin).any(axis=1)
+    prev = np.r_[False, over[:-1]]
+    nxt = np.r_[over[1:], False]
+    touched = over & (prev | nxt)                           # two frames running
+    rest = np.zeros(len(x), bool)
+    starts, ends = _runs(~over)
+    for s, e in zip(starts, ends):
+        if e - s >= MIN_REST_FRAMES:
+            rest[s + GUARD_FRAMES:e - GUARD_FRAMES] = True
+    return rest, touched
+
+
+def fit(x, rest, touched, fallback_scales=None):
+    """(offsets, scales, noise, thresholds) and the sensors that kept a fallback scale."""
+    xr = x[rest]
+    offsets = np.median(xr, axis=0)
+    noise = MAD_SIGMA * np.median(np.abs(xr - offsets), axis=0)
+    margin = np.maximum(CAL_TOUCH_MIN, CAL_TOUCH_SIGMAS * noise)
+    over = (x - offsets) > margin
+    pad = np.zeros((1, x.shape[1]), bool)
+    on = touched[:, None] & over & (np.r_[pad, over[:-1]] | np.r_[over[1:], pad])
+    scales = np.zeros(x.shape[1])
+    untouched = []
+    for i in range(x.shape[1]):
+        v = x[on[:, i], i]
+        if len(v) >= MIN_TOUCHED:
+            scales[i] = np.percentile(v, PEAK_PERCENTILE) - offsets[i]
+        else:
+            untouched.append(i)
+    for i in untouched:
+        if fallback_scales is not None:
+            scales[i] = fallback_scales[i]
+        else:
+            own = np.delete(scales, untouched)
+            scales[i] = np.median(own) if len(own) else 1
+    scales = np.maximum(1, np.round(scales))
+    thresholds = np.maximum(CAL_THRESHOLD_MIN, CAL_NOISE_SIGMAS * noise / scales)
+    return (np.round(offsets).astype(int), scales.astype(int), np.round(noise, 1),
+            np.round(thresholds, 3)), untouched
+
+
+def minmax(x, rest, touched):
+    """calibrate()'s rule on the same frames: rest minimum, handling maximum."""
+    n = x.shape[1]
+    offsets = x[rest].min(axis=0).astype(int)
+    peaks = x[touched].max(axis=0) if touched.any() else offsets + 1
+    scales = np.maximum(1, peaks - offsets).astype(int)
+    return offsets, scales, None, np.full(n, ACTIVE_THRESHOLD)
+
+
+# ---------------------------------------------------------------------- #
+# Report                                                                   #
+# ---------------------------------------------------------------------- #
+
+def stability(x, rest, touched, cal):
+    """Metric stability of calibration `cal` on frames x; see the module docstring."""
+    offsets, scales, _, thresholds = cal
+    norm = np.clip((x - np.asarray(offsets, float)) / np.asarray(scales, float), 0.0, 1.0)
+    ins = norm.mean(axis=1)
+    active = norm >= np.asarray(thresholds, float)
+    ir, it = ins[rest], ins[touched]
+    covered = active[touched]
+    return {
+        "rest mean": ir.mean() * 100 if len(ir) else 0,
+        "rest sd": ir.std() * 100 if len(ir) else 0,
+        "rest false active %": active[rest].any(axis=1).mean() * 100 if len(ir) else 0,
+        "handled jitter": np.abs(np.diff(it)).mean() * 100 if len(it) > 1 else 0,
+        "clipped %": (norm[touched][covered] >= 1.0).mean() * 100 if covered.any() else 0,
+        "handled p95": np.percentile(it, 95) * 100 if len(it) else 0,
+    }
+
+
+def report(x, rest, touched, before, after, before_name, untouched):
+    print("{} frames: {} at rest, {} touched".format(len(x), rest.sum(), touched.sum()))
+    print("{:>6} {:>15} {:>15} {:>13} {:>15}".format(
+        "sensor", "offset", "scale", "noise", "threshold"))
+    for i in range(x.shape[1]):
+        b_noise = before[2][i] if before[2] is not None else float("nan")
+        print("{:>6} {:>7}->{:<7} {:>7}->{:<7}{} {:>6.1f}->{:<6.1f} {:>7.3f}->{:<7.3f}".format(
+            i, before[0][i], after[0][i], before[1][i], after[1][i],
+            "*" if i in untouched else " ", b_noise, after[2][i],
+            before[3][i], after[3][i]))
+    if untouched:
+        print("* never touched in the data; scale kept")
+    b = stability(x, rest, touched, before)
+    a = stability(x, rest, touched, after)
+    print("{:<22} {:>10} {:>10}".format("insertion (0-100)", before_name, "fit"))
+    for key in b:
+        print("{:<22} {:>10.2f} {:>10.2f}".format(key, b[key], a[key]))
+
+
+# ---------------------------------------------------------------------- #
+# Main                                                                     #
+# ---------------------------------------------------------------------- #
+
+def old_calibration(args, n):
+    """(name, calibration) the device uses now, from --profiles or --calibration; or None."""
+    if args.profiles:
+        store = cal_profiles.ProfileStore(n, args.profiles)
+        profile = store.get(args.profile)
+        if profile is not None:
+            return "profile", profile
+    if args.calibration:
+        try:
+            with open(args.calibration) as f:
+                data = json.load(f)
+        except OSError:
+            return None
+        return "json", (data["offsets"], data["scales"], data.get("noise"),
+                        data.get("thresholds") or [ACTIVE_THRESHOLD] * n)
+    return None
+
+
+def main(args):
+    arrays = []
+    n = None
+    for path in args.captures:
+        k, frames = load(path)
+        if n is not None and k != n:
+            raise SystemExit("{}: {} sensors, expected {}".format(path, k, n))
+        n = k
+        arrays.append(frames)
+        print("{}: {} raw frames".format(path, len(frames)))
+    x = np.concatenate(arrays).astype(np.float64)
+    if not len(x):
+        raise SystemExit("no raw frames (record with --records raw)")
+    rest, touched = segment(x)
+    if rest.sum() < MIN_REST_FRAMES:
+        raise SystemExit("not enough rest in the data ({} frames)".format(rest.sum()))
+    old = old_calibration(args, n)
+    before_name, before = old if old else ("min/max", minmax(x, rest, touched))
+    after, untouched = fit(x, rest, touched, before[1] if old else None)
+    report(x, rest, touched, before, after, before_name, untouched)
+
+    offsets, scales, noise, thresholds = (v.tolist() for v in after)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"name": args.name, "offsets": offsets, "scales": scales,
+                       "noise": noise, "thresholds": thresholds}, f)
+        print("wrote", args.out, "- copy it to the device as /calibration.json")
+    if args.profiles:
+        store = cal_profiles.ProfileStore(n, args.profiles)
+        store.put(args.name, offsets, scales, noise, thresholds)
+        store.save()
+        print("saved profile", args.name, "in", args.profiles)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("captures", nargs="+", help="frame_codec captures with raw records")
+    parser.add_argument("--out", help="write the fit as a calibration.json")
+    parser.add_argument("--name", default=cal_profiles.DEFAULT_PROFILE, help="profile name")
+    parser.add_argument("--profiles", help="host copy of the profile store: compare with "
+                        "--profile and save the fit into it")
+    parser.add_argument("--profile", default=cal_profiles.DEFAULT_PROFILE,
+                        help="profile in --profiles to compare against")
+    parser.add_argument("--calibration", help="calibration.json to compare against")
+    main(parser.parse_args())
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Drive several simulated OSSMs from one event stream through OSSMFleet.
+
+Starts N copies of test/ossm_ble_sim.py in --tcp mode, connects an
+OSSMRemote + TCPTransport to each, and feeds synthetic stroke events into
+the fleet.  One peer can be made artificially slow (every write is delayed)
+to check that it only drops its own events and does not stall the others.
+
+--fault-at kills the last peer's simulator mid-session (--fault stop freezes
+it with SIGSTOP instead, so only the missing heartbeat gives it away) and
+brings it back --fault-for seconds later.  The run reports how long the
+connection watchdog took to notice and how long streaming was down.
+
+Usage:
+  python tools/fleet_local.py [--peers 3] [--seconds 20] [--slow-ms 800]
+                              [--fault-at 5 --fault-for 2 --fault kill|stop]
+"""
+
+import sys
+import os
+import argparse
+import asyncio
+import signal
+import subprocess
+
+import desktop_shim
+desktop_shim.install()
+
+from time import ticks_ms, ticks_diff
+from queue import Queue, QueueFull
+from ble_remote import OSSMRemote
+from tcp_transport import TCPTransport
+from ossm_fleet import OSSMFleet
+import ble_remote
+import ossm_fleet
+
+SIM = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "test", "ossm_ble_sim.py")
+BASE_PORT = 7100
+
+
+class SlowTransport(TCPTransport):
+    """TCPTransport whose writes take `delay_ms` (a congested or distant peer)."""
+
+    def __init__(self, host, port, delay_ms):
+        super().__init__(host, port)
+        self._delay_ms = delay_ms
+
+    async def write(self, data, response=False):
+        await asyncio.sleep_ms(self._delay_ms)
+        await super().write(data, response)
+
+
+async def feed(source, seconds):
+    """Alternate between depth 10 and 90 every 400 ms, like a steady stroke."""
+    pos = 10
+    for _ in range(int(seconds * 1000 / 400)):
+        try:
+            source.put_nowait((pos, 400))
+        except QueueFull:
+            pass
+        pos = 100 - pos
+        await asyncio.sleep_ms(400)
+
+
+def start_sim(port):
+    return subprocess.Popen([sys.executable, SIM, "--tcp", str(port)],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+async def wait_for(predicate):
+    while not predicate():
+        await asyncio.sleep_ms(5)
+
+
+async def fault(procs, remote, args):
+    """Take the last simulator down at --fault-at, restore it --fault-for later."""
+    i = len(procs) - 1
+    await asyncio.sleep(args.fault_at)
+    t = ticks_ms()
+    if args.fault == "kill":
+        procs[i].kill()
+    else:
+        procs[i].send_signal(signal.SIGSTOP)
+    print(f"fault: {args.fault} {remote.name}")
+    restore = asyncio.create_task(asyncio.sleep(args.fault_for))
+    await wait_for(lambda: not remote.connected)
+    print(f"fault: {remote.name} down after {ticks_diff(ticks_ms(), t)} ms")
+    await restore
+    if args.fault == "kill":
+        procs[i] = start_sim(BASE_PORT + i)
+    else:
+        procs[i].send_signal(signal.SIGCONT)
+    await wait_for(lambda: remote.connected)
+    print(f"fault: {remote.name} streaming again {ticks_diff(ticks_ms(), t)} ms after the "
+          f"{args.fault} ({remote.outage_ms_last} ms after detection)")
+
+
+async def main(args):
+    ble_remote.RECONNECT_DELAY_MS = ossm_fleet.RECONNECT_DELAY_MS = 500
+    procs = [start_sim(BASE_PORT + i) for i in range(args.peers)]
+    try:
+        await asyncio.sleep(1.0)       # let the simulators bind
+        claimed = set()
+        remotes = []
+        for i in range(args.peers):
+            if i == 0 and args.slow_ms:
+                link = SlowTransport("127.0.0.1", BASE_PORT + i, args.slow_ms)
+            else:
+                link = TCPTransport("127.0.0.1", BASE_PORT + i)
+            remotes.append(OSSMRemote({"speed": 100, "depth": 100, "stroke": 100},
+                                      transport=link, name=f"OSSM{i}", claimed=claimed))
+        fleet = OSSMFleet(remotes)
+        source = Queue(maxsize=4)
+        fan_out = asyncio.create_task(fleet.run(source))
+        while not all(r.connected for r in remotes):
+            await asyncio.sleep(0.1)
+        if args.fault_at is not None:
+            asyncio.create_task(fault(procs, remotes[-1], args))
+        await feed(source, args.seconds)
+        await asyncio.sleep(1.0)
+        print("--- fleet report ---")
+        fleet.report()
+        fan_out.cancel()
+    finally:
+        for p in procs:
+            p.terminate()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--peers", type=int, default=3)
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--slow-ms", type=int, default=800,
+                        help="delay every write to peer 0 by this much (0 = off)")
+    parser.add_argument("--fault-at", type=float, help="seconds in: take the last peer down")
+    parser.add_argument("--fault-for", type=float, default=2.0, help="seconds until it is back")
+    parser.add_argument("--fault", choices=("kill", "stop"), default="kill",
+                        help="kill the simulator, or freeze it (SIGSTOP)")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""
+Run analysis, stroke detection and the OSSM link on the host.
+
+The device runs with OFFLOAD = True in src/config.py and streams raw sensor
+frames over USB serial (see src/serial_offload.py).  This bridge feeds them
+through the firmware's own TouchAnalyzer, StrokeDetector and OSSMFleet under
+CPython, so heavier experiments are not limited by the ESP32 CPU or heap.
+
+The OSSM link is pluggable: --tcp HOST:PORT (repeatable) drives simulators
+started with `test/ossm_ble_sim.py --tcp PORT`; otherwise BLE_PEERS real
+OSSMs are driven over the host's Bluetooth adapter with bleak.
+
+Every --report seconds the link budget is printed: bytes/s and frames/s
+received, bytes per frame, lost/corrupt packets, worst gaps between frames,
+and how much of --link-bps the stream uses.
+
+Calibration profiles are read from and saved to a host file (--profiles);
+copy the device's with `mpremote cp :/calprofiles.bin .`, or run --calibrate.
+
+Usage:
+  python tools/host_bridge.py --port /dev/ttyACM0 [--tcp 127.0.0.1:7100 ...]
+                              [--calibrate] [--log] [--report 5]
+Needs pyserial, and bleak unless --tcp is given.
+"""
+
+import sys
+import argparse
+import asyncio
+import threading
+import time
+
+import desktop_shim
+desktop_shim.install()
+
+import cal_profiles
+import frame_codec
+import touch_analysis
+from frame_codec import REC_RAW
+from time import ticks_ms, ticks_diff
+from config import (
+    BLE_SPEED, BLE_DEPTH, BLE_STROKE, BLE_PEERS, BLE_PEER_SETTINGS,
+    STROKE_EMA_ALPHA, STROKE_MIN_AMPLITUDE,
+    STROKE_STOPPED_WINDOW, STROKE_STOPPED_THRESHOLD,
+    STROKE_PEAK_HISTORY, STROKE_POLL_MS, STROKE_MIN_MOVE_MS, STROKE_INITIAL_MOVE_MS,
+    STROKE_SIGNAL, SIGNAL_MAP, SIGNAL_EMA_ALPHA, SIGNAL_DEADBAND, SIGNAL_MIN_MS,
+    PREFILTER, PREFILTER_WINDOW, PREFILTER_SHIFT, PREFILTER_HYSTERESIS,
+)
+from queue import Queue, QueueFull
+from ble_remote import OSSMRemote
+from ossm_fleet import OSSMFleet
+from stroke_detector import StrokeDetector, SignalBank
+from tcp_transport import TCPTransport
+
+FRAME_TIMEOUT_S = 2.0       # read() gives up if the device sends nothing this long
+
+
+class SerialFrameSource:
+    """Sensor-like view of an OFFLOAD-mode device: num_pins, read(), read_async().
+
+    A reader thread decodes packets from the serial port and keeps the newest
+    frame; read_async() waits for the next one.  Link statistics are kept for
+    report().
+    """
+
+    def __init__(self, port, baud=115200, num_pins=9):
+        import serial
+        self._ser = serial.Serial(port, baud, timeout=0.1)
+        self.num_pins = num_pins
+        self._record = frame_codec.record_size(REC_RAW, num_pins)
+        self._reader = frame_codec.PacketReader()
+        self._values = [0] * num_pins
+        self._count = 0
+        self._cond = threading.Condition()
+        self._loop = None
+        self._event = asyncio.Event()
+        self._running = True
+        self.reset_stats()
+        threading.Thread(target=self._rx, daemon=True).start()
+
+    def reset_stats(self):
+        reader = self._reader
+        reader.lost = reader.bad = reader.skipped = reader.restarts = 0
+        self.mismatched = 0         # valid packets that were not n-sensor raw frames
+        self._stats_t = time.monotonic()
+        self.rx_bytes = 0
+        self.frames = 0
+        self.gap_max_ms = 0         # worst host arrival gap between frames
+        self.dt_max_ms = 0          # worst device timestamp step between frames
+        self._last_arrival = None
+        self._last_t_ms = None
+
+    def _rx(self):
+        ser = self._ser
+        while self._running:
+            data = ser.read(ser.in_waiting or 1)
+            if data:
+                self.rx_bytes += len(data)
+                self.feed(data)
+
+    def feed(self, data):
+        """Decode a chunk of the serial stream and publish any frames in it."""
+        for _, record in self._reader.feed(data):
+            if len(record) != self._record or record[0] != REC_RAW:
+                self.mismatched += 1
+                continue
+            for _, t_ms, values in frame_codec.unpack(record, self.num_pins):
+                self._publish(t_ms, values)
+
+    def _publish(self, t_ms, values):
+        now = time.monotonic()
+        if self._last_arrival is not None:
+            self.gap_max_ms = max(self.gap_max_ms, (now - self._last_arrival) * 1000)
+            self.dt_max_ms = max(self.dt_max_ms, t_ms - self._last_t_ms)
+        self._last_arrival = now
+        self._last_t_ms = t_ms
+        with self._cond:
+            self._values = list(values)
+            self._count += 1
+            self.frames += 1
+            self._cond.notify_all()
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._event.set)
+
+    def read(self):
+        """Block until the next frame arrives and return it."""
+        with self._cond:
+            count = self._count
+            if not self._cond.wait_for(lambda: self._count != count, FRAME_TIMEOUT_S):
+                raise OSError("no frames from device; is OFFLOAD enabled?")
+            return list(self._values)
+
+    async def read_async(self, channels=None):
+        """Wait for the next frame.  `channels` is ignored: the device sends every sensor."""
+        if self._loop is None:
+            self._loop = asyncio.get_running_loop()
+        await self._event.wait()
+        self._event.clear()
+        with self._cond:
+            return list(self._values)
+
+    def report(self, link_bps):
+        """Print and reset the link budget."""
+        dt = time.monotonic() - self._stats_t
+        reader = self._reader
+        bps = self.rx_bytes / dt
+        size = self._record + frame_codec.PACKET_OVERHEAD
+        print("Link: {:.0f} B/s ({:.1f}% of {} B/s)  {:.1f} frames/s at {} B/frame "
+              "(max {:.0f}/s)  lost {}  bad {}  mismatched {}  skipped {} B  restarts {}  "
+              "gap max {:.0f} ms  device dt max {} ms".format(
+                  bps, 100 * bps / link_bps, link_bps, self.frames / dt, size,
+                  link_bps / size, reader.lost, reader.bad, self.mismatched,
+                  reader.skipped, reader.restarts, self.gap_max_ms, self.dt_max_ms))
+        self.reset_stats()
+
+    def close(self):
+        self._running = False
+        self._ser.close()
+
+
+_last_analyzed = {}
+
+
+async def run_output(analyzer, verbose):
+    global _last_analyzed
+    while True:
+        analyzed = await analyzer.analyze()
+        _last_analyzed = analyzed
+        if verbose:
+            print(f"focus: {analyzed['focus'] * 100:.0f} insertion: {analyzed['insertion'] * 100:.0f} "
+                  f"center: {analyzed['center'] * 100:.0f}")
+
+
+async def stroke_task(queue, fleet, log):
+    """Same detector loop as main.stroke_task, fed from the host-side analyzer."""
+    detector = StrokeDetector(
+        STROKE_EMA_ALPHA, STROKE_MIN_AMPLITUDE,
+        STROKE_STOPPED_WINDOW, STROKE_STOPPED_THRESHOLD,
+        STROKE_PEAK_HISTORY,
+    )
+    bank = fleet.bank
+    last_emit_ms = ticks_ms()
+    prev_elapsed = None
+    t0 = ticks_ms()
+    while True:
+        raw = int(_last_analyzed.get(STROKE_SIGNAL, 0) * 100)
+        emit, pos = detector.update(raw)
+        if log:
+            print(f"S,{ticks_diff(ticks_ms(), t0)},{raw},{detector.smoothed:.2f},{pos if emit else -1}")
+        if emit:
+            now = ticks_ms()
+            elapsed = ticks_diff(now, last_emit_ms)
+            if prev_elapsed is None:
+                interval_ms = STROKE_INITIAL_MOVE_MS
+            else:
+                interval_ms = max(STROKE_MIN_MOVE_MS, min(prev_elapsed, 2000))
+            prev_elapsed = elapsed
+            last_emit_ms = now
+            try:
+                queue.put_nowait((pos, interval_ms))
+            except QueueFull:
+                pass
+        if bank:
+            bank.dispatch(fleet, _last_analyzed, ticks_ms())
+        await asyncio.sleep_ms(STROKE_POLL_MS)
+
+
+def make_fleet(tcp_peers):
+    claimed = set()
+    remotes = []
+    if tcp_peers:
+        links = []
+        for peer in tcp_peers:
+            host, port = peer.rsplit(":", 1)
+            links.append(TCPTransport(host, int(port)))
+    else:
+        from bleak_transport import BleakTransport
+        links = [BleakTransport() for _ in range(BLE_PEERS)]
+    for i, link in enumerate(links):
+        if BLE_PEER_SETTINGS:
+            settings = BLE_PEER_SETTINGS[i]
+        else:
+            settings = {"speed": BLE_SPEED, "depth": BLE_DEPTH, "stroke": BLE_STROKE}
+        name = "OSSM" if len(links) == 1 else f"OSSM{i}"
+        remotes.append(OSSMRemote(settings, transport=link, name=name, claimed=claimed))
+    bank = SignalBank(SIGNAL_MAP, SIGNAL_EMA_ALPHA, SIGNAL_DEADBAND, SIGNAL_MIN_MS) \
+        if SIGNAL_MAP else None
+    return OSSMFleet(remotes, bank=bank)
+
+
+async def report_task(source, fleet, seconds, link_bps):
+    while True:
+        await asyncio.sleep(seconds)
+        source.report(link_bps)
+        fleet.report()
+
+
+async def main(args):
+    cal_profiles.PROFILE_FILE = args.profiles
+    touch_analysis.CALIBRATION_FILE = args.calibration
+    source = SerialFrameSource(args.port, args.baud, args.pins)
+    try:
+        prefilter = touch_analysis.ChannelFilter(
+            source.num_pins, PREFILTER, PREFILTER_WINDOW, PREFILTER_SHIFT) if PREFILTER else None
+        analyzer = touch_analysis.TouchAnalyzer(source, prefilter=prefilter,
+                                                hysteresis=PREFILTER_HYSTERESIS)
+        if args.calibrate or not analyzer._calibrated:
+            if not await analyzer.auto_calibrate():
+                sys.exit("calibration failed")
+        source.reset_stats()
+        fleet = make_fleet(args.tcp)
+        queue = Queue(maxsize=4)
+        asyncio.create_task(stroke_task(queue, fleet, args.log))
+        asyncio.create_task(fleet.run(queue))
+        asyncio.create_task(report_task(source, fleet, args.report, args.link_bps))
+        await run_output(analyzer, args.verbose)
+    finally:
+        source.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--port", required=True, help="device serial port, e.g. /dev/ttyACM0")
+    parser.add_argument("--baud", type=int, default=115200)
+    parser.add_argument("--pins", type=int, default=9, help="sensors per frame")
+    parser.add_argument("--tcp", action="append", metavar="HOST:PORT",
+                        help="drive a TCP simulator instead of BLE (repeat for several)")
+    parser.add_argument("--profiles", default="calprofiles.bin",
+                        help="host copy of the calibration profile store")
+    parser.add_argument("--calibration", default="calibration.json",
+                        help="legacy JSON calibration to import into --profiles, if present")
+    parser.add_argument("--calibrate", action="store_true",
+                        help="run automatic calibration on the host first")
+    parser.add_argument("--log", action="store_true",
+                        help="print S,... lines for tools/plot_strokes.py")
+    parser.add_argument("--verbose", action="store_true", help="print every analyzed frame")
+    parser.add_argument("--report", type=float, default=5, help="seconds between link reports")
+    parser.add_argument("--link-bps", type=int, default=11520,
+                        help="link capacity in bytes/s for the budget (115200 baud UART = 11520)")
+    try:
+        asyncio.run(main(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
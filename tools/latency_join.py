@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Join a device log and an OSSM simulator log on one timebase: touch-to-motion latency.
+
+The device log is its serial console (or telemetry_client.py output) with
+STROKE_LOG S-lines and/or E-lines, plus the K-lines OSSMRemote prints when
+CLOCK_SYNC_MS is set (see src/clock_sync.py).  K-lines map device time onto
+the simulator's clock; between two of them the mapping is interpolated, past
+the last one it is extended with the last drift.  The simulator log is
+test/ossm_ble_sim.py's output, whose lines start with its own ms.
+
+Each emit is matched to the first stream command with the same position that
+the simulator received after it, and split into
+  touch->emit   the raw extreme the emit reports (last S-line with that raw
+                value) to the emit; stop emits have no such sample and are
+                left out
+  emit->OSSM    the emit to the simulator receiving the command (queueing,
+                motion pacing and the link)
+  touch->OSSM   the sum
+The uncertainty of the mapping is about half the K-lines' round trip, printed
+with the results.
+
+Usage:
+  mpremote repl | tee device.log            # CLOCK_SYNC_MS = 5000, STROKE_LOG = True
+  python test/ossm_ble_sim.py 2> sim.log
+  python tools/latency_join.py device.log sim.log [--peer BLE] [--merge]
+--merge prints both logs as one timeline in device ms instead.
+"""
+
+import argparse
+import bisect
+import re
+
+S_RE = re.compile(r"^S,(\d+),(\d+),([\d.]+),(-?\d+)$")
+E_RE = re.compile(r"^E,(\d+),(\d+),(\d+)$")
+K_RE = re.compile(r"^K,([^,]+),(-?\d+),(-?\d+),(-?\d+),(-?[\d.]+)$")
+SIM_RE = re.compile(r"^\s*(\d+)ms \w+ (.*)$")
+STREAM_RE = re.compile(r"received: 'stream:(\d+):(\d+)'")
+
+SLACK_MS = 5                # receipts this much before the mapped emit still match
+MAX_LINK_MS = 5000          # ...and at most this long after it
+TOUCH_SEARCH_MS = 3000      # how far back the raw extreme of an emit is looked for
+
+
+class DeviceLog:
+    def __init__(self, lines, peer=None):
+        self.samples = []       # (t_ms, raw)
+        self.emits = []         # (t_ms, pos)
+        self.sync = []          # (t_ms, remote_ms, rtt_ms, drift_ppm)
+        self.lines = []         # (t_ms, text) for --merge
+        s_emits = []
+        for line in lines:
+            line = line.strip()
+            m = S_RE.match(line)
+            if m:
+                t, raw, emit = int(m.group(1)), int(m.group(2)), int(m.group(4))
+                self.samples.append((t, raw))
+                if emit >= 0:
+                    s_emits.append((t, emit))
+                self.lines.append((t, line))
+                continue
+            m = E_RE.match(line)
+            if m:
+                self.emits.append((int(m.group(1)), int(m.group(2))))
+                self.lines.append((int(m.group(1)), line))
+                continue
+            m = K_RE.match(line)
+            if m and (peer is None or m.group(1) == peer):
+                peer = m.group(1)
+                self.sync.append((int(m.group(2)), int(m.group(3)), int(m.group(4)),
+                                  float(m.group(5))))
+                self.lines.append((int(m.group(2)), line))
+        self.peer = peer
+        if not self.emits:
+            self.emits = s_emits[1:]    # the detector's first emit is its starting point
+        self._times = [k[0] for k in self.sync]
+        self._sample_times = [s[0] for s in self.samples]
+
+    def to_remote(self, t):
+        """Simulator ms at device ms t."""
+        sync = self.sync
+        i = bisect.bisect_right(self._times, t)
+        if 0 < i < len(sync):
+            (t0, r0, _, _), (t1, r1, _, _) = sync[i - 1], sync[i]
+            return r0 + (r1 - r0) * (t - t0) / (t1 - t0) if t1 != t0 else r0
+        t0, r0, _, ppm = sync[max(0, i - 1)]
+        return r0 + (t - t0) * (1 + ppm * 1e-6)
+
+    def to_device(self, r):
+        """Device ms at simulator ms r (inverse of to_remote, by bisection)."""
+        lo, hi = r - 1e9, r + 1e9
+        for _ in range(80):
+            mid = (lo + hi) / 2
+            if self.to_remote(mid) < r:
+                lo = mid
+            else:
+                hi = mid
+        return (lo + hi) / 2
+
+    def touch_time(self, t_emit, pos):
+        """Time of the S-sample holding the raw extreme reported at t_emit, or None."""
+        i = bisect.bisect_right(self._sample_times, t_emit)
+        while i > 0:
+            i -= 1
+            t, raw = self.samples[i]
+            if t_emit - t > TOUCH_SEARCH_MS:
+                break
+            if raw == pos:
+                return t
+        return None
+
+
+def parse_sim(lines):
+    """(sim ms, pos) of every stream command received, and (sim ms, text) of every line."""
+    streams, text = [], []
+    for line in lines:
+        m = SIM_RE.match(line)
+        if not m:
+            continue
+        t = int(m.group(1))
+        text.append((t, m.group(2)))
+        s = STREAM_RE.search(m.group(2))
+        if s:
+            streams.append((t, int(s.group(1))))
+    return streams, text
+
+
+def join(dev, streams):
+    """[(touch ms or None, emit ms, receipt in device ms)] for every matched emit."""
+    matched = []
+    j = 0
+    for t_emit, pos in dev.emits:
+        r_emit = dev.to_remote(t_emit)
+        while j < len(streams) and streams[j][0] < r_emit - SLACK_MS:
+            j += 1
+        for k in range(j, len(streams)):
+            r, p = streams[k]
+            if r > r_emit + MAX_LINK_MS:
+                break
+            if p == pos:
+                matched.append((dev.touch_time(t_emit, pos), t_emit, dev.to_device(r)))
+                j = k + 1
+                break
+    return matched
+
+
+def percentiles(values):
+    if not values:
+        return "-"
+    s = sorted(values)
+    return "/".join("{:.0f}".format(s[min(len(s) - 1, int(p / 100 * len(s)))])
+                    for p in (50, 95, 99))
+
+
+def main(args):
+    with open(args.device, errors="replace") as f:
+        dev = DeviceLog(f, args.peer)
+    with open(args.sim, errors="replace") as f:
+        streams, sim_lines = parse_sim(f)
+    if not dev.sync:
+        raise SystemExit("no K-lines in {}: set CLOCK_SYNC_MS on the device".format(args.device))
+
+    if args.merge:
+        merged = dev.lines + [(dev.to_device(t), "SIM " + text) for t, text in sim_lines]
+        merged.sort(key=lambda x: x[0])
+        for t, text in merged:
+            print("{:>10.1f}  {}".format(t, text))
+        return
+
+    matched = join(dev, streams)
+    rtts = [k[2] for k in dev.sync]
+    print("device: {} emits, {} K-lines for {} (rtt min {} ms, median {} ms, drift {:.1f} ppm)".format(
+        len(dev.emits), len(dev.sync), dev.peer, min(rtts), sorted(rtts)[len(rtts) // 2],
+        dev.sync[-1][3]))
+    print("simulator: {} stream commands; {} emits matched".format(len(streams), len(matched)))
+    touch_emit = [e - t for t, e, _ in matched if t is not None]
+    emit_ossm = [r - e for _, e, r in matched]
+    touch_ossm = [r - t for t, _, r in matched if t is not None]
+    print("latency p50/p95/p99 ms (+-{:.0f} ms):".format(min(rtts) / 2))
+    print("  touch->emit  {}  ({} reversals)".format(percentiles(touch_emit), len(touch_emit)))
+    print("  emit->OSSM   {}".format(percentiles(emit_ossm)))
+    print("  touch->OSSM  {}".format(percentiles(touch_ossm)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("device", help="device console log (S/E/K lines)")
+    parser.add_argument("sim", help="ossm_ble_sim.py log")
+    parser.add_argument("--peer", help="K-line name of the simulated OSSM (default: the first)")
+    parser.add_argument("--merge", action="store_true",
+                        help="print both logs as one timeline in device ms")
+    main(parser.parse_args())
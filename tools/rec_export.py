@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Download the on-device session recording (src/recorder.py) as a capture file.
+
+Stops the firmware with Ctrl-C, enters the raw REPL and runs
+recorder.export(), which streams the log as raw binary (a length prefix,
+then a frame_codec capture) instead of printed lines.  The result is written
+to --out and can be read by telemetry_client.py --read, bench.py --capture
+and filter_replay.py --capture.  Export throughput is printed at the end.
+
+Usage:
+  python tools/rec_export.py --port /dev/ttyACM0 [--out session.bin]
+                             [--erase] [--reset]
+Needs pyserial.
+"""
+
+import sys
+import os
+import argparse
+import struct
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+import frame_codec
+
+TIMEOUT_S = 5.0
+
+
+def read_until(ser, marker, timeout=TIMEOUT_S):
+    data = b""
+    deadline = time.monotonic() + timeout
+    while not data.endswith(marker):
+        if time.monotonic() > deadline:
+            raise SystemExit(f"timed out waiting for {marker!r}; got {data[-80:]!r}")
+        data += ser.read(1)
+    return data
+
+
+def read_exact(ser, n, timeout=TIMEOUT_S):
+    """Read n bytes; the timeout restarts whenever data arrives."""
+    chunks = []
+    remaining = n
+    deadline = time.monotonic() + timeout
+    while remaining:
+        chunk = ser.read(min(remaining, 65536))
+        if chunk:
+            chunks.append(chunk)
+            remaining -= len(chunk)
+            deadline = time.monotonic() + timeout
+        elif time.monotonic() > deadline:
+            raise SystemExit(f"timed out with {n - remaining} of {n} bytes")
+    return b"".join(chunks)
+
+
+def enter_raw_repl(ser):
+    ser.write(b"\r\x03\x03")        # stop main.py
+    time.sleep(0.2)
+    ser.reset_input_buffer()
+    ser.write(b"\r\x01")
+    read_until(ser, b"raw REPL; CTRL-B to exit\r\n>")
+
+
+def run(ser, code):
+    """Send code to the raw REPL; returns once the device has accepted it."""
+    ser.write(code.encode() + b"\x04")
+    read_until(ser, b"OK")
+
+
+def finish(ser):
+    """Consume the end of a raw REPL command: stdout tail, stderr, prompt."""
+    out = read_until(ser, b"\x04")
+    err = read_until(ser, b"\x04")
+    read_until(ser, b">")
+    if err[:-1]:
+        raise SystemExit("device error: " + err[:-1].decode(errors="replace"))
+    return out[:-1]
+
+
+def main(args):
+    import serial
+    ser = serial.Serial(args.port, args.baud, timeout=0.1)
+    try:
+        enter_raw_repl(ser)
+        run(ser, "import recorder\nrecorder.export()")
+        t = time.monotonic()
+        total = struct.unpack("<I", read_exact(ser, 4))[0]
+        data = read_exact(ser, total)
+        dt = time.monotonic() - t
+        finish(ser)
+        with open(args.out, "wb") as f:
+            f.write(data)
+        n, records = frame_codec.read_capture(data)
+        print("{} B, {} records ({} sensors) in {:.2f} s: {:.1f} kB/s -> {}".format(
+            total, len(records), n, dt, total / dt / 1000 if dt else 0, args.out))
+        if args.erase:
+            run(ser, "import recorder\nrecorder.erase()")
+            finish(ser)
+            print("Recording erased.")
+        if args.reset:
+            ser.write(b"\x04")      # soft reset from the raw REPL restarts main.py
+        else:
+            ser.write(b"\x02")      # back to the friendly REPL
+    finally:
+        ser.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--port", required=True, help="device serial port, e.g. /dev/ttyACM0")
+    parser.add_argument("--baud", type=int, default=115200)
+    parser.add_argument("--out", default="session.bin")
+    parser.add_argument("--erase", action="store_true", help="delete the log after a good export")
+    parser.add_argument("--reset", action="store_true", help="restart the firmware afterwards")
+    main(parser.parse_args())
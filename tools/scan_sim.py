@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Exercise ScanScheduler against the fake TouchPad from desktop_shim.
+
+Runs MultiTouchSensor -> TouchAnalyzer -> ScanScheduler through a scripted
+idle / touch / idle timeline and reports, per phase, the scan rate, which
+channels were being scanned at the end of it, and how many frames it took to return to full rate
+after the touch started.
+
+Usage:
+  python tools/scan_sim.py [--lightsleep] [--roi]
+"""
+
+import sys
+import asyncio
+import random
+
+import desktop_shim
+desktop_shim.install()
+
+import cal_profiles
+import touch_sensor
+import touch_analysis
+from scan_scheduler import ScanScheduler
+
+# (phase name, duration s, touched electrodes)
+TIMELINE = [
+    ("idle", 4.0, ()),
+    ("touch", 3.0, (6, 7, 8)),      # covered from the tip
+    ("idle", 4.0, ()),
+    ("odd", 2.0, (1, 3, 5, 7)),     # only electrodes outside SCAN_IDLE_CHANNELS
+    ("idle", 4.0, ()),
+]
+
+_touched = ()
+
+
+def _source(pin_num):
+    v = 27000 + random.gauss(0, 30)
+    if pin_num - 1 in _touched:
+        v += 9000
+    return v
+
+
+async def run(lightsleep, roi):
+    global _touched
+    desktop_shim.touch_source = _source
+    # Keep calibration off the filesystem: defaults only, nothing saved.
+    cal_profiles.PROFILE_FILE = touch_analysis.CALIBRATION_FILE = "/nonexistent/scan_sim"
+    sensor = touch_sensor.MultiTouchSensor()
+    analyzer = touch_analysis.TouchAnalyzer(sensor)
+    scan = ScanScheduler(sensor.num_pins, idle_after=3, roi=roi)
+    scan.lightsleep_ok = lightsleep
+
+    loop = asyncio.get_event_loop()
+    for name, duration, touched in TIMELINE:
+        _touched = touched
+        scan.reset_stats()
+        end = loop.time() + duration
+        frames = 0
+        ramp = None
+        scanned = None
+        while loop.time() < end:
+            full = scan.full_rate
+            channels = scan.channels()
+            scanned = list(range(sensor.num_pins) if channels is None else channels)
+            analyzed = await analyzer.analyze(channels)
+            frames += 1
+            if touched and ramp is None and full:
+                ramp = frames
+            await scan.sleep(scan.update(analyzed["active"] > 0, analyzed["edge"], analyzed["center"]))
+        print(f"[{name}] channels scanned at end of phase: {scanned}"
+              + (f"  full rate at frame {ramp}" if touched else ""))
+        scan.report()
+
+
+if __name__ == "__main__":
+    asyncio.run(run("--lightsleep" in sys.argv, "--roi" in sys.argv))
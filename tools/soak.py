@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+"""
+Soak test: the firmware pipeline on a synthetic workload, for hours of device time.
+
+TouchAnalyzer, the stroke detector loop (host_bridge.stroke_task, as on the
+device) and OSSMFleet run under CPython on frames from tools/workload.py.
+The firmware clock runs --speed times faster than the wall clock (see
+desktop_shim), so a night of use takes minutes.  The OSSM is a fake link that
+sends a state heartbeat every second and takes --write-ms per command; with
+--tcp the pipeline drives test/ossm_ble_sim.py simulators instead, in real
+time (asyncio timeouts in the TCP transport are not scaled).
+
+Every --report seconds of device time:
+  heap      traced Python heap now, and its growth rate fitted over the run
+  queue     deepest the stroke queue got (per-peer drops are in the
+            fleet report that follows)
+  lag       worst lateness of a frame versus its schedule (host too slow
+            for --speed when this grows)
+  analyze   analyze() cost per frame on this machine, p50/p99
+  detect    true event -> emit queued, p50/p95/p99
+  write     true event -> stream command written to the first OSSM, p50/p95/p99
+  accuracy  emits matched one-to-one with a true event (reversal or start of
+            a hold) up to WINDOW_MS before them; unmatched emits are false,
+            true events with no emit within WINDOW_MS are missed; pos err is
+            the mean |emit - true position| in stroke-signal units
+
+Usage:
+  python tools/soak.py [--pattern stopngo] [--seconds 3600] [--speed 20]
+                       [--tcp 127.0.0.1:7100 ...] [--report 60]
+plus the workload options of tools/workload.py (--period, --jitter, ...).
+Per-command OSSMRemote logging is silenced unless --verbose is given.
+"""
+
+import argparse
+import sys
+import time
+
+import desktop_shim
+
+
+def _speed(argv):
+    """--speed, read before the shim is installed (it sets the clock scale)."""
+    if "--tcp" in argv:
+        return 1.0
+    for i, a in enumerate(argv):
+        if a == "--speed" and i + 1 < len(argv):
+            return float(argv[i + 1])
+        if a.startswith("--speed="):
+            return float(a.split("=", 1)[1])
+    return DEFAULT_SPEED
+
+
+DEFAULT_SPEED = 20.0
+desktop_shim.install(time_scale=_speed(sys.argv[1:]))
+
+import asyncio
+import tracemalloc
+import ble_remote
+from time import ticks_ms, ticks_diff
+
+import cal_profiles
+import host_bridge
+import touch_analysis
+import workload
+from config import (STROKE_SIGNAL, BLE_SPEED, BLE_DEPTH, BLE_STROKE, SIGNAL_MAP,
+                    SIGNAL_EMA_ALPHA, SIGNAL_DEADBAND, SIGNAL_MIN_MS)
+from queue import Queue
+from ble_remote import OSSMRemote
+from ossm_fleet import OSSMFleet
+from stroke_detector import SignalBank
+from tcp_transport import TCPTransport
+
+WINDOW_MS = 800             # longest true event -> emit delay counted as a match
+HEARTBEAT_MS = 1000         # fake OSSM state notification period
+PEER_SETTINGS = {"speed": BLE_SPEED, "depth": BLE_DEPTH, "stroke": BLE_STROKE}
+
+
+class FakeLink:
+    """Transport stand-in for an OSSM that streams happily: open() always
+    succeeds, every write takes write_ms, a state notification arrives every
+    HEARTBEAT_MS."""
+
+    def __init__(self, name, write_ms):
+        self._name = name
+        self._write_ms = write_ms
+        self._beat = None
+        self.address = None
+
+    async def open(self, exclude=()):
+        if self._name in exclude:
+            return False
+        self.address = self._name
+        self._beat = ticks_ms()
+        return True
+
+    async def write(self, data, response=False):
+        if self._write_ms:
+            await asyncio.sleep_ms(self._write_ms)
+
+    async def subscribe_state(self):
+        pass
+
+    async def state(self, timeout_ms):
+        wait = ticks_diff(self._beat, ticks_ms())
+        if wait > timeout_ms:
+            await asyncio.sleep_ms(timeout_ms)
+            raise asyncio.TimeoutError
+        if wait > 0:
+            await asyncio.sleep_ms(wait)
+        self._beat += HEARTBEAT_MS
+        return b'{"state":"streaming"}'
+
+    def is_connected(self):
+        return self.address is not None
+
+    async def close(self):
+        self.address = None
+
+
+class Tap:
+    """Wraps a transport and timestamps every stream command written."""
+
+    def __init__(self, link, clock):
+        self._link = link
+        self._clock = clock
+        self.writes = []        # (workload ms, pos, interval_ms)
+
+    def __getattr__(self, name):
+        return getattr(self._link, name)
+
+    async def write(self, data, response=False):
+        await self._link.write(data, response)
+        if data.startswith(b"stream:"):
+            _, pos, interval = data.split(b":")
+            self.writes.append((self._clock(), int(pos), int(interval)))
+
+
+class TapQueue(Queue):
+    """The stroke queue, noting when each stroke event enters it."""
+
+    def __init__(self, maxsize, clock):
+        super().__init__(maxsize)
+        self._clock = clock
+        self.emits = []         # (workload ms, pos, interval_ms)
+        self.depth_max = 0
+
+    def put_nowait(self, item):
+        super().put_nowait(item)
+        self.emits.append((self._clock(), item[0], item[1]))
+        self.depth_max = max(self.depth_max, self.qsize())
+
+
+def percentiles(values, ps):
+    if not values:
+        return [0] * len(ps)
+    s = sorted(values)
+    return [s[min(len(s) - 1, int(p / 100 * len(s)))] for p in ps]
+
+
+def slope(points):
+    """Least-squares slope of (x, y) points; 0 for fewer than two."""
+    n = len(points)
+    if n < 2:
+        return 0.0
+    mx = sum(x for x, _ in points) / n
+    my = sum(y for _, y in points) / n
+    var = sum((x - mx) ** 2 for x, _ in points)
+    return sum((x - mx) * (y - my) for x, y in points) / var if var else 0.0
+
+
+class Score:
+    """Matches emits and OSSM writes to the workload's true events."""
+
+    def __init__(self, load, analyzer):
+        self._load = load
+        self._signal = getattr(analyzer, STROKE_SIGNAL)
+        self._normalize = analyzer.normalize
+        self._open = []         # (t_ms, expected signal) awaiting an emit
+        self._first = True      # skip the detector's initial emit
+        self._pending = []      # matched emits (t_emit, t_true, pos, interval) not yet written
+        self.reset()
+
+    def reset(self):
+        self.matched = self.missed = self.false = 0
+        self.detect_ms = []
+        self.write_ms = []
+        self.pos_err = 0.0
+
+    def _expected(self, pos):
+        return self._signal(self._normalize(self._load.levels(pos))) * 100
+
+    def update(self, now, emits, writes):
+        """Score the emits and writes since the last call.  Consumed entries
+        are removed from all three lists, so the harness does not grow the
+        heap it is measuring."""
+        events = self._load.events
+        k = 0
+        while k < len(events) and events[k][0] <= now:
+            t, pos, _ = events[k]
+            self._open.append((t, self._expected(pos)))
+            k += 1
+        del events[:k]
+        if self._first and emits:
+            self._first = False
+            del emits[0]
+        for t_emit, pos, interval in emits:
+            t_emit = int(t_emit)
+            while self._open and self._open[0][0] < t_emit - WINDOW_MS:
+                self._open.pop(0)
+                self.missed += 1
+            if self._open and self._open[0][0] <= t_emit:
+                t_true, expected = self._open.pop(0)
+                self.matched += 1
+                self.detect_ms.append(int(t_emit - t_true))
+                self.pos_err += abs(pos - expected)
+                self._pending.append((t_emit, t_true, pos, interval))
+            else:
+                self.false += 1
+        emits.clear()
+        while self._open and self._open[0][0] < now - WINDOW_MS:
+            self._open.pop(0)
+            self.missed += 1
+        # Writes follow emits in order; emits the fleet dropped never appear.
+        for t_write, pos, interval in writes:
+            for i, (t_emit, t_true, p, iv) in enumerate(self._pending):
+                if (p, iv) == (pos, interval) and t_emit <= t_write:
+                    self.write_ms.append(int(t_write - t_true))
+                    del self._pending[:i + 1]
+                    break
+        writes.clear()
+
+
+def make_fleet(args, clock):
+    if args.tcp:
+        links = []
+        for peer in args.tcp:
+            host, port = peer.rsplit(":", 1)
+            links.append(TCPTransport(host, int(port)))
+    else:
+        links = [FakeLink(f"fake{i}", args.write_ms) for i in range(args.peers)]
+    taps = [Tap(link, clock) for link in links]
+    claimed = set()
+    remotes = [OSSMRemote(PEER_SETTINGS, transport=tap,
+                          name="OSSM" if len(taps) == 1 else f"OSSM{i}", claimed=claimed)
+               for i, tap in enumerate(taps)]
+    bank = SignalBank(SIGNAL_MAP, SIGNAL_EMA_ALPHA, SIGNAL_DEADBAND, SIGNAL_MIN_MS) \
+        if SIGNAL_MAP else None
+    return OSSMFleet(remotes, bank=bank), taps
+
+
+def make_analyzer(sensor):
+    # Calibration matches the workload model (idle 27000, full scale 9000).
+    cal_profiles.PROFILE_FILE = touch_analysis.CALIBRATION_FILE = '/nonexistent/soak'
+    a = touch_analysis.TouchAnalyzer(sensor)
+    a._offsets[:] = [workload.IDLE] * workload.NUM_PINS
+    a._scales[:] = [workload.GAIN] * workload.NUM_PINS
+    a._save_calibration = lambda: None
+    return a
+
+
+async def output_task(analyzer, sensor, analyze_us):
+    while True:
+        analyzed = await analyzer.analyze()
+        analyze_us.append((time.perf_counter_ns() - sensor.read_ns) // 1000)
+        host_bridge._last_analyzed = analyzed
+
+
+def report(t_s, queue, fleet, sensor, score, analyze_us, heap):
+    now_heap = tracemalloc.get_traced_memory()[0]
+    heap.append((t_s, now_heap))
+    a50, a99 = percentiles(analyze_us, (50, 99))
+    d = percentiles(score.detect_ms, (50, 95, 99))
+    w = percentiles(score.write_ms, (50, 95, 99))
+    n = score.matched + score.false
+    print("[{:6.0f} s] heap {:.1f} kB ({:+.1f} kB/h)  queue max {}  lag max {} ms  "
+          "analyze p50 {} us p99 {} us".format(
+              t_s, now_heap / 1024, slope(heap) * 3600 / 1024, queue.depth_max,
+              sensor.lag_ms_max, a50, a99))
+    print("          detect p50/95/99 {}/{}/{} ms  write {}/{}/{} ms  matched {}  missed {}  "
+          "false {}  precision {:.1f}%  recall {:.1f}%  pos err {:.1f}".format(
+              *d, *w, score.matched, score.missed, score.false,
+              100 * score.matched / n if n else 0,
+              100 * score.matched / (score.matched + score.missed)
+              if score.matched + score.missed else 0,
+              score.pos_err / score.matched if score.matched else 0))
+    fleet.report()
+
+
+async def main(args):
+    tracemalloc.start()
+    load = workload.from_args(args)
+    sensor = workload.WorkloadSensor(load)
+    analyzer = make_analyzer(sensor)
+    clock = sensor.now
+    queue = TapQueue(4, clock)
+    fleet, taps = make_fleet(args, clock)
+    score = Score(load, analyzer)
+    analyze_us = []
+    heap = []
+    print("soak: {} for {:.0f} s at {:g}x, {} peer(s)".format(
+        args.pattern, args.seconds, args.speed, len(taps)))
+    tasks = [asyncio.create_task(output_task(analyzer, sensor, analyze_us)),
+             asyncio.create_task(host_bridge.stroke_task(queue, fleet, False)),
+             asyncio.create_task(fleet.run(queue))]
+    start = ticks_ms()
+    t_report = 0
+    t_end = args.seconds * 1000
+    while True:
+        await asyncio.sleep_ms(min(1000, args.report * 1000))
+        elapsed = ticks_diff(ticks_ms(), start)
+        now = clock()
+        score.update(now, queue.emits, taps[0].writes)
+        if elapsed - t_report >= args.report * 1000 or elapsed >= t_end:
+            t_report = elapsed
+            report(elapsed / 1000, queue, fleet, sensor, score, analyze_us, heap)
+            score.reset()
+            analyze_us.clear()
+            queue.depth_max = 0
+            sensor.lag_ms_max = 0
+        if elapsed >= t_end:
+            break
+    for task in tasks:
+        task.cancel()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    workload.add_arguments(parser)
+    parser.add_argument("--seconds", type=float, default=3600, help="device time to run")
+    parser.add_argument("--speed", type=float, default=DEFAULT_SPEED,
+                        help="device seconds per wall-clock second (1 with --tcp)")
+    parser.add_argument("--report", type=float, default=60, help="device seconds between reports")
+    parser.add_argument("--peers", type=int, default=1, help="fake OSSMs")
+    parser.add_argument("--write-ms", type=float, default=8, help="fake OSSM write latency")
+    parser.add_argument("--tcp", action="append", metavar="HOST:PORT",
+                        help="drive a TCP simulator instead of fake OSSMs (repeat for several)")
+    parser.add_argument("--verbose", action="store_true", help="keep OSSMRemote's log lines")
+    args = parser.parse_args()
+    if args.tcp:
+        args.speed = 1.0
+    if not args.verbose:
+        ble_remote.print = lambda *a, **k: None
+    try:
+        asyncio.run(main(args))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Subscribe to the device's BLE telemetry service and decode the stream.
+
+Connects with bleak to the device advertising as "TDInput", configures the
+control characteristic, and prints one line per received record:
+
+  S,<t_ms>,<raw>,<ema>,<emit>        detector sample (same as STROKE_LOG)
+  E,<t_ms>,<pos>,<interval_ms>       BLE emit event
+  M,<t_ms>,<insertion>,<focus>,<center>,<active>
+  R,<t_ms>,<raw values...>
+  N,<t_ms>,<normalized values...>
+
+so the output can be piped straight into tools/plot_strokes.py.
+
+Usage:
+  python tools/telemetry_client.py [--records metrics,emit,stroke] [--batch 0]
+                                   [--decimation 1] [--save capture.bin] [--plot]
+  python tools/telemetry_client.py --read capture.bin [--plot]
+"""
+
+import sys
+import os
+import argparse
+import asyncio
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import frame_codec
+from frame_codec import REC_RAW, REC_NORM, REC_METRICS, REC_EMIT, REC_STROKE
+from telemetry import ADV_NAME, DATA_UUID, CONTROL_UUID
+
+NUM_PINS = 9
+
+RECORD_NAMES = {
+    "raw": REC_RAW,
+    "norm": REC_NORM,
+    "metrics": REC_METRICS,
+    "emit": REC_EMIT,
+    "stroke": REC_STROKE,
+}
+
+
+def format_record(rtype, t_ms, fields):
+    if rtype == REC_STROKE:
+        raw, ema, emit = fields
+        return f"S,{t_ms},{raw},{ema:.2f},{emit}"
+    if rtype == REC_EMIT:
+        return f"E,{t_ms},{fields[0]},{fields[1]}"
+    if rtype == REC_METRICS:
+        i, f, c, active = fields
+        return f"M,{t_ms},{i:.3f},{f:.3f},{c:.3f},{active}"
+    if rtype == REC_RAW:
+        return f"R,{t_ms}," + ",".join(str(v) for v in fields)
+    return f"N,{t_ms}," + ",".join(f"{v:.3f}" for v in fields)
+
+
+class Collector:
+    """Decodes notifications, prints them, and keeps S-lines for plotting."""
+
+    def __init__(self, save=None):
+        self.lines = []
+        self.notifications = 0
+        self.records = 0
+        self._save = save
+        if save is not None:
+            save.write(frame_codec.capture_header(NUM_PINS))
+
+    def feed(self, data):
+        self.notifications += 1
+        if self._save is not None:
+            self._save.write(data)
+        for rtype, t_ms, fields in frame_codec.unpack(data, NUM_PINS):
+            self.records += 1
+            line = format_record(rtype, t_ms, fields)
+            if rtype == REC_STROKE:
+                self.lines.append(line)
+            print(line, flush=True)
+
+
+async def stream(args, collector):
+    from bleak import BleakClient, BleakScanner
+
+    print(f"Scanning for {ADV_NAME}...", file=sys.stderr)
+    device = await BleakScanner.find_device_by_name(ADV_NAME, timeout=args.scan_timeout)
+    if device is None:
+        sys.exit(f"{ADV_NAME} not found")
+    mask = 0
+    for name in args.records.split(","):
+        mask |= 1 << RECORD_NAMES[name.strip()]
+    async with BleakClient(device) as client:
+        print(f"Connected to {device.address} (MTU {client.mtu_size})", file=sys.stderr)
+        await client.start_notify(DATA_UUID, lambda _, data: collector.feed(bytes(data)))
+        await client.write_gatt_char(
+            CONTROL_UUID, bytes((mask, args.batch, args.decimation)), response=True)
+        try:
+            if args.seconds:
+                await asyncio.sleep(args.seconds)
+            else:
+                while client.is_connected:
+                    await asyncio.sleep(0.5)
+        finally:
+            if client.is_connected:
+                await client.stop_notify(DATA_UUID)
+    print(f"{collector.notifications} notifications, {collector.records} records",
+          file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--records", default="metrics,emit,stroke",
+                        help="comma-separated: " + ",".join(RECORD_NAMES))
+    parser.add_argument("--batch", type=int, default=0,
+                        help="max records per notification (0 = fill the MTU)")
+    parser.add_argument("--decimation", type=int, default=1,
+                        help="send every Nth sensor frame")
+    parser.add_argument("--seconds", type=float, default=0, help="stop after this long (0 = until Ctrl-C)")
+    parser.add_argument("--scan-timeout", type=float, default=10)
+    parser.add_argument("--save", help="write the raw stream to a capture file")
+    parser.add_argument("--read", help="decode a capture file instead of connecting")
+    parser.add_argument("--plot", action="store_true", help="plot S-lines when done")
+    args = parser.parse_args()
+
+    if args.read:
+        with open(args.read, "rb") as f:
+            _, records = frame_codec.read_capture(f.read())
+        lines = []
+        for rec in records:
+            line = format_record(*rec)
+            if rec[0] == REC_STROKE:
+                lines.append(line)
+            print(line)
+    else:
+        save = open(args.save, "wb") if args.save else None
+        collector = Collector(save)
+        try:
+            asyncio.run(stream(args, collector))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if save is not None:
+                save.close()
+        lines = collector.lines
+
+    if args.plot:
+        import plot_strokes
+        plot_strokes.plot(*plot_strokes.parse(lines), title="Stroke detector (telemetry)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+Synthetic stroke workloads: nine-electrode frames for parameterized patterns.
+
+The pattern menu follows the OSSM's own (test/ossm_ble_sim.py PATTERNS), read
+as what a hand on the device would do:
+  simple     full strokes, smooth reversals
+  teasing    fast in, slow out (--ratio sets in:out speed)
+  robo       constant speed with abrupt reversals
+  halfnhalf  alternate full and half strokes
+  deeper     every stroke a step deeper, then start shallow again
+  stopngo    a series of strokes, then a pause
+  insist     short rapid strokes near full depth
+
+A stroke is a list of segments (move or hold) of the covered length, 0-1 of
+the shaft, measured from the tip (electrode 8) down.  Electrode i reads
+27000 + its gain x grip while fully covered, proportionally while partly
+covered, plus Gaussian noise and occasional single-frame spikes.  --jitter varies each stroke's period and depth, and
+--pause-every inserts still phases into any pattern.
+
+Besides frames, a workload lists the true events the stroke detector should
+find (reversals and the starts of holds), for scoring emits; see soak.py.
+
+Usage:
+  python tools/workload.py --pattern deeper --seconds 60 [--save deeper.bin]
+  python tools/workload.py --list
+With --save the frames are written as a frame_codec capture (raw records), for
+bench.py / filter_replay.py --capture.
+"""
+
+import argparse
+import math
+import random
+
+import desktop_shim
+desktop_shim.install()
+
+import asyncio
+from time import ticks_ms, ticks_diff, perf_counter_ns
+
+import frame_codec
+from frame_codec import REC_RAW
+
+NUM_PINS = 9
+IDLE = 27000
+GAIN = 9000                 # counts for a fully covered electrode at grip 1
+
+PATTERNS = ("simple", "teasing", "robo", "halfnhalf", "deeper", "stopngo", "insist")
+
+
+class Workload:
+    """Frame and truth-event generator for one parameterized pattern."""
+
+    def __init__(self, pattern="simple", period_s=1.2, depth=0.9, ratio=2.0, jitter=0.0,
+                 pause_every=0, pause_s=2.0, noise=30, spikes=0.0, grip=0.7,
+                 frame_ms=20, seed=1):
+        """
+        period_s     seconds per full stroke (in + out)
+        depth        deepest covered length, 0-1 of the shaft
+        ratio        teasing: in/out speed ratio
+        jitter       +- fraction applied at random to each stroke's period and depth
+        pause_every  hold still after every N strokes (0 = only where the pattern does)
+        """
+        if pattern not in PATTERNS:
+            raise ValueError("unknown pattern " + pattern)
+        self.pattern = pattern
+        self.period_ms = period_s * 1000
+        self.depth = depth
+        self.ratio = ratio
+        self.jitter = jitter
+        self.pause_every = pause_every
+        self.pause_ms = pause_s * 1000
+        self.noise = noise
+        self.spikes = spikes
+        self.frame_ms = frame_ms
+        self._rng = random.Random(seed)
+        self._gains = [GAIN * grip * (1 + 0.1 * math.sin(3 * i)) for i in range(NUM_PINS)]
+        self._segments = []     # (t_start, t_end, from, to, smooth)
+        self._t_end = 0.0
+        self._pos = 0.0
+        self._stroke = 0
+        self.events = []        # (t_ms, covered length, kind) the detector should report
+
+    # ------------------------------------------------------------------ #
+    # Pattern schedule                                                     #
+    # ------------------------------------------------------------------ #
+
+    def _vary(self, v):
+        return v * (1 + self._rng.uniform(-self.jitter, self.jitter)) if self.jitter else v
+
+    def _move(self, to, ms, smooth=True):
+        to = min(1.0, max(0.0, to))
+        t = self._t_end
+        self._segments.append((t, t + ms, self._pos, to, smooth))
+        self._t_end = t + ms
+        self._pos = to
+        self.events.append((self._t_end, to, "extreme"))
+
+    def _hold(self, ms):
+        t = self._t_end
+        self._segments.append((t, t + ms, self._pos, self._pos, True))
+        self._t_end = t + ms
+        if self.events and self.events[-1][0] == t:
+            self.events[-1] = (t, self.events[-1][1], "stop")
+
+    def _stroke_segments(self):
+        """Append the next stroke of the pattern."""
+        k = self._stroke
+        self._stroke += 1
+        half = self._vary(self.period_ms) / 2
+        top = self._vary(self.depth)
+        p = self.pattern
+        if p == "simple":
+            self._move(top, half)
+            self._move(0.0, half)
+        elif p == "teasing":
+            r = self.ratio
+            self._move(top, 2 * half / (1 + r))
+            self._move(0.0, 2 * half * r / (1 + r))
+        elif p == "robo":
+            self._move(top, half, smooth=False)
+            self._move(0.0, half, smooth=False)
+        elif p == "halfnhalf":
+            self._move(top if k % 2 == 0 else top / 2, half)
+            self._move(0.0, half)
+        elif p == "deeper":
+            steps = 5
+            self._move(top * (k % steps + 1) / steps, half)
+            self._move(0.0, half)
+        elif p == "stopngo":
+            self._move(top, half)
+            self._move(0.0, half)
+            if k % 4 == 3:
+                self._hold(self.pause_ms)
+        elif p == "insist":
+            if k == 0:
+                self._move(top * 0.6, half)
+            self._move(top, half / 3)
+            self._move(top * 0.6, half / 3)
+        if self.pause_every and self._stroke % self.pause_every == 0:
+            self._hold(self.pause_ms)
+
+    def position(self, t_ms):
+        """True covered length (0-1) at t_ms."""
+        while self._t_end <= t_ms:
+            self._stroke_segments()
+        segs = self._segments
+        while segs[0][1] <= t_ms:
+            segs.pop(0)
+        t0, t1, a, b, smooth = segs[0]
+        u = (t_ms - t0) / (t1 - t0)
+        if smooth:
+            u = (1 - math.cos(math.pi * u)) / 2
+        return a + (b - a) * u
+
+    # ------------------------------------------------------------------ #
+    # Frames                                                               #
+    # ------------------------------------------------------------------ #
+
+    def levels(self, pos):
+        """Noise-free electrode values for a covered length of `pos` (0-1), from the tip."""
+        cover = pos * NUM_PINS
+        values = []
+        for i in range(NUM_PINS):
+            c = cover - (NUM_PINS - 1 - i)
+            values.append(IDLE + (self._gains[i] * (c if c < 1 else 1) if c > 0 else 0))
+        return values
+
+    def frame(self, t_ms):
+        """Raw values of all electrodes at t_ms."""
+        rng = self._rng
+        values = []
+        for v in self.levels(self.position(t_ms)):
+            if self.noise:
+                v += rng.gauss(0, self.noise)
+            if self.spikes and rng.random() < self.spikes:
+                v += rng.choice((-1, 1)) * 3000
+            values.append(int(v))
+        return values
+
+    def frames(self, seconds):
+        """(t_ms, values) for `seconds` of workload."""
+        for k in range(int(seconds * 1000 / self.frame_ms)):
+            t = k * self.frame_ms
+            yield t, self.frame(t)
+
+
+class WorkloadSensor:
+    """Sensor stand-in fed by a Workload.
+
+    read_async() waits for the next frame time on the firmware clock
+    (ticks_ms, which desktop_shim may run faster than real time), so the
+    analyzer sees frames at the workload's rate.  `lag_ms_max` tracks how late
+    frames are delivered, a sign the host cannot keep up with the time scale;
+    `read_ns` lets a caller time its own work on a frame apart from the wait.
+    """
+
+    def __init__(self, workload):
+        self.num_pins = NUM_PINS
+        self._w = workload
+        self._t0 = None
+        self._k = 0
+        self.lag_ms_max = 0
+        self.read_ns = 0        # wall clock when the last frame was handed over
+
+    def now(self):
+        """Workload time (ms) on the firmware clock; 0 at the first read."""
+        if self._t0 is None:
+            self._t0 = ticks_ms()
+        return ticks_diff(ticks_ms(), self._t0)
+
+    def read(self):
+        t = self._k * self._w.frame_ms
+        self._k += 1
+        return self._w.frame(t)
+
+    async def read_async(self, channels=None):
+        due = self._k * self._w.frame_ms
+        wait = due - self.now()
+        if wait > 0:
+            await asyncio.sleep_ms(wait)
+        else:
+            self.lag_ms_max = max(self.lag_ms_max, -wait)
+        values = self.read()
+        self.read_ns = perf_counter_ns()
+        return values
+
+    @property
+    def t_ms(self):
+        """Workload time of the frame read last."""
+        return (self._k - 1) * self._w.frame_ms
+
+    def ages(self):
+        return [0] * NUM_PINS
+
+
+def add_arguments(parser):
+    parser.add_argument("--pattern", choices=PATTERNS, default="simple")
+    parser.add_argument("--period", type=float, default=1.2, help="seconds per full stroke")
+    parser.add_argument("--depth", type=float, default=0.9, help="deepest covered length, 0-1")
+    parser.add_argument("--ratio", type=float, default=2.0, help="teasing: in/out speed ratio")
+    parser.add_argument("--jitter", type=float, default=0.1,
+                        help="+- fraction of random variation in period and depth")
+    parser.add_argument("--pause-every", type=int, default=0, help="hold after every N strokes")
+    parser.add_argument("--pause", type=float, default=2.0, help="seconds per hold")
+    parser.add_argument("--noise", type=float, default=30, help="Gaussian noise, raw counts")
+    parser.add_argument("--spikes", type=float, default=0.005,
+                        help="per-channel per-frame spike probability")
+    parser.add_argument("--grip", type=float, default=0.7,
+                        help="covered-electrode reading as a fraction of its calibrated range")
+    parser.add_argument("--seed", type=int, default=1)
+
+
+def from_args(args):
+    return Workload(args.pattern, args.period, args.depth, args.ratio, args.jitter,
+                    args.pause_every, args.pause, args.noise, args.spikes, args.grip,
+                    seed=args.seed)
+
+
+def main(args):
+    if args.list:
+        print("\n".join(PATTERNS))
+        return
+    w = from_args(args)
+    size = frame_codec.record_size(REC_RAW, NUM_PINS)
+    out = bytearray(frame_codec.capture_header(NUM_PINS))
+    buf = bytearray(size)
+    count = 0
+    for t, values in w.frames(args.seconds):
+        frame_codec.pack_raw(buf, 0, t, values)
+        out += buf
+        count += 1
+    events = [e for e in w.events if e[0] <= args.seconds * 1000]
+    print("{}: {} frames, {} true events ({} stops)".format(
+        args.pattern, count, len(events), sum(1 for e in events if e[2] == "stop")))
+    if args.save:
+        with open(args.save, "wb") as f:
+            f.write(out)
+        print("saved", args.save)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    add_arguments(parser)
+    parser.add_argument("--seconds", type=float, default=60)
+    parser.add_argument("--save", help="write the frames as a frame_codec capture")
+    parser.add_argument("--list", action="store_true", help="list the patterns")
+    main(parser.parse_args())